@@ -0,0 +1,124 @@
+-- Cheap per day summaries (row count and hash) of the data the accounting reads.
+-- Results computed from a day whose fingerprint has since changed (e.g. due to late
+-- ingested events or prices) are outdated.
+with
+days as (
+    select generate_series(
+        '{{StartTime}}'::timestamptz,
+        '{{EndTime}}'::timestamptz - interval '1 day',
+        interval '1 day'
+    ) as day
+),
+batches as (
+    select date_trunc('day', block_time) as day,
+           count(*)                      as num,
+           md5(string_agg(
+               concat(encode(tx_hash, 'hex'), ':', gas_used, ':', gas_price_gwei),
+               ',' order by tx_hash
+           ))                            as hash
+    from gnosis_protocol_v2."view_batches"
+    where block_time >= '{{StartTime}}'
+      and block_time < '{{EndTime}}'
+    group by 1
+),
+trades as (
+    select date_trunc('day', block_time) as day,
+           count(*)                      as num,
+           md5(string_agg(
+               concat(encode(tx_hash, 'hex'), ':', atoms_sold, ':', atoms_bought),
+               ',' order by tx_hash, atoms_sold, atoms_bought
+           ))                            as hash
+    from gnosis_protocol_v2."trades"
+    where block_time >= '{{StartTime}}'
+      and block_time < '{{EndTime}}'
+    group by 1
+),
+transfers as (
+    select date_trunc('day', evt_block_time) as day,
+           count(*)                          as num,
+           md5(string_agg(
+               concat(encode(evt_tx_hash, 'hex'), ':', evt_index, ':', value),
+               ',' order by evt_tx_hash, evt_index
+           ))                                as hash
+    from erc20."ERC20_evt_Transfer"
+    where evt_block_time >= '{{StartTime}}'
+      and evt_block_time < '{{EndTime}}'
+      and '{{SettlementContract}}' in ("to", "from")
+    group by 1
+),
+traded_tokens as (
+    select distinct sell_token_address as token
+    from gnosis_protocol_v2."trades"
+    where block_time >= '{{StartTime}}'
+      and block_time < '{{EndTime}}'
+    union
+    select distinct buy_token_address as token
+    from gnosis_protocol_v2."trades"
+    where block_time >= '{{StartTime}}'
+      and block_time < '{{EndTime}}'
+    union
+    select '{{WrappedNativeToken}}' as token
+),
+prices as (
+    select date_trunc('day', minute) as day,
+           count(*)                  as num,
+           md5(sum(price)::text)     as hash
+    from prices.usd
+    where minute >= '{{StartTime}}'
+      and minute < '{{EndTime}}'
+      and contract_address in (select token from traded_tokens)
+    group by 1
+),
+-- The slippage values imbalances at the dex prices of the hour the period ends,
+-- which count towards its last day, as do settlements at that very time.
+dex_prices as (
+    select date_trunc(
+               'day', least(hour, '{{EndTime}}'::timestamptz - interval '1 day')
+           )        as day,
+           count(*) as num,
+           md5(string_agg(
+               concat(encode(contract_address, 'hex'), ':', hour, ':', median_price),
+               ',' order by contract_address, hour
+           ))       as hash
+    from prices.prices_from_dex_data
+    where hour >= '{{StartTime}}'
+      and hour <= '{{EndTime}}'
+      and contract_address in (select token from traded_tokens)
+    group by 1
+),
+clearing_prices as (
+    select date_trunc(
+               'day', least(call_block_time, '{{EndTime}}'::timestamptz - interval '1 day')
+           )        as day,
+           count(*) as num,
+           md5(string_agg(
+               concat(encode(call_tx_hash, 'hex'), ':', "clearingPrices"::text),
+               ',' order by call_tx_hash
+           ))       as hash
+    from gnosis_protocol_v2."GPv2Settlement_call_settle"
+    where call_success = true
+      and call_block_time between '{{StartTime}}' and '{{EndTime}}'
+    group by 1
+)
+
+select to_char(d.day, 'YYYY-MM-DD')  as day,
+       coalesce(b.num, 0)            as batches,
+       coalesce(b.hash, '')          as batches_hash,
+       coalesce(t.num, 0)            as trades,
+       coalesce(t.hash, '')          as trades_hash,
+       coalesce(e.num, 0)            as transfers,
+       coalesce(e.hash, '')          as transfers_hash,
+       coalesce(p.num, 0)            as prices,
+       coalesce(p.hash, '')          as prices_hash,
+       coalesce(x.num, 0)            as dex_prices,
+       coalesce(x.hash, '')          as dex_prices_hash,
+       coalesce(c.num, 0)            as clearing_prices,
+       coalesce(c.hash, '')          as clearing_prices_hash
+from days d
+         left outer join batches b on d.day = b.day
+         left outer join trades t on d.day = t.day
+         left outer join transfers e on d.day = e.day
+         left outer join prices p on d.day = p.day
+         left outer join dex_prices x on d.day = x.day
+         left outer join clearing_prices c on d.day = c.day
+order by d.day
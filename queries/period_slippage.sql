@@ -13,7 +13,7 @@ filtered_trades as (
            buy_token_address                                     as "buyToken",
            atoms_sold                                            as "sellAmount",
            atoms_bought                                          as "buyAmount",
-           '\x9008D19f58AAbD9eD0D60971565AA8510560ab41' :: bytea as contract_address
+           '{{SettlementContract}}' :: bytea                     as contract_address
     from gnosis_protocol_v2."trades" t
              join gnosis_protocol_v2."view_batches" b on t.tx_hash = b.tx_hash
     where b.block_time between '{{StartTime}}'
@@ -36,6 +36,19 @@ user_in as (
            "sellAmount"     as amount_wei,
            'IN_USER'        as transfer_type
     from filtered_trades
+    -- Only the settlements of a single solver (e.g. to recompute a disputed payout),
+    -- or a deterministic sample of the settlements (by hash of tx_hash) for previews.
+    -- All trades of the period remain in filtered_trades, as other_transfers excludes
+    -- the transfers of any trader of the period.
+    where case
+              when '{{SolverAddress}}' = '0x' then true
+              else replace('{{SolverAddress}}', '0x', '\x') :: bytea = solver_address
+        end
+      and case
+              when {{SampleRate}} >= 1 then true
+              else ('x' || substr(md5(encode(tx_hash, 'hex')), 1, 8)) :: bit(32) :: bigint
+                       < {{SampleRate}} * 4294967296
+        end
 ),
 user_out as (
     select block_time,
@@ -50,6 +63,15 @@ user_out as (
            "buyAmount"      as amount_wei,
            'OUT_USER'       as transfer_type
     from filtered_trades
+    where case
+              when '{{SolverAddress}}' = '0x' then true
+              else replace('{{SolverAddress}}', '0x', '\x') :: bytea = solver_address
+        end
+      and case
+              when {{SampleRate}} >= 1 then true
+              else ('x' || substr(md5(encode(tx_hash, 'hex')), 1, 8)) :: bit(32) :: bigint
+                       < {{SampleRate}} * 4294967296
+        end
 ),
 other_transfers as (
     select block_time,
@@ -63,9 +85,9 @@ other_transfers as (
            t.contract_address as token,
            value              as amount_wei,
            case
-               when "to" = '\x9008D19f58AAbD9eD0D60971565AA8510560ab41' -- beta contract
+               when "to" = '{{SettlementContract}}' -- settlement contract
                    then 'IN_AMM'
-               when "from" = '\x9008D19f58AAbD9eD0D60971565AA8510560ab41' -- beta contract
+               when "from" = '{{SettlementContract}}' -- settlement contract
                    then 'OUT_AMM'
                end            as transfer_type
     from erc20."ERC20_evt_Transfer" t
@@ -73,7 +95,7 @@ other_transfers as (
                         on evt_tx_hash = tx_hash
     where b.block_time between '{{StartTime}}'
         and '{{EndTime}}'
-      and '\x9008D19f58AAbD9eD0D60971565AA8510560ab41' in ("to", "from")
+      and '{{SettlementContract}}' in ("to", "from")
       and "from" not in (
         select trader_in
         from filtered_trades
@@ -86,6 +108,15 @@ other_transfers as (
               when '{{TxHash}}' = '0x' then true
               else replace('{{TxHash}}', '0x', '\x') :: bytea = b.tx_hash
         end
+      and case
+              when {{SampleRate}} >= 1 then true
+              else ('x' || substr(md5(encode(b.tx_hash, 'hex')), 1, 8)) :: bit(32) :: bigint
+                       < {{SampleRate}} * 4294967296
+        end
+      and case
+              when '{{SolverAddress}}' = '0x' then true
+              else replace('{{SolverAddress}}', '0x', '\x') :: bytea = b.solver_address
+        end
 ),
 batch_transfers as (
     select *
@@ -113,26 +144,35 @@ incoming_and_outgoing as (
            dex_swaps,
            CONCAT('0x', ENCODE(solver_address, 'hex')) as solver_address,
            solver_name,
-           case
-               when t.symbol = 'ETH' then 'WETH'
-               when t.symbol is not null then t.symbol
-               else text(token)
-               end                                     as symbol,
-           case
-               when token = '\xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee'
-                   then '\xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2'
-               else token
-               end                                     as token,
+           -- The symbol of the normalized token, so that native and wrapped native
+           -- transfers of a settlement are grouped together
+           coalesce(t.symbol, text(i.token))           as symbol,
+           i.token,
            case
                when receiver =
-                    '\x9008D19f58AAbD9eD0D60971565AA8510560ab41' -- beta contract
+                    '{{SettlementContract}}' -- settlement contract
                    then amount_wei
-               when sender = '\x9008D19f58AAbD9eD0D60971565AA8510560ab41' -- beta contract
+               when sender = '{{SettlementContract}}' -- settlement contract
                    then -1 * amount_wei
                end                                     as amount,
            transfer_type
-    from batch_transfers i
-             left outer join erc20.tokens t on i.token = t.contract_address
+    from (select block_time,
+                 tx_hash,
+                 dex_swaps,
+                 num_trades,
+                 solver_address,
+                 solver_name,
+                 case
+                     when token = '\xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee'
+                         then '{{WrappedNativeToken}}'
+                     else token
+                     end as token,
+                 receiver,
+                 sender,
+                 amount_wei,
+                 transfer_type
+          from batch_transfers) i
+             left outer join token_registry t on i.token = t.contract_address
         where 
          -- We exclude settlements that have zero AMM interactions and settle several trades,
          -- as our query is not good enough to handle these cases accurately.
@@ -156,7 +196,7 @@ clearing_prices as (
     select tx_hash,
            case
                when token = '\xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee'
-                   then '\xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2'
+                   then '{{WrappedNativeToken}}'
                else token
                end as token,
            avg(price) as clearing_price
@@ -200,15 +240,9 @@ valued_potential_buffered_trades as (
                                  and date_trunc('minute', block_time) = pusd.minute
 ),
 internal_buffer_trader_solvers as (
-    Select 
-    CONCAT('0x', ENCODE(address, 'hex')) 
-    from gnosis_protocol_v2."view_solvers" 
-    where 
-        name = 'DexCowAgg' or
-        name = 'CowDexAg' or 
-        name = 'MIP' or
-        name = 'Quasimodo' or
-        name = 'QuasiModo'
+    select CONCAT('0x', ENCODE(address, 'hex'))
+    from solver_registry
+    where role = 'buffer_trader'
 ),
 buffer_trades as (
     Select date(a.block_time) as block_time,
@@ -343,9 +377,4 @@ results as (
            sum(usd_value) as usd_value
     from results_per_tx
     group by solver_address, solver_name
-),
-eth_price as (
-    select price
-    from prices."layer1_usd_eth"
-    where minute = '{{EndTime}}'
 )
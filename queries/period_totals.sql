@@ -26,8 +26,8 @@ realized_fees as (
     from gnosis_protocol_v2."trades"
     where trader in (
         select address
-        from gnosis_protocol_v2."view_solvers"
-        where name = 'Withdraw'
+        from solver_registry
+        where role = 'withdraw'
     )
     and block_time >= '{{StartTime}}'
     and block_time < '{{EndTime}}'
@@ -19,7 +19,7 @@ from (
          from relevant_batch_info
          union
          select 'erc20'                                      as token_type,
-                '0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB' as token_address,
+                '{{COWToken}}'                               as token_address,
                 solver                                       as receiver,
                 cow_reward                                   as amount
          from relevant_batch_info
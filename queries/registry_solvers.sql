@@ -0,0 +1,7 @@
+-- All solvers (including the Withdraw solver) with their display names.
+-- The list is small, so it is always synced in full.
+select CONCAT('0x', ENCODE(address, 'hex')) as address,
+       name,
+       environment,
+       active
+from gnosis_protocol_v2."view_solvers"
@@ -0,0 +1,20 @@
+-- Metadata of all tokens the settlement contract received or sent in [Since, Until),
+-- with the first and last day it did.
+with touched_tokens as (
+    select contract_address          as token,
+           min(evt_block_time)::date as first_seen,
+           max(evt_block_time)::date as last_seen
+    from erc20."ERC20_evt_Transfer"
+    where evt_block_time >= '{{Since}}'
+      and evt_block_time < '{{Until}}'
+      and '{{SettlementContract}}' in ("to", "from")
+    group by contract_address
+)
+select CONCAT('0x', ENCODE(contract_address, 'hex')) as token,
+       symbol,
+       decimals,
+       to_char(first_seen, 'YYYY-MM-DD')             as first_seen,
+       to_char(last_seen, 'YYYY-MM-DD')              as last_seen
+from erc20.tokens t
+         inner join touched_tokens on token = contract_address
+where symbol is not null
@@ -0,0 +1,14 @@
+select CONCAT('0x', ENCODE(t.tx_hash, 'hex')) as tx_hash,
+       dex_swaps,
+       solver_address,
+       solver_name,
+       symbol,
+       CONCAT('0x', ENCODE(token, 'hex'))   as token,
+       amount,
+       clearing_value,
+       usd_value,
+       p.price                              as end_price,
+       p.decimals                           as end_decimals,
+       (select price from native_token_price) as eth_price
+from valued_potential_buffered_trades t
+         left outer join end_prices p on t.token = p.contract_address
@@ -0,0 +1,178 @@
+"""
+Single entry point for all accounting scripts, e.g.
+
+    python -m src transfers --start '2022-03-01'
+
+Argument parsing only depends on the standard library and the (light) project models:
+web3, requests and the Dune client are first imported by the code path requiring them,
+so that `--help`, invalid arguments and cached runs do not pay for their import.
+"""
+import argparse
+from typing import Callable, Optional
+
+from src.multisend import DEFAULT_GAS_BUDGET
+from src.utils.script_args import accounting_init, add_accounting_arguments
+
+# pylint: disable=import-outside-toplevel
+
+
+def totals(args: argparse.Namespace) -> None:
+    """Fetch Accounting Period Totals"""
+    from src.fetch.accounting import totals_report
+
+    totals_report(*accounting_init(args))
+
+
+def slippage(args: argparse.Namespace) -> None:
+    """Fetch per solver Slippage for Accounting Period"""
+    from src.fetch.accounting import (
+        shadow_slippage_report,
+        slippage_preview_report,
+        slippage_report,
+    )
+
+    if args.shadow:
+        shadow_slippage_report(*accounting_init(args))
+    elif args.preview is not None:
+        slippage_preview_report(*accounting_init(args), sample_rate=args.preview)
+    else:
+        slippage_report(*accounting_init(args), solver=args.solver)
+
+
+def transfers(args: argparse.Namespace) -> None:
+    """Generate the CSV Airdrop transfer file for Solver Rewards"""
+    from src.fetch.accounting import shadow_transfers_report, transfers_report
+
+    if args.shadow:
+        from src.shadow import DEFAULT_TOLERANCE_WEI
+
+        shadow_transfers_report(
+            *accounting_init(args),
+            tolerance_wei=DEFAULT_TOLERANCE_WEI
+            if args.tolerance_wei is None
+            else args.tolerance_wei,
+        )
+    else:
+        transfers_report(
+            *accounting_init(args), gas_budget=args.gas_budget, solver=args.solver
+        )
+
+
+def reimbursements(args: argparse.Namespace) -> None:
+    """Fetch ETH reimbursements and COW rewards (from Dune or a node)"""
+    from src.fetch.accounting import reimbursements_report
+
+    reimbursements_report(*accounting_init(args), rpc=args.rpc)
+
+
+def investigation(args: argparse.Namespace) -> None:
+    """Show the transactions with the largest (positive and negative) slippage"""
+    from src.fetch.accounting import investigation_report
+
+    investigation_report(*accounting_init(args), top=args.top)
+
+
+def whatif(args: argparse.Namespace) -> None:
+    """Recompute slippage under alternative internal buffer trade rules"""
+    from src.fetch.accounting import what_if_report
+    from src.offline.buffer_trades import BufferTradeRules
+
+    rules = BufferTradeRules(
+        matchability_threshold=args.threshold,
+        min_usd_value=args.min_usd,
+        buffer_trader_solvers=frozenset(args.buffer_traders)
+        if args.buffer_traders is not None
+        else BufferTradeRules.buffer_trader_solvers,
+        added_tokens=frozenset(t.lower() for t in args.allow_token),
+        removed_tokens=frozenset(t.lower() for t in args.disallow_token),
+    )
+    dune, period, networks = accounting_init(args)
+    what_if_report(dune, period, networks, rules)
+
+
+COMMANDS: dict[str, Callable[[argparse.Namespace], None]] = {
+    "totals": totals,
+    "slippage": slippage,
+    "transfers": transfers,
+    "reimbursements": reimbursements,
+    "investigation": investigation,
+    "whatif": whatif,
+}
+
+
+def add_what_if_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments of the alternative buffer trade rules of the whatif command"""
+    parser.add_argument("--threshold", type=float, default=0.025)
+    parser.add_argument("--min-usd", type=float, default=10.0)
+    parser.add_argument(
+        "--buffer-traders", type=str, nargs="*", help="Solver names (default: current)"
+    )
+    parser.add_argument("--allow-token", type=str, action="append", default=[])
+    parser.add_argument("--disallow-token", type=str, action="append", default=[])
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Constructs the argument parser with one sub-command per script"""
+    parser = argparse.ArgumentParser(
+        prog="python -m src", description="CoW Protocol solver accounting"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, command in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=command.__doc__)
+        add_accounting_arguments(subparser)
+        if command == investigation:
+            subparser.add_argument(
+                "--top", type=int, default=5, help="Number of transactions to show"
+            )
+        if command == whatif:
+            add_what_if_arguments(subparser)
+        if command == reimbursements:
+            subparser.add_argument(
+                "--rpc",
+                action="store_true",
+                help="Compute from settlement receipts of NODE_URL_<NETWORK>",
+            )
+        if command in (slippage, transfers):
+            # Each mode computes the results in its own way, none of them combines
+            modes = subparser.add_mutually_exclusive_group()
+            modes.add_argument(
+                "--shadow",
+                action="store_true",
+                help="Compare reference and candidate (local recomputation) results",
+            )
+            modes.add_argument(
+                "--solver",
+                type=str,
+                help="Only recompute the slippage of this solver (address or tx hash)",
+            )
+        if command == slippage:
+            modes.add_argument(
+                "--preview",
+                type=float,
+                metavar="SAMPLE_RATE",
+                help="Extrapolate from this fraction of the settlements (e.g. 0.1)",
+            )
+        if command == transfers:
+            subparser.add_argument(
+                "--tolerance-wei",
+                type=int,
+                help="Largest divergence per transfer to still write the file "
+                "(shadow, default: 10**9 for float rounding of the candidate)",
+            )
+            subparser.add_argument(
+                "--gas-budget",
+                type=int,
+                default=DEFAULT_GAS_BUDGET,
+                help="Maximal estimated gas per multisend chunk of the transfer file",
+            )
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Parses command line arguments and runs the selected command"""
+    args = build_parser().parse_args(argv)
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
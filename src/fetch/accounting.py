@@ -0,0 +1,552 @@
+"""
+The accounting workflow as a dependency graph of stages.
+
+One graph drives all the scripts in this package, each running only the stages
+required for its target, e.g. `transfer_file` runs:
+
+      token_list -+
+                  +-> slippage_query -> slippage -> indexed_slippage -+
+        registry -+                                                   +-> transfers -> transfer_file
+                                                      reimbursements -+
+
+where `token_list`, `registry` and `reimbursements` are fetched concurrently. Stage results are
+checkpointed per network and accounting period, so a rerun after a failure skips
+completed stages. The pipelines of several networks can be run concurrently with
+`run_networks`.
+"""
+from __future__ import annotations
+
+import os
+from datetime import date
+from pprint import pprint
+from typing import Any, Optional, TYPE_CHECKING
+
+from duneapi.types import Network
+
+from src.fetch.execution_costs import RpcClient, get_rpc_reimbursements
+from src.fetch.fingerprints import get_day_fingerprints, invalidate_outdated
+from src.fetch.imbalances import ImbalanceTable, get_imbalance_table
+from src.fetch.period_slippage import (
+    QueryType,
+    SplitSlippages,
+    get_period_slippage,
+    get_slippage_per_tx,
+    slippage_query,
+)
+from src.fetch.period_totals import get_period_totals
+from src.fetch.slippage_preview import breach_risks, get_slippage_preview
+from src.fetch.transfer_file import (
+    TokenType,
+    Transfer,
+    adjust_transfers,
+    get_reimbursements,
+    safe_url,
+)
+from src.file_io import File, write_to_csv
+from src.models import AccountingPeriod, Address, NETWORKS
+from src.multisend import DEFAULT_GAS_BUDGET, plan_multisend, write_multisend_files
+from src.offline.buffer_trades import (
+    BufferTradeRules,
+    recompute,
+    split_slippages,
+    what_if,
+)
+from src.pipeline import Pipeline, Stage, run_concurrently
+from src.registry import sync_registry
+from src.scheduler import DuneScheduler
+from src.shadow import (
+    DEFAULT_TOLERANCE_WEI,
+    ShadowMismatch,
+    compare_slippage,
+    compare_transfers,
+    run_shadow,
+)
+from src.token_list import fetch_trusted_tokens
+from src.utils.dataset import index_by
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+
+# Stages reading Dune data that may still change after the period has ended
+SETTLING_STAGES = (
+    "totals",
+    "reimbursements",
+    "slippage",
+    "slippage_per_tx",
+    "imbalances",
+    "shadow_slippage",
+)
+
+
+def write_transfer_file(
+    transfers: list[Transfer], period: AccountingPeriod, out_path: str
+) -> list[Transfer]:
+    """Writes (and returns) the CSV Airdrop transfer file for `period`"""
+    write_to_csv(
+        data_list=transfers,
+        outfile=File(name=f"transfers-{period}.csv", path=out_path),
+    )
+    return transfers
+
+
+def local_slippage(table: ImbalanceTable) -> SplitSlippages:
+    """Per solver slippage recomputed locally from the imbalances of the period"""
+    return split_slippages(table, recompute(table))
+
+
+def accounting_pipeline(
+    dune: DuneAPI, period: AccountingPeriod, network: Network = Network.MAINNET
+) -> Pipeline:
+    """Constructs the accounting Pipeline for `period` on `network`"""
+    config = NETWORKS[network]
+    # Executions overwrite the network's Dune query (cf. NetworkConfig.query_id),
+    # so only one of them may be in flight per query at any time. A DuneScheduler
+    # ensures this itself, which also lets identical executions of other pipelines
+    # be coalesced rather than serialized.
+    dune_query = (
+        None if isinstance(dune, DuneScheduler) else f"dune-query-{config.query_id()}"
+    )
+    return Pipeline(
+        stages=[
+            Stage(
+                name="registry",
+                func=lambda: sync_registry(dune, network, until=period.end).for_period(
+                    period
+                ),
+                # The registry files of the network are shared by all its pipelines
+                resource=dune_query or f"registry-{config}",
+            ),
+            # Always rerun, as it decides which of the checkpoints are outdated
+            Stage(
+                name="fingerprints",
+                func=lambda: get_day_fingerprints(dune, period, network),
+                resource=dune_query,
+                checkpoint=False,
+            ),
+            Stage(
+                name="totals",
+                func=lambda registry: get_period_totals(
+                    dune, period, network, registry
+                ),
+                deps=("registry",),
+                resource=dune_query,
+            ),
+            Stage(
+                name="reimbursements",
+                func=lambda: get_reimbursements(dune, period, network),
+                resource=dune_query,
+            ),
+            Stage(
+                name="rpc_reimbursements",
+                func=lambda: get_rpc_reimbursements(
+                    RpcClient(config.node_url()), period, network
+                ),
+                # The receipt cache of the network is shared by all its pipelines
+                resource=f"receipts-{config}",
+            ),
+            Stage(name="token_list", func=fetch_trusted_tokens),
+            Stage(
+                name="slippage_query",
+                func=lambda token_list, registry: slippage_query(
+                    token_list=token_list, registry=registry, network=network
+                ),
+                deps=("token_list", "registry"),
+            ),
+            Stage(
+                name="slippage",
+                func=lambda slippage_query: get_period_slippage(
+                    dune, period, raw_sql=slippage_query, network=network
+                ),
+                deps=("slippage_query",),
+                resource=dune_query,
+            ),
+            Stage(
+                name="slippage_per_tx",
+                func=lambda token_list, registry: get_slippage_per_tx(
+                    dune,
+                    period,
+                    raw_sql=slippage_query(
+                        QueryType.PER_TX, token_list, registry, network
+                    ),
+                    network=network,
+                ),
+                deps=("token_list", "registry"),
+                resource=dune_query,
+            ),
+            # Solver of every transaction with slippage, e.g. of a disputed payout
+            Stage(
+                name="tx_solvers",
+                func=lambda slippage_per_tx: {
+                    tx.tx_hash: tx.solver_address for tx in slippage_per_tx
+                },
+                deps=("slippage_per_tx",),
+            ),
+            Stage(
+                name="imbalances",
+                func=lambda token_list, registry: get_imbalance_table(
+                    dune, period, network, token_list, registry
+                ),
+                deps=("token_list", "registry"),
+                resource=dune_query,
+            ),
+            Stage(
+                name="indexed_slippage",
+                func=lambda slippage: index_by(slippage.negative, "solver_address"),
+                deps=("slippage",),
+            ),
+            Stage(
+                name="transfers",
+                func=adjust_transfers,
+                deps=("reimbursements", "indexed_slippage"),
+            ),
+            # Shadow mode: the reference path above against the candidate path of
+            # recomputing the slippage locally from the (once fetched) imbalances.
+            Stage(
+                name="shadow_slippage",
+                func=lambda slippage_query, token_list, registry: run_shadow(
+                    reference=lambda: get_period_slippage(
+                        dune, period, raw_sql=slippage_query, network=network
+                    ),
+                    candidate=lambda: local_slippage(
+                        get_imbalance_table(dune, period, network, token_list, registry)
+                    ),
+                    compare=compare_slippage,
+                ),
+                deps=("slippage_query", "token_list", "registry"),
+                resource=dune_query,
+            ),
+            Stage(
+                name="shadow_transfers",
+                func=lambda reimbursements, shadow_slippage: run_shadow(
+                    reference=lambda: adjust_transfers(
+                        reimbursements,
+                        index_by(shadow_slippage.reference.negative, "solver_address"),
+                    ),
+                    candidate=lambda: adjust_transfers(
+                        reimbursements,
+                        index_by(shadow_slippage.candidate.negative, "solver_address"),
+                    ),
+                    compare=compare_transfers,
+                ),
+                deps=("reimbursements", "shadow_slippage"),
+            ),
+            Stage(
+                name="transfer_file",
+                func=lambda transfers: write_transfer_file(
+                    transfers, period, config.out_path()
+                ),
+                deps=("transfers",),
+                checkpoint=False,
+            ),
+        ],
+        checkpoint_dir=os.path.join(config.out_path(), "checkpoints", str(period)),
+    )
+
+
+def network_fingerprints(
+    dune: DuneAPI, period: AccountingPeriod, networks: list[Network]
+) -> dict[Network, dict[date, str]]:
+    """Current day fingerprints of the period on all `networks` (cf. `run_networks`)"""
+    pipelines = [accounting_pipeline(dune, period, network) for network in networks]
+    results = run_concurrently([(pipeline, ["fingerprints"]) for pipeline in pipelines])
+    return {
+        network: result["fingerprints"] for network, result in zip(networks, results)
+    }
+
+
+def run_networks(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    networks: list[Network],
+    target: str,
+    fingerprints: Optional[dict[Network, dict[date, str]]] = None,
+) -> dict[Network, Any]:
+    """
+    Runs the accounting pipelines of all `networks` concurrently up to `target`.
+    Checkpoints of stages reading still settling data are recomputed if the data of
+    any day of the period has changed since they were computed. The day
+    `fingerprints` are fetched unless given (e.g. by a caller running several targets).
+    """
+    pipelines = [accounting_pipeline(dune, period, network) for network in networks]
+    if pipelines and pipelines[0].ancestors([target]).intersection(SETTLING_STAGES):
+        if fingerprints is None:
+            fingerprints = network_fingerprints(dune, period, networks)
+        for pipeline, network in zip(pipelines, networks):
+            changed = invalidate_outdated(
+                pipeline, SETTLING_STAGES, fingerprints[network]
+            )
+            if changed:
+                print(f"{network}: recomputing results, data changed on {changed}")
+    results = run_concurrently([(pipeline, [target]) for pipeline in pipelines])
+    return {network: result[target] for network, result in zip(networks, results)}
+
+
+def recompute_solver(
+    dune: DuneAPI, period: AccountingPeriod, network: Network, solver: Address
+) -> SplitSlippages:
+    """
+    Recomputes only the slippage of `solver` and merges it into the stored slippage
+    of the period (computed in full if there is none yet), so that the results
+    depending on it (e.g. transfers) are recomputed from the patched slippage.
+    The solver's slippage is computed with the current token list and registry,
+    i.e. including fixes made since the stored slippage was computed. Their
+    checkpoints are left in place, as replacing them would invalidate every result
+    depending on them rather than only the ones depending on the slippage.
+    """
+    pipeline = accounting_pipeline(dune, period, network)
+    stored: SplitSlippages = pipeline.run(["slippage"])["slippage"]
+    current_query = slippage_query(
+        token_list=fetch_trusted_tokens(),
+        registry=sync_registry(dune, network, until=period.end).for_period(period),
+        network=network,
+    )
+    patched = get_period_slippage(
+        dune, period, raw_sql=current_query, network=network, solver=solver
+    )
+    merged = stored.merge_solver(solver, patched)
+    pipeline.replace("slippage", merged)
+    return merged
+
+
+def recompute_solvers(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    networks: list[Network],
+    solver: str,
+    fingerprints: Optional[dict[Network, dict[date, str]]] = None,
+) -> dict[Network, tuple[Address, SplitSlippages]]:
+    """
+    Recomputes the slippage of `solver` (an address, or the hash of one of its
+    transactions) on each network it settled on, cf. `recompute_solver`.
+    """
+    if fingerprints is None:
+        fingerprints = network_fingerprints(dune, period, networks)
+    # Stored results of outdated data are recomputed in full first
+    run_networks(dune, period, networks, "slippage", fingerprints)
+    by_tx = (
+        run_networks(dune, period, networks, "tx_solvers", fingerprints)
+        if len(solver) == 66
+        else {}
+    )
+    results = {}
+    for network in networks:
+        if len(solver) == 66:
+            tx_solvers = by_tx[network]
+            if solver.lower() not in tx_solvers:
+                print(f"{network}: no slippage in transaction {solver}")
+                continue
+            address = tx_solvers[solver.lower()]
+        else:
+            address = Address(solver)
+        results[network] = address, recompute_solver(dune, period, network, address)
+    return results
+
+
+def totals_report(
+    dune: DuneAPI, period: AccountingPeriod, networks: list[Network]
+) -> None:
+    """Prints the accounting period totals of each network"""
+    for network, totals in run_networks(dune, period, networks, "totals").items():
+        print(network)
+        pprint(totals)
+
+
+def slippage_report(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    networks: list[Network],
+    solver: Optional[str] = None,
+) -> None:
+    """
+    Prints the per solver slippage of each network, or only the (recomputed, cf.
+    `recompute_solvers`) slippage of `solver`.
+    """
+    if solver is None:
+        for network, slippage in run_networks(
+            dune, period, networks, "slippage"
+        ).items():
+            print(network)
+            pprint(slippage)
+        return
+    for network, (address, merged) in recompute_solvers(
+        dune, period, networks, solver
+    ).items():
+        print(f"{network}: recomputed slippage of {address}")
+        pprint(
+            [
+                row
+                for row in merged.negative + merged.positive
+                if row.solver_address == address
+            ]
+        )
+
+
+def slippage_preview_report(
+    dune: DuneAPI, period: AccountingPeriod, networks: list[Network], sample_rate: float
+) -> None:
+    """
+    Prints the per solver slippage of each network, extrapolated from the sample
+    `sample_rate` of the period's settlements, and the solvers whose negative slippage
+    may exceed their native token (e.g. ETH) reimbursement.
+    """
+    reimbursements = run_networks(dune, period, networks, "reimbursements")
+    pipelines = [accounting_pipeline(dune, period, network) for network in networks]
+    inputs = run_concurrently(
+        [(pipeline, ["token_list", "registry"]) for pipeline in pipelines]
+    )
+    for network, result in zip(networks, inputs):
+        native = NETWORKS[network].native_symbol
+        estimates = get_slippage_preview(
+            dune,
+            period,
+            sample_rate,
+            raw_sql=slippage_query(
+                QueryType.PER_TX, result["token_list"], result["registry"], network
+            ),
+            network=network,
+        )
+        print(f"{network} (sample of {sample_rate:.0%} of settlements)")
+        for est in estimates:
+            print(
+                f"{est.solver_address}({est.solver_name}): "
+                f"{est.amount_wei / 10 ** 18:.5f} {native} "
+                f"[{est.lower_wei / 10 ** 18:.5f}, {est.upper_wei / 10 ** 18:.5f}] "
+                f"from {est.sampled_txs} settlements"
+            )
+        for risk in breach_risks(estimates, reimbursements[network]):
+            print(
+                f"{'LIKELY' if risk.likely else 'POSSIBLE'} BREACH: slippage of "
+                f"{risk.estimate.solver_address}({risk.estimate.solver_name}) may "
+                f"exceed its {native} reimbursement of "
+                f"{risk.reimbursement_wei / 10 ** 18:.5f}"
+            )
+
+
+def transfers_report(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    networks: list[Network],
+    gas_budget: int = DEFAULT_GAS_BUDGET,
+    solver: Optional[str] = None,
+) -> None:
+    """
+    Writes the transfer file of each network (as a whole and split into multisend
+    chunks within `gas_budget`) and prints the funds needed. With `solver`, only its
+    slippage is recomputed (cf. `recompute_solvers`) and merged into the stored one.
+    """
+    # Fetched once for all targets, as fingerprinting is a Dune execution itself
+    fingerprints = network_fingerprints(dune, period, networks)
+    if solver is not None:
+        recompute_solvers(dune, period, networks, solver, fingerprints)
+    for network, transfers in run_networks(
+        dune, period, networks, "transfer_file", fingerprints
+    ).items():
+        eth_total = sum(t.amount for t in transfers if t.token_type == TokenType.NATIVE)
+        cow_total = sum(t.amount for t in transfers if t.token_type == TokenType.ERC20)
+        print(
+            f"{network}\n"
+            f"Total {NETWORKS[network].native_symbol} Funds needed: {eth_total}\n"
+            f"Total COW Funds needed: {cow_total}"
+        )
+        chunks = plan_multisend(transfers, gas_budget)
+        manifest = write_multisend_files(
+            chunks, period, NETWORKS[network].out_path(), gas_budget
+        )
+        print(
+            f"Split into {len(chunks)} multisend chunk(s) of at most {gas_budget} gas, "
+            f"see {manifest}"
+        )
+        if network == Network.MAINNET:
+            print(
+                f"For solver payouts, paste the transfer file CSV Airdrop at:\n"
+                f"{safe_url()}"
+            )
+
+
+def reimbursements_report(
+    dune: DuneAPI, period: AccountingPeriod, networks: list[Network], rpc: bool = False
+) -> None:
+    """
+    Prints the (not yet slippage adjusted) reimbursements and rewards of each network,
+    from Dune or, with `rpc`, from the settlement receipts of a node.
+    """
+    target = "rpc_reimbursements" if rpc else "reimbursements"
+    for network, transfers in run_networks(dune, period, networks, target).items():
+        print(network)
+        pprint(transfers)
+        eth_total = sum(t.amount for t in transfers if t.token_type == TokenType.NATIVE)
+        cow_total = sum(t.amount for t in transfers if t.token_type == TokenType.ERC20)
+        print(
+            f"Total {NETWORKS[network].native_symbol} reimbursed: {eth_total}\n"
+            f"Total COW rewarded: {cow_total}"
+        )
+
+
+def investigation_report(
+    dune: DuneAPI, period: AccountingPeriod, networks: list[Network], top: int = 5
+) -> None:
+    """Prints the transactions with the largest negative and positive slippage"""
+    for network, per_tx in run_networks(
+        dune, period, networks, "slippage_per_tx"
+    ).items():
+        ranked = sorted(per_tx, key=lambda tx: tx.amount_wei)
+        print(network)
+        pprint(ranked[:top] + ranked[-top:] if len(ranked) > 2 * top else ranked)
+
+
+def what_if_report(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    networks: list[Network],
+    rules: BufferTradeRules,
+) -> None:
+    """
+    Prints how solver slippage would change under alternative buffer trade `rules`.
+    Imbalances are only fetched once per period, further runs are local.
+    """
+    for network, table in run_networks(dune, period, networks, "imbalances").items():
+        print(network)
+        for diff in what_if(table, rules):
+            print(
+                f"{diff.solver_address}({diff.solver_name}): "
+                f"{diff.baseline_wei / 10 ** 18:.5f} -> "
+                f"{diff.alternative_wei / 10 ** 18:.5f} "
+                f"{NETWORKS[network].native_symbol}"
+            )
+
+
+def shadow_slippage_report(
+    dune: DuneAPI, period: AccountingPeriod, networks: list[Network]
+) -> None:
+    """Prints latency and per solver divergences of reference and candidate slippage"""
+    for network, result in run_networks(
+        dune, period, networks, "shadow_slippage"
+    ).items():
+        print(f"{network} slippage\n{result.report()}")
+
+
+def shadow_transfers_report(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    networks: list[Network],
+    tolerance_wei: int = DEFAULT_TOLERANCE_WEI,
+) -> None:
+    """
+    Compares the transfers resulting from reference and candidate slippage and writes
+    the (reference) transfer file of every network on which they agree within
+    `tolerance_wei` per row.
+    """
+    mismatches = []
+    for network, result in run_networks(
+        dune, period, networks, "shadow_transfers"
+    ).items():
+        print(f"{network} transfers\n{result.report()}")
+        try:
+            transfers = result.check(tolerance_wei)
+        except ShadowMismatch as err:
+            mismatches.append(f"{network}: {err}")
+            continue
+        write_transfer_file(transfers, period, NETWORKS[network].out_path())
+    if mismatches:
+        raise ShadowMismatch(f"Transfer files not written for {', '.join(mismatches)}")
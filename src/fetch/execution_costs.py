@@ -0,0 +1,267 @@
+"""
+Execution costs (ETH reimbursements) and COW rewards of solvers, computed from the
+settlement transactions' receipts of a node rather than from Dune's `view_batches`.
+
+These are available as soon as the accounting period has ended, while Dune only has
+them after its ingestion lag. Settlements are found via the `Settlement(address solver)`
+events of the settlement contract, and the gas of each is taken from its receipt.
+Requests are sent as JSON-RPC batches over a bounded pool of connections, and receipts
+(immutable once final) are cached locally, so reruns only request new settlements.
+
+web3 (v5) has no support for batched requests, so its HTTP transport (requests)
+is used directly.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from duneapi.types import Network
+
+from src.fetch.transfer_file import Transfer, solver_reimbursements
+from src.models import AccountingPeriod, Address, NETWORKS
+
+# keccak("Settlement(address)"), emitted once per settlement with the solver indexed
+SETTLEMENT_TOPIC = "0x40338ce1a7c49204f0099533b1e9a7ee0a3d261f84974ab7af36105b8c4e9db4"
+
+
+class RpcError(Exception):
+    """Raised when the node answers a request with an error"""
+
+
+class RpcClient:
+    """
+    JSON-RPC client sending requests in batches of at most `batch_size`, with at most
+    `max_workers` batches (and connections) in flight at any time.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        timeout: float = 30.0,
+    ):
+        # requests is imported with web3, which is only loaded once needed.
+        # pylint: disable=import-outside-toplevel
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post(self, calls: list[tuple[str, list[Any]]]) -> list[Any]:
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(calls)
+        ]
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        answers = response.json()
+        if not isinstance(answers, list):
+            # Some nodes answer a batch they reject with a single error object
+            raise RpcError(f"Batch rejected: {answers}")
+        results: list[Any] = [None] * len(calls)
+        for answer in answers:
+            if "error" in answer:
+                method, params = calls[answer["id"]]
+                raise RpcError(f"{method}{params} failed: {answer['error']}")
+            results[answer["id"]] = answer["result"]
+        return results
+
+    def batch(self, calls: list[tuple[str, list[Any]]]) -> list[Any]:
+        """Results of all `calls` (method, params) in order"""
+        batches = [
+            calls[i : i + self.batch_size]
+            for i in range(0, len(calls), self.batch_size)
+        ]
+        if len(batches) <= 1:
+            return self._post(batches[0]) if batches else []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [
+                result
+                for results in executor.map(self._post, batches)
+                for result in results
+            ]
+
+    def call(self, method: str, params: list[Any]) -> Any:
+        """Result of a single request"""
+        return self.batch([(method, params)])[0]
+
+
+@dataclass(frozen=True, slots=True)
+class Settlement:
+    """Gas spent by a solver on a settlement transaction"""
+
+    tx_hash: str
+    solver: str
+    gas_used: int
+    gas_price: int
+
+    @property
+    def cost_wei(self) -> int:
+        """Execution cost of the settlement"""
+        return self.gas_used * self.gas_price
+
+
+class ReceiptCache:
+    """Append-only file of the settlements whose receipts were already fetched"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.settlements: dict[str, Settlement] = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    settlement = Settlement(**json.loads(line))
+                    self.settlements[settlement.tx_hash] = settlement
+
+    def add(self, settlements: list[Settlement]) -> None:
+        """Adds (and persists) newly fetched settlements"""
+        with self._lock:
+            for settlement in settlements:
+                self.settlements[settlement.tx_hash] = settlement
+            if self.path is not None and settlements:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as file:
+                    for settlement in settlements:
+                        file.write(
+                            json.dumps(
+                                {
+                                    "tx_hash": settlement.tx_hash,
+                                    "solver": settlement.solver,
+                                    "gas_used": settlement.gas_used,
+                                    "gas_price": settlement.gas_price,
+                                }
+                            )
+                            + "\n"
+                        )
+
+
+def block_at(client: RpcClient, timestamp: int) -> int:
+    """First block with a timestamp at or after `timestamp` (binary search)"""
+    low, high = 0, int(client.call("eth_blockNumber", []), 16) + 1
+    while low < high:
+        mid = (low + high) // 2
+        block = client.call("eth_getBlockByNumber", [hex(mid), False])
+        if int(block["timestamp"], 16) < timestamp:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def settlement_solvers(
+    client: RpcClient,
+    contract: Address,
+    from_block: int,
+    to_block: int,
+    blocks_per_request: int = 5000,
+) -> dict[str, str]:
+    """Solver (lower case) of each settlement in the blocks [from_block, to_block)"""
+    calls: list[tuple[str, list[Any]]] = [
+        (
+            "eth_getLogs",
+            [
+                {
+                    "address": str(contract),
+                    "topics": [SETTLEMENT_TOPIC],
+                    "fromBlock": hex(start),
+                    "toBlock": hex(min(start + blocks_per_request, to_block) - 1),
+                }
+            ],
+        )
+        for start in range(from_block, to_block, blocks_per_request)
+    ]
+    return {
+        log["transactionHash"]: "0x" + log["topics"][1][-40:].lower()
+        for logs in client.batch(calls)
+        for log in logs
+    }
+
+
+def fetch_settlements(
+    client: RpcClient, solvers: dict[str, str], cache: ReceiptCache
+) -> list[Settlement]:
+    """Settlements of the transactions `solvers` (tx_hash -> solver)"""
+    missing = sorted(tx_hash for tx_hash in solvers if tx_hash not in cache.settlements)
+    receipts = client.batch(
+        [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in missing]
+    )
+    fetched = []
+    for tx_hash, receipt in zip(missing, receipts):
+        if receipt is None:
+            raise RpcError(f"No receipt for settlement {tx_hash}")
+        fetched.append(
+            Settlement(
+                tx_hash=tx_hash,
+                solver=solvers[tx_hash],
+                gas_used=int(receipt["gasUsed"], 16),
+                gas_price=int(receipt["effectiveGasPrice"], 16),
+            )
+        )
+    cache.add(fetched)
+    return [cache.settlements[tx_hash] for tx_hash in sorted(solvers)]
+
+
+def _utc_timestamp(time: datetime) -> int:
+    # Accounting periods (like Dune) are in UTC
+    return int(time.replace(tzinfo=timezone.utc).timestamp())
+
+
+def period_settlements(
+    client: RpcClient,
+    period: AccountingPeriod,
+    network: Network = Network.MAINNET,
+    cache: Optional[ReceiptCache] = None,
+) -> list[Settlement]:
+    """All settlements of the accounting period"""
+    config = NETWORKS[network]
+    if cache is None:
+        cache = ReceiptCache(os.path.join(config.out_path(), "receipts.jsonl"))
+    from_block = block_at(client, _utc_timestamp(period.start))
+    to_block = block_at(client, _utc_timestamp(period.end))
+    solvers = settlement_solvers(
+        client, config.settlement_contract, from_block, to_block
+    )
+    return fetch_settlements(client, solvers, cache)
+
+
+def reimbursements_from_settlements(
+    settlements: list[Settlement], cow_token: Address
+) -> list[Transfer]:
+    """ETH reimbursements and COW rewards as returned by `get_reimbursements`"""
+    cost_wei: dict[str, int] = defaultdict(int)
+    batch_count: dict[str, int] = defaultdict(int)
+    for settlement in settlements:
+        cost_wei[settlement.solver] += settlement.cost_wei
+        batch_count[settlement.solver] += 1
+    return solver_reimbursements(
+        {solver: cost / 10**18 for solver, cost in cost_wei.items()},
+        batch_count,
+        cow_token,
+    )
+
+
+def get_rpc_reimbursements(
+    client: RpcClient, period: AccountingPeriod, network: Network = Network.MAINNET
+) -> list[Transfer]:
+    """`get_reimbursements` from the node rather than Dune"""
+    return reimbursements_from_settlements(
+        period_settlements(client, period, network), NETWORKS[network].cow_token
+    )
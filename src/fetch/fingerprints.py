@@ -0,0 +1,149 @@
+"""
+Per day fingerprints (row counts and hashes) of the Dune data the accounting reads.
+
+Batches, trades, transfers and prices (USD, dex and clearing prices) of a day may
+still change some time after it has ended. Stored results record the fingerprints of
+the days they were computed from, and are recomputed only once the fingerprint of one
+of those days has changed.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import astuple, dataclass
+from datetime import date, datetime
+from typing import TYPE_CHECKING
+
+from duneapi.types import Network, QueryParameter
+from duneapi.util import open_query
+
+from src.models import AccountingPeriod, NETWORKS
+from src.pipeline import Pipeline
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+
+@dataclass(frozen=True, slots=True)
+class DayFingerprint:
+    """Row counts and hashes of the data of a single day"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    day: date
+    batches: int
+    batches_hash: str
+    trades: int
+    trades_hash: str
+    transfers: int
+    transfers_hash: str
+    prices: int
+    prices_hash: str
+    dex_prices: int
+    dex_prices_hash: str
+    clearing_prices: int
+    clearing_prices_hash: str
+
+    @classmethod
+    def from_dict(cls, obj: dict[str, str]) -> DayFingerprint:
+        """Converts Dune data dict to object with types"""
+        return cls(
+            day=datetime.strptime(obj["day"], "%Y-%m-%d").date(),
+            batches=int(obj["batches"]),
+            batches_hash=obj["batches_hash"],
+            trades=int(obj["trades"]),
+            trades_hash=obj["trades_hash"],
+            transfers=int(obj["transfers"]),
+            transfers_hash=obj["transfers_hash"],
+            prices=int(obj["prices"]),
+            prices_hash=obj["prices_hash"],
+            dex_prices=int(obj["dex_prices"]),
+            dex_prices_hash=obj["dex_prices_hash"],
+            clearing_prices=int(obj["clearing_prices"]),
+            clearing_prices_hash=obj["clearing_prices_hash"],
+        )
+
+    def digest(self) -> str:
+        """Single hash of all columns"""
+        return hashlib.sha256(repr(astuple(self)[1:]).encode()).hexdigest()
+
+
+def get_day_fingerprints(
+    dune: DuneAPI, period: AccountingPeriod, network: Network = Network.MAINNET
+) -> dict[date, str]:
+    """Fetches the fingerprint digest of every day of `period`"""
+    config = NETWORKS[network]
+    query = config.dune_query(
+        raw_sql=open_query("./queries/day_fingerprints.sql"),
+        name="Day Fingerprints",
+        parameters=[
+            QueryParameter.date_type("StartTime", period.start),
+            QueryParameter.date_type("EndTime", period.end),
+            QueryParameter.text_type(
+                "SettlementContract", config.bytea(config.settlement_contract)
+            ),
+            QueryParameter.text_type(
+                "WrappedNativeToken", config.bytea(config.wrapped_native_token)
+            ),
+        ],
+    )
+    fingerprints = [DayFingerprint.from_dict(row) for row in dune.fetch(query)]
+    return {fp.day: fp.digest() for fp in fingerprints}
+
+
+class FingerprintStore:
+    """Fingerprints of the days stored results were computed from (JSON file)"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.fingerprints: dict[date, str] = {}
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as file:
+                self.fingerprints = {
+                    datetime.strptime(day, "%Y-%m-%d").date(): digest
+                    for day, digest in json.load(file).items()
+                }
+
+    def changed(self, current: dict[date, str]) -> list[date]:
+        """Days whose fingerprint differs from (or was not yet) stored"""
+        return sorted(
+            day
+            for day, digest in current.items()
+            if self.fingerprints.get(day) != digest
+        )
+
+    def update(self, current: dict[date, str]) -> None:
+        """Stores the fingerprints `current`"""
+        self.fingerprints.update(current)
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = self.filename + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(
+                {str(day): digest for day, digest in sorted(self.fingerprints.items())},
+                file,
+                indent=2,
+            )
+        os.replace(tmp_file, self.filename)
+
+
+def invalidate_outdated(
+    pipeline: Pipeline, stages: tuple[str, ...], current: dict[date, str]
+) -> list[date]:
+    """
+    Invalidates the checkpoints of `stages` (and their dependents) unless all days
+    of the pipeline's period still have the fingerprints they were computed from,
+    and records the `current` ones. Returns the days whose data has changed.
+    """
+    store = FingerprintStore(os.path.join(pipeline.checkpoint_dir, "fingerprints.json"))
+    changed = store.changed(current)
+    if not changed:
+        return []
+    for stage in stages:
+        pipeline.invalidate(stage)
+    # Days not fingerprinted before are new, rather than changed
+    previous = [day for day in changed if day in store.fingerprints]
+    store.update(current)
+    return previous
@@ -0,0 +1,116 @@
+"""
+Fetches the per transaction token imbalances of the settlement contract
+(i.e. `valued_potential_buffered_trades` of the slippage query) together with the
+prices needed to value them. Once fetched, the classification of internal buffer trades
+and the resulting slippage can be recomputed locally (cf. src/offline/buffer_trades.py).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, TYPE_CHECKING
+
+from duneapi.types import Network
+from duneapi.util import open_query
+
+from src.fetch.period_slippage import slippage_parameters, slippage_sub_query
+from src.models import AccountingPeriod, NETWORKS
+from src.registry import Registry
+from src.token_list import fetch_trusted_tokens
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+
+def _optional_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+@dataclass(frozen=True, slots=True)
+class Imbalance:
+    """Net amount of `token` the settlement contract received in transaction `tx_hash`"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    tx_hash: str
+    dex_swaps: int
+    solver_address: str
+    solver_name: str
+    symbol: str
+    token: str
+    amount: int
+    # Value of amount in clearing prices of the settlement (if traded)
+    clearing_value: Optional[float]
+    # USD value of amount at the time of the settlement (if price is known)
+    usd_value: Optional[float]
+
+    @classmethod
+    def from_dict(cls, obj: dict[str, str]) -> Imbalance:
+        """Converts Dune data dict to object with types"""
+        return cls(
+            tx_hash=obj["tx_hash"],
+            dex_swaps=int(obj["dex_swaps"]),
+            solver_address=obj["solver_address"],
+            solver_name=obj["solver_name"],
+            symbol=obj["symbol"],
+            token=obj["token"],
+            amount=int(obj["amount"]),
+            clearing_value=_optional_float(obj["clearing_value"]),
+            usd_value=_optional_float(obj["usd_value"]),
+        )
+
+
+@dataclass
+class ImbalanceTable:
+    """All token imbalances of an accounting period with the prices to value them"""
+
+    imbalances: list[Imbalance]
+    # token -> (USD price, decimals) at the end of the accounting period
+    end_prices: dict[str, tuple[float, int]]
+    # USD price of the native token (e.g. ETH, xDAI) at the end of the accounting period
+    eth_price: float
+    # Trusted buffer tradable tokens at the time of fetching
+    token_list: list[str]
+
+    @classmethod
+    def from_records(
+        cls, records: list[dict[str, str]], token_list: list[str]
+    ) -> ImbalanceTable:
+        """Constructs the table from the results of the imbalance query"""
+        end_prices = {
+            rec["token"]: (float(rec["end_price"]), int(rec["end_decimals"]))
+            for rec in records
+            if rec["end_price"] is not None
+        }
+        eth_price = float(records[0]["eth_price"]) if records else 0.0
+        return cls(
+            imbalances=[Imbalance.from_dict(rec) for rec in records],
+            end_prices=end_prices,
+            eth_price=eth_price,
+            token_list=token_list,
+        )
+
+
+def get_imbalance_table(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    network: Network = Network.MAINNET,
+    token_list: Optional[list[str]] = None,
+    registry: Optional[Registry] = None,
+) -> ImbalanceTable:
+    """Executes & Fetches the token imbalances per transaction for accounting period"""
+    if token_list is None:
+        token_list = fetch_trusted_tokens()
+    if registry is None:
+        registry = Registry.load(network).for_period(period)
+    raw_sql = "\n".join(
+        [
+            slippage_sub_query(token_list, registry, network),
+            open_query("./queries/select_imbalances.sql"),
+        ]
+    )
+    query = NETWORKS[network].dune_query(
+        raw_sql=raw_sql,
+        name="Slippage Accounting Imbalances",
+        parameters=slippage_parameters(period, network),
+    )
+    return ImbalanceTable.from_records(dune.fetch(query), token_list)
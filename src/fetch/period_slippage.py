@@ -3,16 +3,19 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import Enum
-from pprint import pprint
+from typing import Optional, TYPE_CHECKING
 
-from duneapi.api import DuneAPI
-from duneapi.types import QueryParameter, DuneQuery, Network
+from duneapi.types import QueryParameter, Network
 from duneapi.util import open_query
 
-from src.models import AccountingPeriod, Address
+from src.models import AccountingPeriod, Address, NETWORKS
+from src.registry import Registry, registry_tables_query
 from src.token_list import fetch_trusted_tokens
 from src.utils.script_args import generic_script_init
 
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
 
 def allowed_token_list_query(token_list: list[str]) -> str:
     """Constructs sub query for allowed tokens"""
@@ -31,13 +34,53 @@ def prepend_to_sub_query(query: str, table_to_add: str) -> str:
     return "\n".join([query[0:4], table_to_add, query[5:]])
 
 
-def add_token_list_table_to_query(original_sub_query: str) -> str:
-    """Inserts the token_list table right after the WITH statement into the sql query"""
-    token_list = fetch_trusted_tokens()
+def add_token_list_table_to_query(
+    original_sub_query: str, token_list: Optional[list[str]] = None
+) -> str:
+    """
+    Inserts the token_list table right after the WITH statement into the sql query.
+    Token list is fetched when not provided.
+    """
+    if token_list is None:
+        token_list = fetch_trusted_tokens()
     allowed_tokens_query = allowed_token_list_query(token_list)
     return prepend_to_sub_query(original_sub_query, allowed_tokens_query)
 
 
+def native_token_price_query(network: Network = Network.MAINNET) -> str:
+    """
+    Constructs sub query `native_token_price` (price): the USD price of the network's
+    native token at the end of the period, in which slippage is deducted from the
+    reimbursements (cf. NetworkConfig.native_price_query).
+    """
+    return f"native_token_price as (\n    {NETWORKS[network].native_price_query}\n)"
+
+
+def slippage_sub_query(
+    token_list: Optional[list[str]] = None,
+    registry: Optional[Registry] = None,
+    network: Network = Network.MAINNET,
+) -> str:
+    """
+    The (not standalone executable) slippage sub query of `network` with the allowed
+    token list and the solver & token registry tables inserted.
+    Token list is fetched and registry loaded when not provided.
+    """
+    if registry is None:
+        registry = Registry.load(network)
+    return ",\n".join(
+        [
+            prepend_to_sub_query(
+                add_token_list_table_to_query(
+                    open_query("./queries/period_slippage.sql"), token_list
+                ),
+                registry_tables_query(registry),
+            ).rstrip(),
+            native_token_price_query(network),
+        ]
+    )
+
+
 class QueryType(Enum):
     """
     Determines type of slippage data to be fetched.
@@ -51,29 +94,31 @@ class QueryType(Enum):
         return self.value
 
 
-def slippage_query(query_type: QueryType = QueryType.TOTAL) -> str:
+def slippage_query(
+    query_type: QueryType = QueryType.TOTAL,
+    token_list: Optional[list[str]] = None,
+    registry: Optional[Registry] = None,
+    network: Network = Network.MAINNET,
+) -> str:
     """
-    Constructs our slippage query by joining sub-queries
+    Constructs our slippage query (of `network`) by joining sub-queries
     Default query type input it total, but we can request
     per transaction results for testing
     """
 
-    slippage_sub_query = open_query("./queries/period_slippage.sql")
+    # Slippage in (wei of) the network's native token, e.g. ETH or xDAI
     select_statement = f"""
     select *, 
-        usd_value / (select price from eth_price) * 10 ^ 18 as eth_slippage_wei 
+        usd_value / (select price from native_token_price) * 10 ^ 18 as eth_slippage_wei 
     from {query_type}
     """.strip()
 
     return "\n".join(
-        [
-            add_token_list_table_to_query(slippage_sub_query),
-            select_statement,
-        ]
+        [slippage_sub_query(token_list, registry, network), select_statement]
     )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SolverSlippage:
     """Total amount reimbursed for accounting period"""
 
@@ -92,7 +137,29 @@ class SolverSlippage:
         )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class TxSlippage:
+    """Slippage of a single settlement transaction"""
+
+    tx_hash: str
+    solver_address: Address
+    solver_name: str
+    # ETH amount (in WEI)
+    amount_wei: int
+
+    @classmethod
+    def from_dict(cls, obj: dict[str, str]) -> TxSlippage:
+        """Converts Dune data dict (of the per tx slippage query) to object with types"""
+        return cls(
+            # Dune returns bytea columns as postgres escaped hex strings.
+            tx_hash=obj["tx_hash"].replace("\\x", "0x"),
+            solver_address=Address(obj["solver_address"]),
+            solver_name=obj["solver_name"],
+            amount_wei=int(obj["eth_slippage_wei"]),
+        )
+
+
+@dataclass(slots=True)
 class SplitSlippages:
     """Basic class to store the output of slippage fetching"""
 
@@ -121,24 +188,73 @@ class SplitSlippages:
         """Returns total positive slippage"""
         return sum(pos.amount_wei for pos in self.positive)
 
+    def merge_solver(self, solver: Address, patched: SplitSlippages) -> SplitSlippages:
+        """
+        These slippages with the ones of `solver` replaced by (recomputed) `patched`,
+        which must only contain slippage of `solver`.
+        """
+        results = SplitSlippages()
+        for slippage in self.negative + self.positive:
+            if slippage.solver_address != solver:
+                results.append(slippage)
+        for slippage in patched.negative + patched.positive:
+            if slippage.solver_address != solver:
+                raise ValueError(f"Slippage of {slippage.solver_address} in patch")
+            results.append(slippage)
+        return results
+
+
+def slippage_parameters(
+    period: AccountingPeriod,
+    network: Network = Network.MAINNET,
+    tx_hash: str = "0x",
+    sample_rate: float = 1.0,
+    solver: Optional[Address] = None,
+) -> list[QueryParameter]:
+    """
+    Parameters of the slippage query (restricted to `tx_hash` unless it is 0x, to
+    the deterministic sample of `sample_rate` of all settlements if less than 1 and
+    to the settlements of `solver` if given)
+    """
+    config = NETWORKS[network]
+    return [
+        QueryParameter.date_type("StartTime", period.start),
+        QueryParameter.date_type("EndTime", period.end),
+        QueryParameter.text_type("TxHash", tx_hash),
+        QueryParameter.number_type("SampleRate", sample_rate),
+        QueryParameter.text_type(
+            "SolverAddress", str(solver).lower() if solver is not None else "0x"
+        ),
+        QueryParameter.text_type(
+            "SettlementContract", config.bytea(config.settlement_contract)
+        ),
+        QueryParameter.text_type(
+            "WrappedNativeToken", config.bytea(config.wrapped_native_token)
+        ),
+    ]
+
 
 def get_period_slippage(
     dune: DuneAPI,
     period: AccountingPeriod,
+    raw_sql: Optional[str] = None,
+    network: Network = Network.MAINNET,
+    solver: Optional[Address] = None,
 ) -> SplitSlippages:
     """
     Executes & Fetches results of slippage query per solver for specified accounting period.
     Returns a class representation of the results as two lists (positive & negative).
+    A prebuilt `raw_sql` (cf. `slippage_query`) may be passed to skip building the query.
+    With `solver`, only the transactions of that solver are evaluated (cf. `merge_solver`).
     """
-    query = DuneQuery.from_environment(
-        raw_sql=slippage_query(),
-        network=Network.MAINNET,
+    query = NETWORKS[network].dune_query(
+        raw_sql=raw_sql
+        if raw_sql is not None
+        else slippage_query(
+            registry=Registry.load(network).for_period(period), network=network
+        ),
         name="Slippage Accounting",
-        parameters=[
-            QueryParameter.date_type("StartTime", period.start),
-            QueryParameter.date_type("EndTime", period.end),
-            QueryParameter.text_type("TxHash", "0x"),
-        ],
+        parameters=slippage_parameters(period, network, solver=solver),
     )
     data_set = dune.fetch(query)
     results = SplitSlippages()
@@ -148,11 +264,35 @@ def get_period_slippage(
     return results
 
 
-if __name__ == "__main__":
-    dune_connection, accounting_period = generic_script_init(
-        description="Fetch Accounting Period Totals"
+def get_slippage_per_tx(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    raw_sql: Optional[str] = None,
+    network: Network = Network.MAINNET,
+    sample_rate: float = 1.0,
+) -> list[TxSlippage]:
+    """
+    Executes & Fetches results of the slippage query per transaction (i.e. QueryType.PER_TX)
+    for specified accounting period (or the sample `sample_rate` of its settlements).
+    """
+    query = NETWORKS[network].dune_query(
+        raw_sql=raw_sql
+        if raw_sql is not None
+        else slippage_query(
+            QueryType.PER_TX,
+            registry=Registry.load(network).for_period(period),
+            network=network,
+        ),
+        name="Slippage Accounting per Transaction",
+        parameters=slippage_parameters(period, network, sample_rate=sample_rate),
     )
-    slippage_for_period = get_period_slippage(
-        dune=dune_connection, period=accounting_period
+    return [TxSlippage.from_dict(row) for row in dune.fetch(query)]
+
+
+if __name__ == "__main__":
+    # pylint: disable=cyclic-import,ungrouped-imports
+    from src.fetch.accounting import slippage_report
+
+    slippage_report(
+        *generic_script_init(description="Fetch Accounting Period Slippage")
     )
-    pprint(slippage_for_period)
@@ -1,18 +1,24 @@
 """
 Script to query and display total funds distributed for specified accounting period.
 """
+from __future__ import annotations
+
 from dataclasses import dataclass
-from pprint import pprint
+from typing import Optional, TYPE_CHECKING
 
-from duneapi.api import DuneAPI
-from duneapi.types import QueryParameter, DuneQuery, Network
+from duneapi.types import QueryParameter, Network
 from duneapi.util import open_query
 
-from src.models import AccountingPeriod
+from src.fetch.period_slippage import prepend_to_sub_query
+from src.models import AccountingPeriod, NETWORKS
+from src.registry import Registry, registry_tables_query
 from src.utils.script_args import generic_script_init
 
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PeriodTotals:
     """Total amount reimbursed for accounting period"""
 
@@ -22,13 +28,21 @@ class PeriodTotals:
     realized_fees_eth: int
 
 
-def get_period_totals(dune: DuneAPI, period: AccountingPeriod) -> PeriodTotals:
+def get_period_totals(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    network: Network = Network.MAINNET,
+    registry: Optional[Registry] = None,
+) -> PeriodTotals:
     """
     Fetches & Returns Dune Results for accounting period totals.
     """
-    query = DuneQuery.from_environment(
-        raw_sql=open_query("./queries/period_totals.sql"),
-        network=Network.MAINNET,
+    if registry is None:
+        registry = Registry.load(network).for_period(period)
+    query = NETWORKS[network].dune_query(
+        raw_sql=prepend_to_sub_query(
+            open_query("./queries/period_totals.sql"), registry_tables_query(registry)
+        ),
         name="Accounting Period Totals",
         parameters=[
             QueryParameter.date_type("StartTime", period.start),
@@ -47,10 +61,7 @@ def get_period_totals(dune: DuneAPI, period: AccountingPeriod) -> PeriodTotals:
 
 
 if __name__ == "__main__":
-    dune_connection, accounting_period = generic_script_init(
-        description="Fetch Accounting Period Totals"
-    )
-
-    total_for_period = get_period_totals(dune=dune_connection, period=accounting_period)
+    # pylint: disable=cyclic-import,ungrouped-imports
+    from src.fetch.accounting import totals_report
 
-    pprint(total_for_period)
+    totals_report(*generic_script_init(description="Fetch Accounting Period Totals"))
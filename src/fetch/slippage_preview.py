@@ -0,0 +1,129 @@
+"""
+Fast preview of the per solver slippage of a (possibly still running) accounting period.
+
+Rather than all settlements, the slippage query only evaluates a deterministic sample
+of them: a settlement is included iff the hash of its transaction hash falls below
+the sample rate (cf. `in_sample` and period_slippage.sql). The slippage of every
+solver is extrapolated from its sampled settlements (Horvitz-Thompson estimator) with
+a normal approximation confidence interval, and solvers whose negative slippage may
+exceed their ETH reimbursement (cf. README) are flagged.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Optional, TYPE_CHECKING
+
+from duneapi.types import Network
+
+from src.fetch.period_slippage import TxSlippage, get_slippage_per_tx
+from src.fetch.transfer_file import TokenType, Transfer
+from src.models import AccountingPeriod, Address
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+# Two-sided 95% quantile of the standard normal distribution
+Z_95 = 1.96
+
+
+def in_sample(tx_hash: str, sample_rate: float) -> bool:
+    """Whether the settlement `tx_hash` is part of the sample (as in the query)"""
+    if sample_rate >= 1:
+        return True
+    # The query hashes the hex text of the hash, i.e. md5(encode(tx_hash, 'hex'))
+    digest = hashlib.md5(tx_hash[2:].lower().encode()).hexdigest()
+    return int(digest[:8], 16) < sample_rate * 2**32
+
+
+@dataclass(frozen=True, slots=True)
+class SlippageEstimate:
+    """Extrapolated slippage (in WEI) of a solver with its confidence interval"""
+
+    solver_address: Address
+    solver_name: str
+    sampled_txs: int
+    amount_wei: int
+    lower_wei: int
+    upper_wei: int
+
+
+@dataclass(frozen=True, slots=True)
+class BreachRisk:
+    """Solver whose negative slippage may exceed its ETH reimbursement"""
+
+    estimate: SlippageEstimate
+    reimbursement_wei: int
+    # Whether the point estimate (rather than only the interval) exceeds it
+    likely: bool
+
+
+def estimate_slippage(
+    sample: list[TxSlippage], sample_rate: float, z_score: float = Z_95
+) -> list[SlippageEstimate]:
+    """
+    Per solver slippage extrapolated from the slippage of the sampled settlements,
+    each included with probability `sample_rate`.
+    """
+    if not 0 < sample_rate <= 1:
+        raise ValueError(f"Sample rate must be in (0, 1], got {sample_rate}")
+    rate = Fraction(sample_rate)
+    by_solver: dict[Address, list[TxSlippage]] = {}
+    for tx_slippage in sample:
+        by_solver.setdefault(tx_slippage.solver_address, []).append(tx_slippage)
+    estimates = []
+    for solver, txs in by_solver.items():
+        # Exact (rational) arithmetic, as WEI amounts exceed the precision of floats
+        amount = round(Fraction(sum(tx.amount_wei for tx in txs)) / rate)
+        variance = (1 - rate) / rate**2 * sum(tx.amount_wei**2 for tx in txs)
+        margin = math.ceil(z_score * math.sqrt(variance))
+        estimates.append(
+            SlippageEstimate(
+                solver_address=solver,
+                solver_name=txs[0].solver_name,
+                sampled_txs=len(txs),
+                amount_wei=amount,
+                lower_wei=amount - margin,
+                upper_wei=amount + margin,
+            )
+        )
+    return sorted(estimates, key=lambda est: est.amount_wei)
+
+
+def breach_risks(
+    estimates: list[SlippageEstimate], reimbursements: list[Transfer]
+) -> list[BreachRisk]:
+    """Solvers whose negative slippage may (within its interval) exceed their payout"""
+    eth_payout = {
+        transfer.receiver: round(transfer.amount * 10**18)
+        for transfer in reimbursements
+        if transfer.token_type == TokenType.NATIVE
+    }
+    return [
+        BreachRisk(
+            estimate=est,
+            reimbursement_wei=eth_payout.get(est.solver_address, 0),
+            likely=-est.amount_wei > eth_payout.get(est.solver_address, 0),
+        )
+        for est in estimates
+        if -est.lower_wei > eth_payout.get(est.solver_address, 0)
+    ]
+
+
+def get_slippage_preview(
+    dune: DuneAPI,
+    period: AccountingPeriod,
+    sample_rate: float,
+    raw_sql: Optional[str] = None,
+    network: Network = Network.MAINNET,
+) -> list[SlippageEstimate]:
+    """
+    Executes the per transaction slippage query on the sample `sample_rate` of
+    the period's settlements and returns the extrapolated per solver slippage.
+    """
+    sample = get_slippage_per_tx(
+        dune, period, raw_sql=raw_sql, network=network, sample_rate=sample_rate
+    )
+    return estimate_slippage(sample, sample_rate)
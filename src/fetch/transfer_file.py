@@ -1,20 +1,24 @@
 """Script to generate the CSV Airdrop file for Solver Rewards over an Accounting Period"""
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
-from duneapi.api import DuneAPI
-from duneapi.types import DuneQuery, QueryParameter, Network
+from duneapi.types import QueryParameter, Network
 from duneapi.util import open_query
 
 from src.fetch.period_slippage import SolverSlippage, get_period_slippage
-from src.file_io import File, write_to_csv
-from src.models import AccountingPeriod, Address
+from src.models import AccountingPeriod, Address, NETWORKS
 from src.utils.dataset import index_by
 from src.utils.script_args import generic_script_init
 
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+# COW rewarded per settled batch
+COW_PER_BATCH = 100
+
 
 def safe_url() -> str:
     """URL to CSV Airdrop App in CoW DAO Team Safe"""
@@ -47,7 +51,7 @@ class TokenType(Enum):
         return self.value
 
 
-@dataclass
+@dataclass(slots=True)
 class Transfer:
     """Total amount reimbursed for accounting period"""
 
@@ -91,25 +95,57 @@ class Transfer:
         self.amount = new_amount
 
 
-def get_transfers(dune: DuneAPI, period: AccountingPeriod) -> list[Transfer]:
-    """Fetches and returns slippage-adjusted Transfers for solver reimbursement"""
-    query = DuneQuery.from_environment(
+def get_reimbursements(
+    dune: DuneAPI, period: AccountingPeriod, network: Network = Network.MAINNET
+) -> list[Transfer]:
+    """Fetches and returns (not yet slippage-adjusted) ETH reimbursements and COW rewards"""
+    config = NETWORKS[network]
+    query = config.dune_query(
         raw_sql=open_query("./queries/period_transfers.sql"),
-        network=Network.MAINNET,
         name="ETH Reimbursement & COW Rewards",
         parameters=[
             QueryParameter.date_type("StartTime", period.start),
             QueryParameter.date_type("EndTime", period.end),
+            QueryParameter.text_type("COWToken", str(config.cow_token)),
         ],
     )
-    reimbursements_and_rewards = dune.fetch(query)
+    return [Transfer.from_dict(row) for row in dune.fetch(query)]
+
+
+def solver_reimbursements(
+    eth_spent: dict[str, float], batch_count: dict[str, int], cow_token: Address
+) -> list[Transfer]:
+    """
+    ETH reimbursements and COW rewards (per settled batch) of each solver,
+    ordered as by period_transfers.sql
+    """
+    results = []
+    for solver in sorted(eth_spent):
+        results.append(
+            Transfer(TokenType.NATIVE, None, Address(solver), eth_spent[solver])
+        )
+        results.append(
+            Transfer(
+                TokenType.ERC20,
+                cow_token,
+                Address(solver),
+                float(batch_count[solver] * COW_PER_BATCH),
+            )
+        )
+    return results
 
-    negative_slippage = get_period_slippage(dune, period).negative
-    indexed_slippage = index_by(negative_slippage, "solver_address")
 
+def adjust_transfers(
+    reimbursements: list[Transfer],
+    indexed_slippage: dict[Address, SolverSlippage],
+) -> list[Transfer]:
+    """
+    Returns copies of the ETH reimbursements adjusted by (negative) slippage of their
+    receiver. Reimbursements that would become non-positive are excluded.
+    """
     results = []
-    for row in reimbursements_and_rewards:
-        transfer = Transfer.from_dict(row)
+    for original in reimbursements:
+        transfer = replace(original)
         slippage = indexed_slippage.get(transfer.receiver)
         if transfer.token_type == TokenType.NATIVE and slippage is not None:
             try:
@@ -127,24 +163,20 @@ def get_transfers(dune: DuneAPI, period: AccountingPeriod) -> list[Transfer]:
     return results
 
 
+def get_transfers(
+    dune: DuneAPI, period: AccountingPeriod, network: Network = Network.MAINNET
+) -> list[Transfer]:
+    """Fetches and returns slippage-adjusted Transfers for solver reimbursement"""
+    reimbursements_and_rewards = get_reimbursements(dune, period, network)
+
+    negative_slippage = get_period_slippage(dune, period, network=network).negative
+    indexed_slippage = index_by(negative_slippage, "solver_address")
+
+    return adjust_transfers(reimbursements_and_rewards, indexed_slippage)
+
+
 if __name__ == "__main__":
-    dune_connection, accounting_period = generic_script_init(
-        description="Fetch Complete Reimbursement"
-    )
-    transfers = get_transfers(
-        dune=dune_connection,
-        period=accounting_period,
-    )
+    # pylint: disable=cyclic-import,ungrouped-imports
+    from src.fetch.accounting import transfers_report
 
-    write_to_csv(
-        data_list=transfers,
-        outfile=File(name=f"transfers-{accounting_period}.csv"),
-    )
-    eth_total = sum(t.amount for t in transfers if t.token_type == TokenType.NATIVE)
-    cow_total = sum(t.amount for t in transfers if t.token_type == TokenType.ERC20)
-    print(
-        f"Total ETH Funds needed: {eth_total}\n"
-        f"Total COW Funds needed: {cow_total}\n"
-        f"For solver payouts, paste the transfer file CSV Airdrop at:\n"
-        f"{safe_url()}"
-    )
+    transfers_report(*generic_script_init(description="Fetch Complete Reimbursement"))
@@ -1,8 +1,10 @@
 """Utility code for I/O related tasks"""
 import csv
 import os
-from dataclasses import fields, astuple, dataclass, is_dataclass
-from typing import Any
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import fields, dataclass, is_dataclass
+from typing import Any, Iterator
 
 FILE_OUT_PATH = os.environ.get("FILE_OUT_PATH", "./out")
 
@@ -36,9 +38,30 @@ def write_to_csv(data_list: list[Any], outfile: File) -> None:
         sample = data_list[0]
         assert is_dataclass(sample), "Method only accepts lists of type dataclass"
         headers = [f.name for f in fields(sample)]
-        data_tuple = [astuple(x) for x in data_list]
+        # Shallow field access: unlike `astuple` this does not deep-copy every value
+        # and works the same for slotted and regular dataclasses.
+        data_tuple = [tuple(getattr(x, h) for h in headers) for x in data_list]
 
         dict_writer = csv.DictWriter(out_file, headers, lineterminator="\n")
         dict_writer.writeheader()
         writer = csv.writer(out_file, lineterminator="\n")
         writer.writerows(data_tuple)
+
+
+@contextmanager
+def sqlite_connection(path: str, schema: str = "") -> Iterator[sqlite3.Connection]:
+    """
+    Connection to the sqlite database `path` (created with `schema` if needed),
+    committing on success and closed on exit.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            if schema:
+                conn.executescript(schema)
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,373 @@
+"""
+Append-only store of daily per-solver slippage, reimbursement and reward values.
+
+Records are fixed-width binary rows in `records.bin` (sorted by day, since the store
+only accepts days later than the last one stored) and are read through `mmap`, so
+range and rollup queries binary search the day column instead of re-running
+`period_slippage.sql` for every window of interest. Solver addresses are stored
+once in `solvers.csv` and referenced by their row index. Days whose data changed on
+Dune after they were ingested (cf. src/fetch/fingerprints.py) are replaced by `refresh`.
+
+Usage:
+    python -m src.history ingest --start '2022-03-01' --end '2022-03-08'
+    python -m src.history refresh --start '2022-03-01' --end '2022-03-08'
+    python -m src.history report --start '2022-03-01' --end '2022-06-01' --rollup month
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Optional, TYPE_CHECKING
+
+from src.fetch.fingerprints import FingerprintStore, get_day_fingerprints
+from src.fetch.period_slippage import get_period_slippage
+from src.fetch.transfer_file import TokenType, get_reimbursements
+from src.file_io import FILE_OUT_PATH
+from src.models import AccountingPeriod, Address
+from src.utils.units import to_wei
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+EPOCH = date(1970, 1, 1)
+# day, solver index, then slippage, reimbursement & reward as (signed high, low) halves
+# of 128-bit integers: wei amounts do not generally fit into 64 bits.
+RECORD = struct.Struct("<iIqQqQqQ")
+LOW_BITS = 64
+LOW_MASK = (1 << LOW_BITS) - 1
+
+
+def _split(value: int) -> tuple[int, int]:
+    return value >> LOW_BITS, value & LOW_MASK
+
+
+def _join(high: int, low: int) -> int:
+    return (high << LOW_BITS) | low
+
+
+class Rollup(Enum):
+    """Granularity of aggregated history reports"""
+
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+    def bucket(self, day: date) -> date:
+        """Returns the first day of the bucket containing `day`"""
+        if self == Rollup.WEEK:
+            return day - timedelta(days=day.weekday())
+        if self == Rollup.MONTH:
+            return day.replace(day=1)
+        return day
+
+    def __str__(self) -> str:
+        return self.value
+
+
+@dataclass(frozen=True, slots=True)
+class SolverDay:
+    """
+    Slippage, ETH reimbursement and COW reward of a solver on a single day
+    (or, for rollups, summed over the bucket starting on `day`).
+    """
+
+    day: date
+    solver: Address
+    solver_name: str
+    slippage_wei: int
+    reimbursement_wei: int
+    reward_wei: int
+
+
+class SolverHistory:
+    """Python API to the append-only, memory-mapped solver history store"""
+
+    def __init__(self, path: str = os.path.join(FILE_OUT_PATH, "history")):
+        self.path = path
+        self.records_file = os.path.join(path, "records.bin")
+        self.solvers_file = os.path.join(path, "solvers.csv")
+        self.solvers: list[tuple[Address, str]] = []
+        self.solver_index: dict[Address, int] = {}
+        if os.path.exists(self.solvers_file):
+            with open(self.solvers_file, "r", encoding="utf-8") as file:
+                for address, name in csv.reader(file):
+                    self._register(Address.from_checksum(address), name)
+
+    def _register(self, solver: Address, name: str) -> int:
+        self.solver_index[solver] = len(self.solvers)
+        self.solvers.append((solver, name))
+        return self.solver_index[solver]
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.records_file):
+            return 0
+        return os.path.getsize(self.records_file) // RECORD.size
+
+    def last_day(self) -> Optional[date]:
+        """Most recent day contained in the store"""
+        with self._mapped() as view:
+            if view is None or len(view) == 0:
+                return None
+            return self._day_at(view, len(view) // RECORD.size - 1)
+
+    def append(self, day: date, records: list[SolverDay]) -> None:
+        """Appends all solver records of `day`, which must be after the last stored day"""
+        last = self.last_day()
+        if last is not None and day <= last:
+            raise ValueError(f"History is append-only: {day} is not after {last}")
+        rows = self._pack(day, records)
+        with open(self.records_file, "ab") as file:
+            file.write(rows)
+
+    def replace(self, day: date, records: list[SolverDay]) -> None:
+        """
+        Replaces the records of `day` (e.g. once its data has changed on Dune).
+        Unlike appending, this rewrites all records after `day`.
+        """
+        rows = self._pack(day, records)
+        with self._mapped() as view:
+            if view is None:
+                raise ValueError(f"No records of {day} to replace")
+            first = self._bisect(view, (day - EPOCH).days) * RECORD.size
+            last = self._bisect(view, (day - EPOCH).days + 1) * RECORD.size
+            content = view[:first].tobytes() + rows + view[last:].tobytes()
+        # Written to a temporary file first, so that a crash never loses records
+        tmp_file = self.records_file + ".tmp"
+        with open(tmp_file, "wb") as file:
+            file.write(content)
+        os.replace(tmp_file, self.records_file)
+
+    def _pack(self, day: date, records: list[SolverDay]) -> bytes:
+        """Binary rows of `records`, registering (and storing) new solvers"""
+        os.makedirs(self.path, exist_ok=True)
+        new_solvers = []
+        rows = bytearray()
+        for rec in records:
+            assert rec.day == day, f"Record {rec} does not belong to {day}"
+            index = self.solver_index.get(rec.solver)
+            if index is None:
+                index = self._register(rec.solver, rec.solver_name)
+                new_solvers.append((str(rec.solver), rec.solver_name))
+            rows += RECORD.pack(
+                (day - EPOCH).days,
+                index,
+                *_split(rec.slippage_wei),
+                *_split(rec.reimbursement_wei),
+                *_split(rec.reward_wei),
+            )
+        # Solvers are written first, so that records never reference unknown solvers.
+        with open(self.solvers_file, "a", encoding="utf-8") as file:
+            csv.writer(file, lineterminator="\n").writerows(new_solvers)
+        return bytes(rows)
+
+    def range(
+        self, start: date, end: date, solver: Optional[Address] = None
+    ) -> list[SolverDay]:
+        """Returns all records with start <= day < end (optionally for a single solver)"""
+        return [
+            SolverDay(EPOCH + timedelta(days=day), *self.solvers[index], *values)
+            for day, index, *values in self._rows(start, end, solver)
+        ]
+
+    def rollup(
+        self,
+        start: date,
+        end: date,
+        granularity: Rollup = Rollup.MONTH,
+        solver: Optional[Address] = None,
+    ) -> list[SolverDay]:
+        """Per solver totals for each `granularity` bucket between start and end"""
+        buckets: dict[int, date] = {}
+        totals: dict[tuple[date, int], list[int]] = {}
+        for day, index, *values in self._rows(start, end, solver):
+            if day not in buckets:
+                buckets[day] = granularity.bucket(EPOCH + timedelta(days=day))
+            total = totals.setdefault((buckets[day], index), [0, 0, 0])
+            for column, value in enumerate(values):
+                total[column] += value
+        return [
+            SolverDay(bucket, *self.solvers[index], *total)
+            for (bucket, index), total in sorted(
+                totals.items(),
+                key=lambda item: (item[0][0], str(self.solvers[item[0][1]][0])),
+            )
+        ]
+
+    def _rows(
+        self, start: date, end: date, solver: Optional[Address]
+    ) -> list[tuple[int, ...]]:
+        """Raw (day, solver index, slippage, reimbursement, reward) rows in range"""
+        solver_filter = self.solver_index.get(solver) if solver is not None else None
+        if solver is not None and solver_filter is None:
+            return []
+        with self._mapped() as view:
+            if view is None:
+                return []
+            first = self._bisect(view, (start - EPOCH).days)
+            last = self._bisect(view, (end - EPOCH).days)
+            with view[first * RECORD.size : last * RECORD.size] as window:
+                rows = RECORD.iter_unpack(window)
+                return [
+                    (day, index, _join(*v[0:2]), _join(*v[2:4]), _join(*v[4:6]))
+                    for day, index, *v in rows
+                    if solver_filter is None or index == solver_filter
+                ]
+
+    def _mapped(self) -> _MappedRecords:
+        return _MappedRecords(self.records_file)
+
+    @staticmethod
+    def _day_at(view: memoryview, index: int) -> date:
+        return EPOCH + timedelta(
+            days=struct.unpack_from("<i", view, index * RECORD.size)[0]
+        )
+
+    @staticmethod
+    def _bisect(view: memoryview, day: int) -> int:
+        """Index of the first record with day >= `day`"""
+        low, high = 0, len(view) // RECORD.size
+        while low < high:
+            mid = (low + high) // 2
+            if struct.unpack_from("<i", view, mid * RECORD.size)[0] < day:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+
+class _MappedRecords:
+    """Context manager providing a read-only memoryview of the records file"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.mapping: Optional[mmap.mmap] = None
+        self.view: Optional[memoryview] = None
+
+    def __enter__(self) -> Optional[memoryview]:
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
+            return None
+        with open(self.filename, "rb") as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mapping)
+        return self.view
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self.view is not None:
+            self.view.release()
+        if self.mapping is not None:
+            self.mapping.close()
+
+
+def fetch_solver_day(dune: DuneAPI, day: date) -> list[SolverDay]:
+    """Fetches slippage, reimbursements and rewards of all solvers for a single day"""
+    period = AccountingPeriod(day.strftime("%Y-%m-%d"), length_days=1)
+    slippages = get_period_slippage(dune, period)
+    names = {}
+    values: dict[Address, list[int]] = {}
+    for slippage in slippages.negative + slippages.positive:
+        names[slippage.solver_address] = slippage.solver_name
+        values.setdefault(slippage.solver_address, [0, 0, 0])[0] += slippage.amount_wei
+    for transfer in get_reimbursements(dune, period):
+        column = 1 if transfer.token_type == TokenType.NATIVE else 2
+        values.setdefault(transfer.receiver, [0, 0, 0])[column] += to_wei(
+            transfer.amount
+        )
+    return [
+        SolverDay(day, solver, names.get(solver, ""), *amounts)
+        for solver, amounts in sorted(values.items(), key=lambda item: str(item[0]))
+    ]
+
+
+def _fingerprints(history: SolverHistory) -> FingerprintStore:
+    return FingerprintStore(os.path.join(history.path, "fingerprints.json"))
+
+
+def _days(start: date, end: date) -> AccountingPeriod:
+    return AccountingPeriod(start.strftime("%Y-%m-%d"), length_days=(end - start).days)
+
+
+def ingest(dune: DuneAPI, history: SolverHistory, start: date, end: date) -> None:
+    """Fetches and appends every day start <= day < end not yet in the store"""
+    last = history.last_day()
+    day = start if last is None else max(start, last + timedelta(days=1))
+    if day >= end:
+        return
+    # Fingerprinted before fetching, so that later changes are never missed
+    fingerprints = get_day_fingerprints(dune, _days(day, end))
+    while day < end:
+        history.append(day, fetch_solver_day(dune, day))
+        print(f"ingested solver history for {day}")
+        day += timedelta(days=1)
+    _fingerprints(history).update(fingerprints)
+
+
+def refresh(
+    dune: DuneAPI, history: SolverHistory, start: date, end: date
+) -> list[date]:
+    """
+    Re-fetches the stored days start <= day < end whose data has changed since they
+    were fetched (i.e. whose fingerprint differs) and returns them.
+    """
+    last = history.last_day()
+    if last is None:
+        return []
+    end = min(end, last + timedelta(days=1))
+    if start >= end:
+        return []
+    fingerprints = get_day_fingerprints(dune, _days(start, end))
+    store = _fingerprints(history)
+    changed = store.changed(fingerprints)
+    for day in changed:
+        history.replace(day, fetch_solver_day(dune, day))
+        print(f"refreshed solver history for {day}")
+    store.update(fingerprints)
+    return changed
+
+
+def print_report(records: list[SolverDay]) -> None:
+    """Prints history records as a table of ETH/COW amounts"""
+    print(
+        f"{'day':<12}{'solver':<44}{'name':<16}{'slippage':>12}{'eth':>12}{'cow':>12}"
+    )
+    for rec in records:
+        print(
+            f"{str(rec.day):<12}{str(rec.solver):<44}{rec.solver_name[:15]:<16}"
+            f"{rec.slippage_wei / 10 ** 18:>12.5f}"
+            f"{rec.reimbursement_wei / 10 ** 18:>12.5f}"
+            f"{rec.reward_wei / 10 ** 18:>12.0f}"
+        )
+
+
+def _parse_date(date_str: str) -> date:
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Solver History")
+    parser.add_argument("command", choices=["ingest", "refresh", "report"])
+    parser.add_argument("--start", type=_parse_date, required=True)
+    parser.add_argument("--end", type=_parse_date, required=True)
+    parser.add_argument("--solver", type=Address, default=None)
+    parser.add_argument(
+        "--rollup", type=Rollup, choices=list(Rollup), default=Rollup.DAY
+    )
+    args = parser.parse_args()
+
+    solver_history = SolverHistory()
+    if args.command in ("ingest", "refresh"):
+        from src.scheduler import DuneScheduler  # pylint: disable=ungrouped-imports
+
+        update = ingest if args.command == "ingest" else refresh
+        update(
+            DuneScheduler.new_from_environment(), solver_history, args.start, args.end
+        )
+    else:
+        print_report(
+            solver_history.rollup(args.start, args.end, args.rollup, args.solver)
+        )
@@ -3,37 +3,130 @@ Common location for shared resources throughout the project.
 """
 from __future__ import annotations
 
+import itertools
+import os
 import re
+import threading
+import weakref
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
 
-from web3 import Web3
+from duneapi.types import DuneQuery, Network, QueryParameter
+
+from src.file_io import FILE_OUT_PATH
+
+
+def _checksum(address: str) -> str:
+    """Check-summed format of a (valid, lower case) address"""
+    # web3 takes most of a second to import, so it is only loaded once needed.
+    # pylint: disable=import-outside-toplevel
+    from web3 import Web3
+
+    return str(Web3.toChecksumAddress(address))
 
 
 # pylint: disable=too-few-public-methods
+class _AddressBook:
+    """
+    Process-wide dictionary of all addresses in use: each distinct address is assigned
+    an integer id (in order of first appearance) and a single Address instance.
+    Addresses are held weakly, i.e. dropped once no longer referenced anywhere (e.g.
+    those of a served request), so that the book does not grow with every input seen.
+    """
+
+    def __init__(self) -> None:
+        self.by_hex: weakref.WeakValueDictionary[
+            str, Address
+        ] = weakref.WeakValueDictionary()
+        self.by_id: weakref.WeakValueDictionary[
+            int, Address
+        ] = weakref.WeakValueDictionary()
+        # Ids are never reused, so that no two addresses alive share one
+        self.next_id = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.by_hex)
+
+
+_ADDRESS_BOOK = _AddressBook()
+
+
 class Address:
     """
     Class representing Ethereum Address as a hexadecimal string of length 42.
     The string must begin with '0x' and the other 40 characters
     are digits 0-9 or letters a-f. Upon creation (from string) addresses
-    are validated and stored in their check-summed format.
+    are validated and dictionary-encoded: every distinct address is a single
+    (interned) instance with an integer `id`, by which it is compared and hashed,
+    so that records are grouped, joined and indexed on integers rather than strings.
+    The check-summed format is only computed once needed (e.g. for output).
     """
 
-    def __init__(self, address: str):
-        if Address._is_valid(address):
-            self.address: str = Web3.toChecksumAddress(address)
-        else:
+    __slots__ = ("id", "hex", "_checksummed", "__weakref__")
+
+    id: int
+    # Lower case hexadecimal string (with 0x prefix)
+    hex: str
+    _checksummed: Optional[str]
+
+    def __new__(cls, address: str) -> Address:
+        book = _ADDRESS_BOOK
+        key = address.lower()
+        instance = book.by_hex.get(key)
+        if instance is not None:
+            return instance
+        if not Address._is_valid(address):
             raise ValueError(f"Invalid Ethereum Address {address}")
+        if not key.startswith("0x"):
+            return cls("0x" + key)
+        with book.lock:
+            instance = book.by_hex.get(key)
+            if instance is None:
+                instance = super().__new__(cls)
+                instance.id = next(book.next_id)
+                instance.hex = key
+                instance._checksummed = None
+                book.by_id[instance.id] = instance
+                book.by_hex[key] = instance
+            return instance
+
+    def __reduce__(self) -> tuple[type[Address], tuple[str]]:
+        # Ids are only valid within a process, so addresses are pickled as strings
+        return Address, (self.hex,)
+
+    @classmethod
+    def from_id(cls, address_id: int) -> Address:
+        """The (still referenced) Address with integer id `address_id` of this process"""
+        return _ADDRESS_BOOK.by_id[address_id]
+
+    @classmethod
+    def from_checksum(cls, address: str) -> Address:
+        """
+        Constructs an Address from a check-summed string (e.g. of a registry file).
+        Its case is not trusted, as it would change `str` of every holder of the
+        (interned) address: the checksum is computed (once per address) when needed.
+        """
+        return cls(address)
+
+    @property
+    def address(self) -> str:
+        """Check-summed format of the address"""
+        if self._checksummed is None:
+            self._checksummed = _checksum(self.hex)
+        return self._checksummed
 
     def __str__(self) -> str:
-        return str(self.address)
+        return self.address
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, Address):
-            return self.address == other.address
+            return self.id == other.id
         return False
 
     def __hash__(self) -> int:
-        return self.address.__hash__()
+        return self.id
 
     @classmethod
     def zero(cls) -> Address:
@@ -51,6 +144,8 @@ class Address:
 class AccountingPeriod:
     """Class handling the date arithmetic and string conversions for date intervals"""
 
+    __slots__ = ("start", "end")
+
     def __init__(self, start: str, length_days: int = 7):
         self.start = datetime.strptime(start, "%Y-%m-%d")
         self.end = self.start + timedelta(days=length_days)
@@ -59,3 +154,103 @@ class AccountingPeriod:
         return "-to-".join(
             [self.start.strftime("%Y-%m-%d"), self.end.strftime("%Y-%m-%d")]
         )
+
+
+# Sub queries of the USD `price` of the native token at the end of an accounting period
+# (cf. `native_token_price_query`): ETH from Dune's layer 1 price feed, and where
+# there is none the dex price of the wrapped native token (cf. `end_prices`).
+LAYER1_ETH_PRICE = """select price
+    from prices."layer1_usd_eth"
+    where minute = '{{EndTime}}'"""
+WRAPPED_NATIVE_TOKEN_END_PRICE = """select price
+    from end_prices
+    where contract_address = '{{WrappedNativeToken}}'"""
+
+
+@dataclass(frozen=True)
+class NetworkConfig:
+    """Network specific deployment details of the protocol"""
+
+    network: Network
+    settlement_contract: Address
+    wrapped_native_token: Address
+    cow_token: Address
+    # Symbol of the native token, in which solvers are reimbursed
+    native_symbol: str
+    # Sub query of the native token's USD price, in which slippage is converted
+    native_price_query: str
+
+    def __str__(self) -> str:
+        return self.network.name.lower()
+
+    def query_id(self) -> int:
+        """
+        Dune query used for executions on this network. A network specific
+        DUNE_QUERY_ID_<NETWORK> allows several networks to be queried at the same time,
+        otherwise all networks share the DUNE_QUERY_ID.
+        """
+        return int(
+            os.environ.get(
+                f"DUNE_QUERY_ID_{self.network.name}", os.environ["DUNE_QUERY_ID"]
+            )
+        )
+
+    def node_url(self) -> str:
+        """JSON-RPC endpoint of a node of this network (NODE_URL_<NETWORK>)"""
+        return os.environ[f"NODE_URL_{self.network.name}"]
+
+    def dune_query(
+        self, name: str, raw_sql: str, parameters: list[QueryParameter]
+    ) -> DuneQuery:
+        """Constructs a DuneQuery to be executed on this network"""
+        return DuneQuery(
+            name=name,
+            raw_sql=raw_sql,
+            network=self.network,
+            parameters=parameters,
+            query_id=self.query_id(),
+        )
+
+    def out_path(self) -> str:
+        """Directory for all output (and caches) of this network"""
+        return os.path.join(FILE_OUT_PATH, str(self))
+
+    @staticmethod
+    def bytea(address: Address) -> str:
+        """Dune (postgres) bytea string literal representation of address"""
+        return "\\x" + address.hex[2:]
+
+
+NETWORKS = {
+    config.network: config
+    for config in [
+        NetworkConfig(
+            network=Network.MAINNET,
+            settlement_contract=Address.from_checksum(
+                "0x9008D19f58AAbD9eD0D60971565AA8510560ab41"
+            ),
+            wrapped_native_token=Address.from_checksum(
+                "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+            ),
+            cow_token=Address.from_checksum(
+                "0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB"
+            ),
+            native_symbol="ETH",
+            native_price_query=LAYER1_ETH_PRICE,
+        ),
+        NetworkConfig(
+            network=Network.GCHAIN,
+            settlement_contract=Address.from_checksum(
+                "0x9008D19f58AAbD9eD0D60971565AA8510560ab41"
+            ),
+            wrapped_native_token=Address.from_checksum(
+                "0xe91D153E0b41518A2Ce8Dd3D7944Fa863463a97d"
+            ),
+            cow_token=Address.from_checksum(
+                "0x177127622c4A00F3d409B75571e12cB3c8973d3c"
+            ),
+            native_symbol="xDAI",
+            native_price_query=WRAPPED_NATIVE_TOKEN_END_PRICE,
+        ),
+    ]
+}
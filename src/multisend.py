@@ -0,0 +1,115 @@
+"""
+Splits the CSV Airdrop transfers into multisend chunks within a gas budget.
+
+The CSV Airdrop app executes all transfers of a file in a single Safe multisend
+transaction. As the number of solvers grows, this transaction approaches the block gas
+limit and becomes expensive to simulate and sign, so transfers are planned into chunks
+of estimated gas below a configurable budget. The transfers of a solver always stay in
+the same chunk, and chunks are filled in order of receiver, so the plan is deterministic.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+
+from src.fetch.transfer_file import TokenType, Transfer
+from src.file_io import File, write_to_csv
+from src.models import AccountingPeriod
+
+# A third of the current 30M block gas limit
+DEFAULT_GAS_BUDGET = 10_000_000
+
+
+@dataclass(frozen=True)
+class GasModel:
+    """Conservative gas estimates of a Safe multisend transaction"""
+
+    # Intrinsic transaction gas, Safe signature checks and the MultiSend delegate call
+    base: int = 80_000
+    # Call with value to a cold account (incl. calldata of the encoded multisend entry)
+    native: int = 13_000
+    # ERC20 transfer to a receiver without prior balance (zero to non-zero storage)
+    # on a cold token contract (incl. calldata of the encoded multisend entry)
+    erc20: int = 40_000
+
+    def transfer(self, transfer: Transfer) -> int:
+        """Estimated gas of including `transfer` in a multisend"""
+        return self.native if transfer.token_type == TokenType.NATIVE else self.erc20
+
+
+@dataclass
+class Chunk:
+    """Transfers executed in one multisend transaction"""
+
+    transfers: list[Transfer] = field(default_factory=list)
+    estimated_gas: int = 0
+
+    def native_total(self) -> float:
+        """Total amount of native token transferred"""
+        return sum(t.amount for t in self.transfers if t.token_type == TokenType.NATIVE)
+
+    def erc20_totals(self) -> dict[str, float]:
+        """Total amount transferred per ERC20 token"""
+        totals: dict[str, float] = {}
+        for transfer in self.transfers:
+            if transfer.token_type == TokenType.ERC20:
+                token = str(transfer.token_address)
+                totals[token] = totals.get(token, 0.0) + transfer.amount
+        return totals
+
+
+def plan_multisend(
+    transfers: list[Transfer],
+    gas_budget: int = DEFAULT_GAS_BUDGET,
+    gas_model: GasModel = GasModel(),
+) -> list[Chunk]:
+    """Splits `transfers` into chunks of estimated gas at most `gas_budget`"""
+    by_receiver: dict[str, list[Transfer]] = {}
+    for transfer in transfers:
+        by_receiver.setdefault(str(transfer.receiver), []).append(transfer)
+
+    chunks: list[Chunk] = []
+    for receiver in sorted(by_receiver):
+        group = by_receiver[receiver]
+        gas = sum(gas_model.transfer(t) for t in group)
+        if gas_model.base + gas > gas_budget:
+            raise ValueError(
+                f"Transfers to {receiver} need {gas_model.base + gas} gas, "
+                f"exceeding the budget of {gas_budget}"
+            )
+        if not chunks or chunks[-1].estimated_gas + gas > gas_budget:
+            chunks.append(Chunk(estimated_gas=gas_model.base))
+        chunks[-1].transfers.extend(group)
+        chunks[-1].estimated_gas += gas
+    return chunks
+
+
+def write_multisend_files(
+    chunks: list[Chunk], period: AccountingPeriod, out_path: str, gas_budget: int
+) -> str:
+    """
+    Writes one CSV Airdrop file per chunk and a manifest with per chunk totals.
+    Returns the path of the manifest.
+    """
+    manifest = []
+    for index, chunk in enumerate(chunks, start=1):
+        name = f"transfers-{period}-{index}-of-{len(chunks)}.csv"
+        write_to_csv(data_list=chunk.transfers, outfile=File(name=name, path=out_path))
+        manifest.append(
+            {
+                "file": name,
+                "transfers": len(chunk.transfers),
+                "estimated_gas": chunk.estimated_gas,
+                "native_total": chunk.native_total(),
+                "erc20_totals": chunk.erc20_totals(),
+            }
+        )
+    manifest_file = os.path.join(out_path, f"transfers-{period}-manifest.json")
+    with open(manifest_file, "w", encoding="utf-8") as file:
+        json.dump(
+            {"period": str(period), "gas_budget": gas_budget, "chunks": manifest},
+            file,
+            indent=2,
+        )
+    return manifest_file
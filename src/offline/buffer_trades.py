@@ -0,0 +1,197 @@
+"""
+Local (re)computation of internal buffer trades and solver slippage from an ImbalanceTable.
+
+This mirrors the `buffer_trades` and `results` tables of queries/period_slippage.sql,
+but with the classification rules as parameters, so that alternative thresholds,
+buffer trading solvers and token lists can be evaluated in seconds without any
+further Dune executions.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.fetch.imbalances import Imbalance, ImbalanceTable
+from src.fetch.period_slippage import SolverSlippage, SplitSlippages, TxSlippage
+from src.models import Address
+from src.registry import INTERNAL_BUFFER_TRADER_SOLVERS
+
+
+@dataclass(frozen=True)
+class BufferTradeRules:
+    """Parameters of the internal buffer trade classification"""
+
+    # Maximal relative value deviation of matched imbalances
+    matchability_threshold: float = 0.025
+    # Minimal USD value of imbalances matched via USD (rather than clearing) prices
+    min_usd_value: float = 10.0
+    buffer_trader_solvers: frozenset[str] = INTERNAL_BUFFER_TRADER_SOLVERS
+    # Tokens the protocol is willing to hold. Defaults to the table's token list.
+    allowed_tokens: Optional[frozenset[str]] = None
+    # Changes applied on top of the allowed tokens
+    added_tokens: frozenset[str] = frozenset()
+    removed_tokens: frozenset[str] = frozenset()
+
+    def allowed(self, token_list: list[str]) -> frozenset[str]:
+        """Tokens eligible for buffer trading given the `token_list` of the table"""
+        base = self.allowed_tokens
+        if base is None:
+            base = frozenset(token_list)
+        return (base | self.added_tokens) - self.removed_tokens
+
+
+def _matchability(value_a: float, value_b: float) -> Optional[float]:
+    total = abs(value_a) + abs(value_b)
+    if total == 0:
+        return None
+    return abs((value_a + value_b) / total)
+
+
+def is_buffer_trade(
+    first: Imbalance,
+    second: Imbalance,
+    rules: BufferTradeRules,
+    allowed: frozenset[str],
+) -> bool:
+    """Whether the pair of imbalances (of the same tx) is classified as internal trade"""
+    if first.token == second.token:
+        return False
+    if not (
+        (first.amount > 0 > second.amount and first.token in allowed)
+        or (second.amount > 0 > first.amount and second.token in allowed)
+    ):
+        return False
+    if not (first.solver_name in rules.buffer_trader_solvers or first.dex_swaps == 0):
+        return False
+    if first.clearing_value is not None and second.clearing_value is not None:
+        match = _matchability(first.clearing_value, second.clearing_value)
+        return match is not None and match < rules.matchability_threshold
+    if first.usd_value is not None and second.usd_value is not None:
+        match = _matchability(first.usd_value, second.usd_value)
+        return (
+            match is not None
+            and match < rules.matchability_threshold
+            and abs(first.usd_value) > rules.min_usd_value
+        )
+    return False
+
+
+def _net_amounts(imbalances: list[Imbalance]) -> dict[str, int]:
+    # A token may have several rows per tx (e.g. native and wrapped native transfers)
+    amounts: dict[str, int] = defaultdict(int)
+    for imbalance in imbalances:
+        amounts[imbalance.token] += imbalance.amount
+    return amounts
+
+
+@dataclass
+class Recomputation:
+    """Internal trades and slippage resulting from a set of BufferTradeRules"""
+
+    # tx_hash -> list of (token, amount) the buffers provided in internal trades
+    internal_trades: dict[str, list[tuple[str, int]]] = field(default_factory=dict)
+    per_tx: list[TxSlippage] = field(default_factory=list)
+    # solver -> USD value of slippage
+    usd_per_solver: dict[tuple[str, str], float] = field(default_factory=dict)
+
+
+def recompute(
+    table: ImbalanceTable, rules: BufferTradeRules = BufferTradeRules()
+) -> Recomputation:
+    """Classifies internal buffer trades and values the remaining imbalances"""
+    allowed = rules.allowed(table.token_list)
+    result = Recomputation()
+    usd_per_solver: dict[tuple[str, str], float] = defaultdict(float)
+    by_tx: dict[str, list[Imbalance]] = defaultdict(list)
+    for imbalance in table.imbalances:
+        by_tx[imbalance.tx_hash].append(imbalance)
+    for tx_hash, imbalances in by_tx.items():
+        solver = (imbalances[0].solver_address, imbalances[0].solver_name)
+        balance = _net_amounts(imbalances)
+        for first in imbalances:
+            for second in imbalances:
+                if is_buffer_trade(first, second, rules, allowed):
+                    # Every matching pair books the imbalance as internal trade,
+                    # exactly as the (full outer) self join of the query does.
+                    balance[first.token] -= first.amount
+                    result.internal_trades.setdefault(tx_hash, []).append(
+                        (first.token, -first.amount)
+                    )
+        priced = [
+            (amount, table.end_prices[token])
+            for token, amount in balance.items()
+            if token in table.end_prices
+        ]
+        if sum(amount for amount, _ in priced) == 0:
+            continue
+        usd_value = sum(
+            amount * price / 10**decimals for amount, (price, decimals) in priced
+        )
+        usd_per_solver[solver] += usd_value
+        result.per_tx.append(
+            TxSlippage(
+                tx_hash=tx_hash,
+                solver_address=Address(solver[0]),
+                solver_name=solver[1],
+                amount_wei=int(usd_value / table.eth_price * 10**18),
+            )
+        )
+    result.usd_per_solver = dict(usd_per_solver)
+    return result
+
+
+def split_slippages(
+    table: ImbalanceTable, recomputation: Recomputation
+) -> SplitSlippages:
+    """Per solver slippage (as returned by `get_period_slippage`) of a recomputation"""
+    results = SplitSlippages()
+    for (solver, name), usd_value in sorted(recomputation.usd_per_solver.items()):
+        results.append(
+            SolverSlippage(
+                solver_address=Address(solver),
+                solver_name=name,
+                amount_wei=int(usd_value / table.eth_price * 10**18),
+            )
+        )
+    return results
+
+
+@dataclass(frozen=True, slots=True)
+class SlippageDiff:
+    """Slippage of a solver under baseline and alternative rules"""
+
+    solver_address: Address
+    solver_name: str
+    baseline_wei: int
+    alternative_wei: int
+
+    @property
+    def delta_wei(self) -> int:
+        """Change of slippage from baseline to alternative"""
+        return self.alternative_wei - self.baseline_wei
+
+
+def diff_slippage(
+    baseline: SplitSlippages, alternative: SplitSlippages
+) -> list[SlippageDiff]:
+    """Per solver differences between two slippage results (unchanged solvers omitted)"""
+    names: dict[Address, str] = {}
+    amounts: dict[Address, list[int]] = defaultdict(lambda: [0, 0])
+    for column, slippages in enumerate([baseline, alternative]):
+        for slippage in slippages.negative + slippages.positive:
+            names[slippage.solver_address] = slippage.solver_name
+            amounts[slippage.solver_address][column] = slippage.amount_wei
+    diffs = [
+        SlippageDiff(solver, names[solver], *amounts[solver])
+        for solver in amounts
+        if amounts[solver][0] != amounts[solver][1]
+    ]
+    return sorted(diffs, key=lambda d: abs(d.delta_wei), reverse=True)
+
+
+def what_if(table: ImbalanceTable, rules: BufferTradeRules) -> list[SlippageDiff]:
+    """Solver slippage changes if `rules` were used instead of the default ones"""
+    baseline = split_slippages(table, recompute(table))
+    alternative = split_slippages(table, recompute(table, rules))
+    return diff_slippage(baseline, alternative)
@@ -0,0 +1,205 @@
+"""
+Local index of the clearing prices of settlements.
+
+The `clearing_prices` of queries/period_slippage.sql unnests the `tokens` and
+`clearingPrices` of every successful `GPv2Settlement_call_settle` of the period on every
+run. Here they are decoded from the settle() calldata of the settlement transactions
+(from a local dump of transactions or `eth_getTransactionByHash` of a node) once, and
+kept in a sqlite index by (tx_hash, token), from which the clearing values of
+imbalances are computed in bulk. As in the query, the native token placeholder is
+replaced by the wrapped native token and duplicate prices of a token are averaged.
+
+Only settlements calling settle() directly (rather than through another contract)
+are decoded from their calldata.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from dataclasses import replace
+from typing import ContextManager, Iterable, TYPE_CHECKING
+
+from src.fetch.imbalances import Imbalance, ImbalanceTable
+from src.file_io import FILE_OUT_PATH, sqlite_connection
+
+if TYPE_CHECKING:
+    from src.fetch.execution_costs import RpcClient
+
+# Function selector of GPv2Settlement.settle(tokens, clearingPrices, trades, interactions)
+SETTLE_SELECTOR = "0x13d79a0b"
+# Placeholder of the native token (e.g. ETH) in the tokens of a settlement
+NATIVE_TOKEN = "0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee"
+
+SCHEMA = """
+create table if not exists settlements (
+    tx_hash text primary key
+);
+create table if not exists clearing_prices (
+    tx_hash text    not null,
+    token   text    not null,
+    -- uint256 exceeds the integers of sqlite
+    price   text    not null,
+    primary key (tx_hash, token)
+);
+"""
+
+
+def _word(data: bytes, offset: int) -> int:
+    return int.from_bytes(data[offset : offset + 32], "big")
+
+
+def decode_settle(calldata: str) -> list[tuple[str, int]]:
+    """(token, clearing price) pairs of settle() `calldata` (in order of the call)"""
+    if not calldata.startswith(SETTLE_SELECTOR):
+        raise ValueError(f"Not a settle() call: {calldata[:10]}")
+    args = bytes.fromhex(calldata[len(SETTLE_SELECTOR) :])
+    # The arrays are encoded at the offsets of the first two (head) words
+    tokens_at, prices_at = _word(args, 0), _word(args, 32)
+    num_tokens, num_prices = _word(args, tokens_at), _word(args, prices_at)
+    if num_tokens != num_prices:
+        raise ValueError(f"{num_tokens} tokens, but {num_prices} clearing prices")
+    return [
+        (
+            "0x" + args[tokens_at + 32 * i + 12 : tokens_at + 32 * i + 32].hex(),
+            _word(args, prices_at + 32 * i),
+        )
+        for i in range(1, num_tokens + 1)
+    ]
+
+
+def clearing_prices(calldata: str, wrapped_native_token: str) -> dict[str, int]:
+    """
+    Clearing price per token of settle() `calldata`, with the native token as
+    `wrapped_native_token` and the (integer) average of duplicates.
+    """
+    prices: dict[str, list[int]] = {}
+    for token, price in decode_settle(calldata):
+        token = wrapped_native_token.lower() if token == NATIVE_TOKEN else token
+        prices.setdefault(token, []).append(price)
+    return {token: sum(values) // len(values) for token, values in prices.items()}
+
+
+def load_call_dump(filename: str) -> dict[str, str]:
+    """Calldata by tx hash of a dump of transactions (JSON list or one per line)"""
+    with open(filename, "r", encoding="utf-8") as file:
+        content = file.read().strip()
+    if content.startswith("["):
+        transactions = json.loads(content)
+    else:
+        transactions = [json.loads(line) for line in content.splitlines() if line]
+    return {tx["hash"].lower(): tx["input"] for tx in transactions}
+
+
+def fetch_calldata(client: RpcClient, tx_hashes: list[str]) -> dict[str, str]:
+    """Calldata by tx hash of the transactions `tx_hashes` (known to the node)"""
+    transactions = client.batch(
+        [("eth_getTransactionByHash", [tx_hash]) for tx_hash in tx_hashes]
+    )
+    return {tx["hash"].lower(): tx["input"] for tx in transactions if tx is not None}
+
+
+class ClearingPriceIndex:
+    """Clearing prices of settlements by (tx_hash, token) in a local sqlite database"""
+
+    def __init__(self, path: str = os.path.join(FILE_OUT_PATH, "clearing_prices.db")):
+        self.path = path
+        with sqlite_connection(path, SCHEMA):
+            pass
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        return sqlite_connection(self.path)
+
+    def add(self, prices: dict[str, dict[str, int]]) -> None:
+        """Stores the clearing prices per token of settlements by tx hash"""
+        with self._connect() as conn:
+            conn.executemany(
+                "insert or replace into settlements values (?)",
+                [(tx_hash,) for tx_hash in prices],
+            )
+            conn.executemany(
+                "insert or replace into clearing_prices values (?, ?, ?)",
+                [
+                    (tx_hash, token, str(price))
+                    for tx_hash, by_token in prices.items()
+                    for token, price in by_token.items()
+                ],
+            )
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, tx_hashes: Iterable[str]) -> None:
+        conn.execute("create temp table wanted (tx_hash text primary key)")
+        conn.executemany(
+            "insert or ignore into wanted values (?)", [(t,) for t in tx_hashes]
+        )
+
+    def missing(self, tx_hashes: Iterable[str]) -> list[str]:
+        """The settlements of `tx_hashes` not indexed yet"""
+        with self._connect() as conn:
+            self._select(conn, tx_hashes)
+            rows = conn.execute(
+                "select w.tx_hash from wanted w left join settlements s"
+                " on w.tx_hash = s.tx_hash where s.tx_hash is null order by 1"
+            )
+            return [row[0] for row in rows]
+
+    def prices(self, tx_hashes: Iterable[str]) -> dict[str, dict[str, int]]:
+        """Clearing prices per token of the (indexed) settlements `tx_hashes`"""
+        results: dict[str, dict[str, int]] = {}
+        with self._connect() as conn:
+            self._select(conn, tx_hashes)
+            rows = conn.execute(
+                "select c.tx_hash, c.token, c.price from clearing_prices c"
+                " join wanted w on c.tx_hash = w.tx_hash"
+            )
+            for tx_hash, token, price in rows:
+                results.setdefault(tx_hash, {})[token] = int(price)
+        return results
+
+
+def index_settlements(
+    index: ClearingPriceIndex, calldata: dict[str, str], wrapped_native_token: str
+) -> list[str]:
+    """
+    Decodes and indexes the settle() `calldata` of the settlements not indexed yet.
+    Returns the tx hashes that are not settle() calls (and hence not indexed).
+    """
+    prices: dict[str, dict[str, int]] = {}
+    skipped = []
+    for tx_hash in index.missing(calldata):
+        if calldata[tx_hash].startswith(SETTLE_SELECTOR):
+            prices[tx_hash] = clearing_prices(calldata[tx_hash], wrapped_native_token)
+        else:
+            skipped.append(tx_hash)
+    index.add(prices)
+    return skipped
+
+
+def index_from_node(
+    index: ClearingPriceIndex,
+    client: RpcClient,
+    tx_hashes: list[str],
+    wrapped_native_token: str,
+) -> list[str]:
+    """Indexes the settlements `tx_hashes` not indexed yet with calldata from a node"""
+    missing = index.missing(tx_hashes)
+    return index_settlements(
+        index, fetch_calldata(client, missing), wrapped_native_token
+    )
+
+
+def with_clearing_values(
+    table: ImbalanceTable, index: ClearingPriceIndex
+) -> ImbalanceTable:
+    """`table` with the clearing values of its imbalances from the (local) index"""
+    prices = index.prices(imb.tx_hash for imb in table.imbalances)
+    imbalances: list[Imbalance] = []
+    for imb in table.imbalances:
+        price = prices.get(imb.tx_hash, {}).get(imb.token)
+        imbalances.append(
+            replace(
+                imb,
+                clearing_value=float(imb.amount * price) if price is not None else None,
+            )
+        )
+    return replace(table, imbalances=imbalances)
@@ -0,0 +1,272 @@
+"""
+Local execution of the slippage and transfer queries on raw settlement data.
+
+`RawPeriod` holds the rows of the Dune tables the queries read (batches, trades,
+settlement contract transfers, clearing and token prices) for one accounting period,
+and the functions below compute from it what `get_period_slippage` and
+`get_transfers` fetch from Dune, following queries/period_slippage.sql and
+queries/period_transfers.sql step by step. This allows to run the accounting on
+synthetic data (cf. src/offline/synthetic.py) at volumes Dune has not seen yet.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+
+from src.fetch.imbalances import Imbalance, ImbalanceTable
+from src.fetch.period_slippage import SplitSlippages
+from src.fetch.transfer_file import Transfer, adjust_transfers, solver_reimbursements
+from src.models import Address
+from src.offline.buffer_trades import BufferTradeRules, recompute, split_slippages
+from src.offline.clearing_prices import NATIVE_TOKEN
+from src.utils.dataset import index_by
+
+# AXS (Old), whose transfer function does not align with its emitted transfer event
+EXCLUDED_TOKEN = "0xf5d669627376ebd411e34b98f19c868c8aba5ada"
+# WETH, the wrapped native token of mainnet
+MAINNET_WRAPPED_NATIVE_TOKEN = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+
+@dataclass(frozen=True, slots=True)
+class Batch:
+    """Row of gnosis_protocol_v2.view_batches"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    tx_hash: str
+    block_time: datetime
+    solver_address: str
+    solver_name: str
+    dex_swaps: int
+    num_trades: int
+    gas_used: int
+    gas_price_gwei: float
+    # Position of the settlement on chain
+    block_number: int = 0
+    tx_index: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Trade:
+    """Row of gnosis_protocol_v2.trades"""
+
+    tx_hash: str
+    trader: str
+    receiver: str
+    sell_token: str
+    buy_token: str
+    atoms_sold: int
+    atoms_bought: int
+
+
+@dataclass(frozen=True, slots=True)
+class TokenTransfer:
+    """Row of erc20.ERC20_evt_Transfer (from or to the settlement contract)"""
+
+    tx_hash: str
+    sender: str
+    receiver: str
+    token: str
+    amount: int
+
+
+@dataclass
+class RawPeriod:
+    """Raw settlement data of an accounting period (all addresses lower case hex)"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    settlement_contract: str
+    # Replaces the native token placeholder in transfers (as in the query)
+    wrapped_native_token: str = MAINNET_WRAPPED_NATIVE_TOKEN
+    batches: list[Batch] = field(default_factory=list)
+    trades: list[Trade] = field(default_factory=list)
+    transfers: list[TokenTransfer] = field(default_factory=list)
+    # tx_hash -> token -> clearing price of the settlement
+    clearing_prices: dict[str, dict[str, int]] = field(default_factory=dict)
+    # token -> USD price during the period (prices.usd)
+    usd_prices: dict[str, float] = field(default_factory=dict)
+    decimals: dict[str, int] = field(default_factory=dict)
+    symbols: dict[str, str] = field(default_factory=dict)
+    # token -> USD price at the end of the period (prices.prices_from_dex_data)
+    end_prices: dict[str, float] = field(default_factory=dict)
+    eth_price: float = 0.0
+    token_list: list[str] = field(default_factory=list)
+
+
+class TransferType(Enum):
+    """Classification of the rows of `batch_transfers`"""
+
+    IN_USER = "IN_USER"
+    OUT_USER = "OUT_USER"
+    IN_AMM = "IN_AMM"
+    OUT_AMM = "OUT_AMM"
+
+
+@dataclass(frozen=True, slots=True)
+class BatchTransfer:
+    """Row of `batch_transfers` (all addresses lower case hex)"""
+
+    tx_hash: str
+    sender: str
+    receiver: str
+    token: str
+    amount: int
+    transfer_type: TransferType
+
+
+def batch_transfers(
+    trades: list[Trade], token_transfers: list[TokenTransfer], contract: str
+) -> list[BatchTransfer]:
+    """
+    Trades as user transfers and the other transfers from or to `contract` as AMM
+    transfers, except for those from traders or to receivers of the period's trades.
+    """
+    results = []
+    for trade in trades:
+        results.append(
+            BatchTransfer(
+                trade.tx_hash,
+                trade.trader,
+                contract,
+                trade.sell_token,
+                trade.atoms_sold,
+                TransferType.IN_USER,
+            )
+        )
+        results.append(
+            BatchTransfer(
+                trade.tx_hash,
+                contract,
+                trade.receiver,
+                trade.buy_token,
+                trade.atoms_bought,
+                TransferType.OUT_USER,
+            )
+        )
+    traders_in = {trade.trader for trade in trades}
+    traders_out = {trade.receiver for trade in trades}
+    for transfer in token_transfers:
+        if transfer.sender in traders_in or transfer.receiver in traders_out:
+            continue
+        if transfer.receiver == contract:
+            transfer_type = TransferType.IN_AMM
+        elif transfer.sender == contract:
+            transfer_type = TransferType.OUT_AMM
+        else:
+            continue
+        results.append(
+            BatchTransfer(
+                transfer.tx_hash,
+                transfer.sender,
+                transfer.receiver,
+                transfer.token,
+                transfer.amount,
+                transfer_type,
+            )
+        )
+    return results
+
+
+def normalized_token(token: str, wrapped_native_token: str) -> str:
+    """`token`, with the native token placeholder as `wrapped_native_token`"""
+    return wrapped_native_token if token == NATIVE_TOKEN else token
+
+
+def _is_handled(batch: Batch) -> bool:
+    # Settlements without AMM interactions settling several trades are excluded,
+    # as the query does not account for them accurately.
+    return (batch.dex_swaps == 0 and batch.num_trades < 2) or batch.dex_swaps > 0
+
+
+def token_imbalances(raw: RawPeriod) -> dict[str, dict[str, int]]:
+    """Net amount per token the settlement contract received, per transaction"""
+    contract = raw.settlement_contract
+    batches = {batch.tx_hash: batch for batch in raw.batches}
+    excluded = {
+        trade.tx_hash
+        for trade in raw.trades
+        if EXCLUDED_TOKEN in (trade.sell_token, trade.buy_token)
+    }
+    imbalances: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for transfer in batch_transfers(raw.trades, raw.transfers, contract):
+        tx_hash = transfer.tx_hash
+        token = normalized_token(transfer.token, raw.wrapped_native_token)
+        if tx_hash in batches and tx_hash not in excluded:
+            if _is_handled(batches[tx_hash]):
+                if transfer.receiver == contract:
+                    imbalances[tx_hash][token] += transfer.amount
+                elif transfer.sender == contract:
+                    imbalances[tx_hash][token] -= transfer.amount
+    return imbalances
+
+
+def imbalance_table(raw: RawPeriod) -> ImbalanceTable:
+    """The ImbalanceTable `get_imbalance_table` would fetch for `raw`"""
+    batches = {batch.tx_hash: batch for batch in raw.batches}
+    imbalances = []
+    for tx_hash, amounts in token_imbalances(raw).items():
+        batch = batches[tx_hash]
+        clearing_prices = raw.clearing_prices.get(tx_hash, {})
+        for token, amount in amounts.items():
+            if amount == 0:
+                continue
+            price = raw.usd_prices.get(token)
+            clearing_price = clearing_prices.get(token)
+            imbalances.append(
+                Imbalance(
+                    tx_hash=tx_hash,
+                    dex_swaps=batch.dex_swaps,
+                    solver_address=batch.solver_address,
+                    solver_name=batch.solver_name,
+                    symbol=raw.symbols.get(token, token),
+                    token=token,
+                    amount=amount,
+                    clearing_value=float(amount * clearing_price)
+                    if clearing_price is not None
+                    else None,
+                    usd_value=amount / 10 ** raw.decimals[token] * price
+                    if price is not None and token in raw.decimals
+                    else None,
+                )
+            )
+    return ImbalanceTable(
+        imbalances=imbalances,
+        end_prices={
+            token: (price, raw.decimals[token])
+            for token, price in raw.end_prices.items()
+            if token in raw.decimals
+        },
+        eth_price=raw.eth_price,
+        token_list=raw.token_list,
+    )
+
+
+def period_slippage(
+    raw: RawPeriod, rules: BufferTradeRules = BufferTradeRules()
+) -> SplitSlippages:
+    """Per solver slippage as returned by `get_period_slippage`"""
+    table = imbalance_table(raw)
+    return split_slippages(table, recompute(table, rules))
+
+
+def reimbursements(raw: RawPeriod, cow_token: Address) -> list[Transfer]:
+    """ETH reimbursements and COW rewards as returned by `get_reimbursements`"""
+    eth_spent: dict[str, float] = defaultdict(float)
+    batch_count: dict[str, int] = defaultdict(int)
+    for batch in raw.batches:
+        eth_spent[batch.solver_address] += (
+            batch.gas_price_gwei * batch.gas_used / 10**9
+        )
+        batch_count[batch.solver_address] += 1
+    return solver_reimbursements(eth_spent, batch_count, cow_token)
+
+
+def transfers(raw: RawPeriod, cow_token: Address) -> list[Transfer]:
+    """Slippage adjusted transfers as returned by `get_transfers`"""
+    return adjust_transfers(
+        reimbursements(raw, cow_token),
+        index_by(period_slippage(raw).negative, "solver_address"),
+    )
@@ -0,0 +1,158 @@
+"""
+Ledger of the settlement contract's token buffers.
+
+Settlements are applied in block order with their token flows (user and AMM transfers
+in and out of the settlement contract, cf. `batch_transfers`), maintaining the running
+buffer balance of every token. The ledger is incremental (settlements of a new day are
+appended to the ones applied before) and answers, without aggregating all transfers
+again:
+  - the flows and imbalance of a transaction (O(1)),
+  - the buffer balance of a token after any block (O(log n)),
+  - the drift of a token's buffer between two blocks and the positions at period end.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from src.offline.engine import (
+    RawPeriod,
+    TransferType,
+    batch_transfers,
+    normalized_token,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class TokenFlows:
+    """Amounts of a token moved in and out of the settlement contract by a settlement"""
+
+    user_in: int = 0
+    user_out: int = 0
+    amm_in: int = 0
+    amm_out: int = 0
+
+    @property
+    def net(self) -> int:
+        """Change of the token's buffer (i.e. imbalance of the settlement)"""
+        return self.user_in + self.amm_in - self.user_out - self.amm_out
+
+
+@dataclass(frozen=True, slots=True)
+class Settlement:
+    """Token flows of a settlement transaction"""
+
+    tx_hash: str
+    block_number: int
+    tx_index: int
+    block_time: datetime
+    flows: dict[str, TokenFlows]
+
+    @property
+    def position(self) -> tuple[int, int]:
+        """Position on chain (several settlements may share a block)"""
+        return self.block_number, self.tx_index
+
+
+class BufferLedger:
+    """Running token buffer balances of the settlement contract, per settlement"""
+
+    def __init__(self) -> None:
+        self.settlements: list[Settlement] = []
+        self._blocks: list[int] = []
+        self._index: dict[str, int] = {}
+        # token -> positions (in self.settlements) of the settlements moving it and
+        # the token's buffer balance after each of them
+        self._positions: dict[str, list[int]] = defaultdict(list)
+        self._balances: dict[str, list[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.settlements)
+
+    def apply(self, settlement: Settlement) -> None:
+        """Appends `settlement`, which must not precede any applied before"""
+        if settlement.tx_hash in self._index:
+            raise ValueError(f"Settlement {settlement.tx_hash} already applied")
+        if self.settlements and settlement.position <= self.settlements[-1].position:
+            raise ValueError(
+                f"Settlement {settlement.tx_hash} at {settlement.position} does not "
+                f"succeed the last applied one at {self.settlements[-1].position}"
+            )
+        position = len(self.settlements)
+        self.settlements.append(settlement)
+        self._blocks.append(settlement.block_number)
+        self._index[settlement.tx_hash] = position
+        for token, flows in settlement.flows.items():
+            balances = self._balances[token]
+            self._positions[token].append(position)
+            balances.append((balances[-1] if balances else 0) + flows.net)
+
+    def flows(self, tx_hash: str) -> dict[str, TokenFlows]:
+        """Token flows of settlement `tx_hash`"""
+        return self.settlements[self._index[tx_hash]].flows
+
+    def imbalance(self, tx_hash: str) -> dict[str, int]:
+        """Net amount per token the settlement contract received in `tx_hash`"""
+        return {token: flows.net for token, flows in self.flows(tx_hash).items()}
+
+    def balance(self, token: str, block: Optional[int] = None) -> int:
+        """
+        Buffer balance of `token` (relative to the first applied settlement) after all
+        settlements until `block` (inclusive), or after all of them.
+        """
+        end = len(self._blocks) if block is None else bisect_right(self._blocks, block)
+        positions = self._positions.get(token, [])
+        count = bisect_right(positions, end - 1)
+        return self._balances[token][count - 1] if count > 0 else 0
+
+    def balance_after(self, token: str, tx_hash: str) -> int:
+        """Buffer balance of `token` right after settlement `tx_hash`"""
+        positions = self._positions.get(token, [])
+        count = bisect_right(positions, self._index[tx_hash])
+        return self._balances[token][count - 1] if count > 0 else 0
+
+    def drift(self, token: str, start: int, end: int) -> int:
+        """Change of the buffer of `token` by the settlements of blocks (start, end]"""
+        return self.balance(token, end) - self.balance(token, start)
+
+    def snapshot(self, block: Optional[int] = None) -> dict[str, int]:
+        """Buffer balances of all tokens after `block` (default: period end positions)"""
+        return {token: self.balance(token, block) for token in self._positions}
+
+
+def period_settlements(raw: RawPeriod) -> list[Settlement]:
+    """Token flows of every settlement of `raw`, in block order"""
+    amounts: dict[str, dict[str, dict[TransferType, int]]] = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(int))
+    )
+    for transfer in batch_transfers(raw.trades, raw.transfers, raw.settlement_contract):
+        token = normalized_token(transfer.token, raw.wrapped_native_token)
+        amounts[transfer.tx_hash][token][transfer.transfer_type] += transfer.amount
+    return [
+        Settlement(
+            tx_hash=batch.tx_hash,
+            block_number=batch.block_number,
+            tx_index=batch.tx_index,
+            block_time=batch.block_time,
+            flows={
+                token: TokenFlows(
+                    user_in=by_type[TransferType.IN_USER],
+                    user_out=by_type[TransferType.OUT_USER],
+                    amm_in=by_type[TransferType.IN_AMM],
+                    amm_out=by_type[TransferType.OUT_AMM],
+                )
+                for token, by_type in amounts[batch.tx_hash].items()
+            },
+        )
+        for batch in sorted(raw.batches, key=lambda b: (b.block_number, b.tx_index))
+    ]
+
+
+def apply_period(ledger: BufferLedger, raw: RawPeriod) -> BufferLedger:
+    """Applies the settlements of `raw` (e.g. of the next day) to `ledger`"""
+    for settlement in period_settlements(raw):
+        ledger.apply(settlement)
+    return ledger
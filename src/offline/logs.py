@@ -0,0 +1,108 @@
+"""
+Local decoding of ERC20 Transfer logs touching the settlement contract.
+
+The `other_transfers` part of queries/period_slippage.sql scans all of
+erc20."ERC20_evt_Transfer" for transfers from or to the settlement contract. Here the
+same rows are decoded from raw logs (as in receipts, `eth_getLogs` results or a local
+dump of either) into the `RawPeriod.transfers` of the offline engine, so that together
+with the trades of the period `batch_transfers` (and thereby the slippage) can be
+computed from node data alone.
+"""
+from __future__ import annotations
+
+import json
+from itertools import compress
+from typing import Any, Iterable, TYPE_CHECKING
+
+from src.models import Address
+from src.offline.engine import TokenTransfer
+
+if TYPE_CHECKING:
+    from src.fetch.execution_costs import RpcClient
+
+# keccak("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+def address_topic(address: Address) -> str:
+    """Topic of an indexed address parameter"""
+    return "0x" + str(address)[2:].lower().rjust(64, "0")
+
+
+def _topic_address(topic: str) -> str:
+    return "0x" + topic[-40:].lower()
+
+
+def decode_transfers(
+    logs: Iterable[dict[str, Any]], contract: Address
+) -> list[TokenTransfer]:
+    """
+    Decodes the ERC20 Transfer logs from or to `contract`.
+    Logs are matched column-wise on their topics, so that only matching logs are
+    decoded. ERC721 transfers (whose token id is indexed as fourth topic) are skipped.
+    """
+    logs = list(logs)
+    topics = [log["topics"] for log in logs]
+    contract_topic = address_topic(contract)
+    matches = [
+        len(t) == 3
+        and t[0] == TRANSFER_TOPIC
+        and contract_topic in (t[1].lower(), t[2].lower())
+        for t in topics
+    ]
+    return [
+        TokenTransfer(
+            tx_hash=log["transactionHash"],
+            sender=_topic_address(log["topics"][1]),
+            receiver=_topic_address(log["topics"][2]),
+            token=log["address"].lower(),
+            # Some tokens emit transfers (of nothing) with empty data
+            amount=int(log["data"].removeprefix("0x") or "0", 16),
+        )
+        for log in compress(logs, matches)
+    ]
+
+
+def load_log_dump(path: str) -> list[dict[str, Any]]:
+    """Logs of a local dump with one JSON log (or receipt with logs) per line"""
+    logs: list[dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            entry = json.loads(line)
+            logs.extend(entry["logs"] if "logs" in entry else [entry])
+    return logs
+
+
+def fetch_transfer_logs(
+    client: RpcClient,
+    contract: Address,
+    from_block: int,
+    to_block: int,
+    blocks_per_request: int = 2000,
+) -> list[dict[str, Any]]:
+    """Transfer logs from or to `contract` in the blocks [from_block, to_block)"""
+    contract_topic = address_topic(contract)
+    calls: list[tuple[str, list[Any]]] = [
+        (
+            "eth_getLogs",
+            [
+                {
+                    "topics": topics,
+                    "fromBlock": hex(start),
+                    "toBlock": hex(min(start + blocks_per_request, to_block) - 1),
+                }
+            ],
+        )
+        for start in range(from_block, to_block, blocks_per_request)
+        for topics in (
+            [TRANSFER_TOPIC, contract_topic],
+            [TRANSFER_TOPIC, None, contract_topic],
+        )
+    ]
+    # Transfers of the contract to itself match both filters
+    unique = {
+        (log["transactionHash"], log["logIndex"]): log
+        for logs in client.batch(calls)
+        for log in logs
+    }
+    return list(unique.values())
@@ -0,0 +1,149 @@
+"""
+Generator of synthetic but internally consistent raw settlement data (cf. RawPeriod).
+
+Every batch settles trades at uniform clearing prices. Trades are either routed through
+AMMs (whose returns deviate from the clearing price by some slippage) or, for a share
+of the batches, settled against the settlement contract's buffers (internal trades).
+Volumes, token and solver counts are configurable, so that the offline accounting
+can be load tested far beyond today's ~500-700 batches a day.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from src.offline.engine import Batch, RawPeriod, TokenTransfer, Trade
+from src.registry import INTERNAL_BUFFER_TRADER_SOLVERS
+
+SETTLEMENT_CONTRACT = "0x9008d19f58aabd9ed0d60971565aa8510560ab41"
+# Block of the start of a synthetic period, after which a block is mined every 12s
+START_BLOCK = 14_000_000
+BLOCK_SECONDS = 12
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    """Volume and shape of a synthetic accounting period"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    start: datetime = datetime(2022, 3, 1)
+    days: int = 7
+    batches_per_day: int = 600
+    num_tokens: int = 100
+    num_solvers: int = 15
+    max_trades_per_batch: int = 4
+    # Share of batches settling (some of) their trades against the buffers
+    internal_trade_share: float = 0.1
+    # Standard deviation of AMM execution relative to clearing prices
+    amm_slippage: float = 0.003
+    # Share of tokens on the allowed (buffer tradable) token list
+    allowed_token_share: float = 0.5
+    seed: int = 1
+
+
+def _address(rng: random.Random) -> str:
+    return f"0x{rng.getrandbits(160):040x}"
+
+
+def _clearing_price(usd_price: float, decimals: int) -> int:
+    # Price per atom, scaled to keep the integer precision of real clearing prices
+    return max(int(usd_price * 10 ** (36 - decimals)), 1)
+
+
+def generate(config: SyntheticConfig = SyntheticConfig()) -> RawPeriod:
+    """Generates the raw data of a synthetic accounting period"""
+    # pylint: disable=too-many-locals
+    rng = random.Random(config.seed)
+    raw = RawPeriod(settlement_contract=SETTLEMENT_CONTRACT)
+    tokens = [_address(rng) for _ in range(config.num_tokens)]
+    for index, token in enumerate(tokens):
+        raw.decimals[token] = rng.choice([6, 8, 18, 18, 18])
+        raw.usd_prices[token] = rng.lognormvariate(0, 2)
+        raw.end_prices[token] = raw.usd_prices[token] * rng.uniform(0.95, 1.05)
+        raw.symbols[token] = f"TOK{index}"
+    raw.eth_price = rng.uniform(1000, 4000)
+    raw.token_list = sorted(
+        rng.sample(tokens, int(config.allowed_token_share * len(tokens)))
+    )
+    buffer_traders = sorted(INTERNAL_BUFFER_TRADER_SOLVERS)
+    solvers = [
+        (_address(rng), buffer_traders[i] if i < len(buffer_traders) else f"Solver{i}")
+        for i in range(config.num_solvers)
+    ]
+    amms = [_address(rng) for _ in range(20)]
+    interval = timedelta(days=1) / config.batches_per_day
+    # Settlements per block so far (at high volumes blocks hold several)
+    block_counts: dict[int, int] = {}
+
+    for index in range(config.days * config.batches_per_day):
+        tx_hash = f"0x{rng.getrandbits(256):064x}"
+        solver, name = rng.choice(solvers)
+        internal = rng.random() < config.internal_trade_share
+        num_trades = rng.randint(1, config.max_trades_per_batch)
+        clearing_prices: dict[str, int] = {}
+        dex_swaps = 0
+        for _ in range(num_trades):
+            sell_token, buy_token = rng.sample(tokens, 2)
+            for token in (sell_token, buy_token):
+                clearing_prices[token] = _clearing_price(
+                    raw.usd_prices[token], raw.decimals[token]
+                )
+            usd_value = rng.lognormvariate(8, 1.5)
+            atoms_sold = max(
+                int(
+                    usd_value
+                    / raw.usd_prices[sell_token]
+                    * 10 ** raw.decimals[sell_token]
+                ),
+                1,
+            )
+            atoms_bought = (
+                atoms_sold * clearing_prices[sell_token] // clearing_prices[buy_token]
+            )
+            trader = _address(rng)
+            raw.trades.append(
+                Trade(
+                    tx_hash,
+                    trader,
+                    trader,
+                    sell_token,
+                    buy_token,
+                    atoms_sold,
+                    atoms_bought,
+                )
+            )
+            if internal and sell_token in raw.token_list:
+                continue
+            # Route the trade through an AMM, returning slightly more or less than due
+            amm = rng.choice(amms)
+            received = int(atoms_bought * (1 + rng.gauss(0, config.amm_slippage)))
+            raw.transfers.append(
+                TokenTransfer(tx_hash, SETTLEMENT_CONTRACT, amm, sell_token, atoms_sold)
+            )
+            raw.transfers.append(
+                TokenTransfer(tx_hash, amm, SETTLEMENT_CONTRACT, buy_token, received)
+            )
+            dex_swaps += 1
+        raw.clearing_prices[tx_hash] = clearing_prices
+        elapsed = index * interval
+        block_number = START_BLOCK + int(elapsed.total_seconds()) // BLOCK_SECONDS
+        tx_index = block_counts.get(block_number, 0)
+        block_counts[block_number] = tx_index + 1
+        raw.batches.append(
+            Batch(
+                tx_hash=tx_hash,
+                block_time=config.start
+                + (block_number - START_BLOCK) * timedelta(seconds=BLOCK_SECONDS),
+                solver_address=solver,
+                solver_name=name,
+                dex_swaps=dex_swaps,
+                num_trades=num_trades,
+                gas_used=100_000 + 80_000 * num_trades + 100_000 * dex_swaps,
+                gas_price_gwei=rng.uniform(20, 80),
+                block_number=block_number,
+                tx_index=tx_index,
+            )
+        )
+    return raw
@@ -0,0 +1,217 @@
+"""
+Minimal dependency-graph executor for multistep accounting workflows.
+
+Each `Stage` declares the stages whose results it consumes. Stages whose dependencies
+are satisfied run concurrently on a shared thread pool, and the result of every
+completed stage is persisted as a checkpoint, so that a failed or interrupted run can
+be resumed without repeating any of the work that had already succeeded.
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+
+# Resources are shared by all pipelines of the process (e.g. one per network)
+_RESOURCE_LOCKS: dict[str, threading.Lock] = {}
+_RESOURCE_LOCKS_GUARD = threading.Lock()
+
+
+def resource_lock(resource: str) -> threading.Lock:
+    """Returns the (process-wide) lock guarding `resource`"""
+    with _RESOURCE_LOCKS_GUARD:
+        return _RESOURCE_LOCKS.setdefault(resource, threading.Lock())
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A single step of a Pipeline.
+    `func` is called with the results of `deps` as keyword arguments (by stage name).
+    Stages sharing a `resource` (e.g. the Dune query they overwrite) never run at the
+    same time. Stages with `checkpoint=False` (e.g. writing output files) always rerun.
+    """
+
+    name: str
+    func: Callable[..., Any]
+    deps: tuple[str, ...] = ()
+    resource: Optional[str] = None
+    checkpoint: bool = True
+
+
+class Pipeline:
+    """Executes a dependency graph of Stages with persisted stage checkpoints"""
+
+    def __init__(self, stages: list[Stage], checkpoint_dir: str):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown {dep}")
+        self.order = self._topological_order()
+        self.checkpoint_dir = checkpoint_dir
+
+    def _topological_order(self) -> list[str]:
+        order: list[str] = []
+        state: dict[str, bool] = {}  # False while visiting, True when done
+
+        def visit(name: str) -> None:
+            if state.get(name) is False:
+                raise ValueError(f"Cyclic dependency involving stage {name}")
+            if name not in state:
+                state[name] = False
+                for dep in self.stages[name].deps:
+                    visit(dep)
+                state[name] = True
+                order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def ancestors(self, targets: list[str]) -> set[str]:
+        """Stages required for `targets` (including the targets themselves)"""
+        required: set[str] = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].deps)
+        return required
+
+    def _checkpoint_file(self, name: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{name}.pickle")
+
+    def is_complete(self, name: str) -> bool:
+        """Whether a checkpoint exists for stage `name`"""
+        return self.stages[name].checkpoint and os.path.exists(
+            self._checkpoint_file(name)
+        )
+
+    def _load(self, name: str) -> Any:
+        with open(self._checkpoint_file(name), "rb") as file:
+            return pickle.load(file)
+
+    def _save(self, name: str, result: Any) -> None:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # Write to a temporary file first so that a crash never leaves a partial checkpoint
+        tmp_file = self._checkpoint_file(name) + ".tmp"
+        with open(tmp_file, "wb") as file:
+            pickle.dump(result, file)
+        os.replace(tmp_file, self._checkpoint_file(name))
+
+    def invalidate(self, name: str) -> None:
+        """Removes checkpoints of stage `name` and of all stages depending on it"""
+        stale = {name}
+        for stage_name in self.order:
+            if stale.intersection(self.stages[stage_name].deps):
+                stale.add(stage_name)
+        for stage_name in stale:
+            if os.path.exists(self._checkpoint_file(stage_name)):
+                os.remove(self._checkpoint_file(stage_name))
+
+    def replace(self, name: str, result: Any) -> None:
+        """
+        Replaces the checkpoint of stage `name` by `result` (e.g. a patched result),
+        so that the stages depending on it are recomputed from it.
+        """
+        if not self.stages[name].checkpoint:
+            raise ValueError(f"Stage {name} is not checkpointed")
+        self.invalidate(name)
+        self._save(name, result)
+
+    def _execute(self, stage: Stage, results: dict[str, Any]) -> Any:
+        kwargs = {dep: results[dep] for dep in stage.deps}
+        if stage.resource is None:
+            return stage.func(**kwargs)
+        with resource_lock(stage.resource):
+            return stage.func(**kwargs)
+
+    def run(
+        self,
+        targets: Optional[list[str]] = None,
+        max_workers: int = 4,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> dict[str, Any]:
+        """
+        Runs (or resumes) all stages required for `targets` (default: all stages)
+        and returns the results of the targets by stage name.
+        Stages are executed on `executor` when provided (i.e. shared with other pipelines)
+        and otherwise on a new pool of `max_workers` threads.
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=max_workers) as own_executor:
+                return self.run(targets, executor=own_executor)
+
+        targets = targets if targets is not None else self.order
+        required = self.ancestors(targets)
+        # Only stages without checkpoint need to run, and of the completed stages
+        # only the ones consumed by those (or explicitly requested) need to be loaded.
+        to_run = {name for name in required if not self.is_complete(name)}
+        to_load = {
+            dep
+            for name in to_run
+            for dep in self.stages[name].deps
+            if dep not in to_run
+        }
+        results = {name: self._load(name) for name in to_load}
+        for name in targets:
+            if name not in to_run and name not in results:
+                results[name] = self._load(name)
+
+        self._run_stages(to_run, results, executor)
+        return {name: results[name] for name in targets}
+
+    def _run_stages(
+        self, to_run: set[str], results: dict[str, Any], executor: ThreadPoolExecutor
+    ) -> None:
+        """Runs stages `to_run` as soon as their dependencies are in `results`"""
+        error: Optional[BaseException] = None
+        running: dict[Future[Any], str] = {}
+        remaining = [name for name in self.order if name in to_run]
+        while (remaining and error is None) or running:
+            ready = [n for n in remaining if self._is_ready(n, results)]
+            for name in ready if error is None else []:
+                remaining.remove(name)
+                future = executor.submit(self._execute, self.stages[name], results)
+                running[future] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    # No new stages are started, but those already running are
+                    # allowed to finish (and checkpoint) before the error is raised.
+                    error = error or future.exception()
+                    continue
+                if self.stages[name].checkpoint:
+                    self._save(name, future.result())
+                results[name] = future.result()
+        if error is not None:
+            raise error
+
+    def _is_ready(self, name: str, results: dict[str, Any]) -> bool:
+        return all(dep in results for dep in self.stages[name].deps)
+
+
+def run_concurrently(
+    runs: list[tuple[Pipeline, list[str]]], max_workers: int = 8
+) -> list[dict[str, Any]]:
+    """
+    Runs several pipelines (with their respective targets) at the same time,
+    with all their stages sharing a single pool of `max_workers` threads.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as stage_executor:
+        # Drivers only wait for their stages, so they get threads of their own.
+        with ThreadPoolExecutor(max_workers=max(len(runs), 1)) as drivers:
+            futures = [
+                drivers.submit(pipeline.run, targets, executor=stage_executor)
+                for pipeline, targets in runs
+            ]
+            return [future.result() for future in futures]
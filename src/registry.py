@@ -0,0 +1,350 @@
+"""
+Locally cached reference data: solver address -> name & role and
+token address -> symbol & decimals.
+
+The registry of each network is stored in `out/<network>/registry` and synced
+incrementally from Dune (solvers in full, tokens for the days not yet synced). Its
+contents are injected into queries as VALUES tables (like the allowed token list),
+replacing the joins with `gnosis_protocol_v2.view_solvers` and `erc20.tokens`, and
+serve the Python side for decoding token amounts and solver names. Queries of an
+accounting period only get the tokens the settlement contract touched during it
+(cf. `Registry.for_period`).
+
+Usage:
+    python -m src.registry sync --until '2022-03-08' --network mainnet
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime
+from enum import Enum
+from typing import Optional, TYPE_CHECKING
+
+from duneapi.types import Network, QueryParameter
+from duneapi.util import open_query
+
+from src.models import AccountingPeriod, Address, NETWORKS
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+# Solvers whose settlements (with AMM interactions) may contain internal buffer trades.
+INTERNAL_BUFFER_TRADER_SOLVERS = frozenset(
+    {"DexCowAgg", "CowDexAg", "MIP", "Quasimodo", "QuasiModo"}
+)
+# Solver receiving the protocol fees withdrawn from the settlement contract
+WITHDRAW_SOLVER = "Withdraw"
+# Day from which tokens are synced into an empty registry (CoW Protocol launch)
+GENESIS = datetime(2021, 3, 1)
+
+
+class SolverRole(Enum):
+    """Role of a solver address in the accounting"""
+
+    SOLVER = "solver"
+    BUFFER_TRADER = "buffer_trader"
+    WITHDRAW = "withdraw"
+
+    @classmethod
+    def from_name(cls, name: str) -> SolverRole:
+        """Derives the role of a solver from its display name"""
+        if name == WITHDRAW_SOLVER:
+            return cls.WITHDRAW
+        if name in INTERNAL_BUFFER_TRADER_SOLVERS:
+            return cls.BUFFER_TRADER
+        return cls.SOLVER
+
+    def __str__(self) -> str:
+        return self.value
+
+
+@dataclass(frozen=True, slots=True)
+class SolverInfo:
+    """Registry entry of a solver"""
+
+    address: Address
+    name: str
+    role: SolverRole
+
+
+@dataclass(frozen=True, slots=True)
+class TokenInfo:
+    """
+    Registry entry of a token (address as lower case hex string), with the first and
+    last day the settlement contract touched it.
+    """
+
+    address: str
+    symbol: str
+    decimals: int
+    first_seen: date
+    last_seen: date
+
+    def seen_during(self, period: AccountingPeriod) -> bool:
+        """Whether the settlement contract touched the token (possibly) in `period`"""
+        return (
+            self.first_seen < period.end.date()
+            and self.last_seen >= period.start.date()
+        )
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _bytea(address: str) -> str:
+    return f"('\\{address.lower()[1:]}' :: bytea)"
+
+
+@dataclass
+class Registry:
+    """In-memory index of the solver and token registry of a network"""
+
+    path: str
+    solvers: dict[Address, SolverInfo] = field(default_factory=dict)
+    tokens: dict[str, TokenInfo] = field(default_factory=dict)
+    # Tokens are complete up to (excluding) this day
+    synced_until: Optional[datetime] = None
+
+    @classmethod
+    def load(
+        cls, network: Network = Network.MAINNET, path: Optional[str] = None
+    ) -> Registry:
+        """Reads the registry of `network` (empty if never synced)"""
+        if path is None:
+            path = os.path.join(NETWORKS[network].out_path(), "registry")
+        registry = cls(path)
+        if not os.path.exists(registry._file("state.json")):
+            return registry
+        with open(registry._file("solvers.csv"), "r", encoding="utf-8") as file:
+            for address, name, role in csv.reader(file):
+                registry.add_solver(
+                    SolverInfo(Address.from_checksum(address), name, SolverRole(role))
+                )
+        with open(registry._file("tokens.csv"), "r", encoding="utf-8") as file:
+            rows = list(csv.reader(file))
+        # Tokens stored without the days they were seen are synced anew
+        if any(len(row) != 5 for row in rows):
+            return cls(path, registry.solvers)
+        for address, symbol, decimals, first_seen, last_seen in rows:
+            registry.add_token(
+                TokenInfo(
+                    address,
+                    symbol,
+                    int(decimals),
+                    date.fromisoformat(first_seen),
+                    date.fromisoformat(last_seen),
+                )
+            )
+        with open(registry._file("state.json"), "r", encoding="utf-8") as file:
+            state = json.load(file)
+        if state["synced_until"] is not None:
+            registry.synced_until = datetime.fromisoformat(state["synced_until"])
+        return registry
+
+    def save(self) -> None:
+        """Writes the registry, replacing the previous version atomically per file"""
+        os.makedirs(self.path, exist_ok=True)
+        self._write_csv(
+            "solvers.csv",
+            [(str(s.address), s.name, str(s.role)) for s in self.solvers.values()],
+        )
+        self._write_csv(
+            "tokens.csv",
+            [
+                (t.address, t.symbol, t.decimals, t.first_seen, t.last_seen)
+                for t in self.tokens.values()
+            ],
+        )
+        # Written last: a crash before leaves the (complete) previous state in place
+        until = self.synced_until.isoformat() if self.synced_until else None
+        with open(self._file("state.json.tmp"), "w", encoding="utf-8") as file:
+            json.dump({"synced_until": until}, file)
+        os.replace(self._file("state.json.tmp"), self._file("state.json"))
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write_csv(self, name: str, rows: list[tuple[object, ...]]) -> None:
+        with open(self._file(name + ".tmp"), "w", encoding="utf-8") as file:
+            csv.writer(file, lineterminator="\n").writerows(rows)
+        os.replace(self._file(name + ".tmp"), self._file(name))
+
+    def add_solver(self, solver: SolverInfo) -> None:
+        """Adds or updates a solver"""
+        self.solvers[solver.address] = solver
+
+    def add_token(self, token: TokenInfo) -> None:
+        """Adds or updates a token, extending the days it was seen"""
+        known = self.tokens.get(token.address.lower())
+        if known is not None:
+            token = replace(
+                token,
+                first_seen=min(known.first_seen, token.first_seen),
+                last_seen=max(known.last_seen, token.last_seen),
+            )
+        self.tokens[token.address.lower()] = token
+
+    def for_period(self, period: AccountingPeriod) -> Registry:
+        """The registry restricted to the tokens seen during `period`"""
+        return Registry(
+            self.path,
+            self.solvers,
+            {a: t for a, t in self.tokens.items() if t.seen_during(period)},
+            self.synced_until,
+        )
+
+    def solver(self, address: Address) -> Optional[SolverInfo]:
+        """Registry entry of solver `address`"""
+        return self.solvers.get(address)
+
+    def token(self, address: str) -> Optional[TokenInfo]:
+        """Registry entry of token `address` (hex string, any case)"""
+        return self.tokens.get(address.lower())
+
+    def solvers_with_role(self, role: SolverRole) -> list[SolverInfo]:
+        """All solvers of `role`"""
+        return [s for s in self.solvers.values() if s.role == role]
+
+
+def _warn_fallback(registry: Registry, table: str) -> None:
+    print(
+        f"WARNING: registry {registry.path} is empty, joining {table} instead "
+        "(sync the registry first, cf. `python -m src.registry sync`)",
+        file=sys.stderr,
+    )
+
+
+def solver_registry_query(registry: Registry) -> str:
+    """
+    Constructs sub query `solver_registry` (address, name, role).
+    Falls back to `view_solvers` while the registry holds no solvers.
+    """
+    if not registry.solvers:
+        _warn_fallback(registry, 'gnosis_protocol_v2."view_solvers"')
+        roles = " ".join(
+            f"when name = {_sql_literal(solver)} then '{SolverRole.from_name(solver)}'"
+            for solver in sorted(INTERNAL_BUFFER_TRADER_SOLVERS | {WITHDRAW_SOLVER})
+        )
+        return (
+            "solver_registry as (select address, name, "
+            f"case {roles} else '{SolverRole.SOLVER}' end as role "
+            'from gnosis_protocol_v2."view_solvers"),'
+        )
+    values = ",".join(
+        f"({_bytea(str(s.address))}, {_sql_literal(s.name)}, '{s.role}')"
+        for s in registry.solvers.values()
+    )
+    return (
+        f"solver_registry as (select * from (VALUES {values}) "
+        "AS t (address, name, role)),"
+    )
+
+
+def token_registry_query(registry: Registry) -> str:
+    """
+    Constructs sub query `token_registry` (contract_address, symbol).
+    Falls back to `erc20.tokens` while the registry holds no tokens.
+    """
+    if not registry.tokens:
+        _warn_fallback(registry, "erc20.tokens")
+        return "token_registry as (select contract_address, symbol from erc20.tokens),"
+    values = ",".join(
+        f"({_bytea(t.address)}, {_sql_literal(t.symbol)})"
+        for t in registry.tokens.values()
+    )
+    return (
+        f"token_registry as (select * from (VALUES {values}) "
+        "AS t (contract_address, symbol)),"
+    )
+
+
+def registry_tables_query(registry: Registry) -> str:
+    """Sub queries of the solver and token registry (cf. `prepend_to_sub_query`)"""
+    return "\n".join([solver_registry_query(registry), token_registry_query(registry)])
+
+
+def sync_registry(
+    dune: DuneAPI,
+    network: Network = Network.MAINNET,
+    until: Optional[datetime] = None,
+    path: Optional[str] = None,
+) -> Registry:
+    """
+    Brings the local registry of `network` up to date until `until` (default: today)
+    and returns it. Only days not yet synced are queried for tokens.
+    """
+    registry = Registry.load(network, path)
+    until = until or datetime.combine(datetime.today(), datetime.min.time())
+    if registry.synced_until is not None and registry.synced_until >= until:
+        return registry
+    config = NETWORKS[network]
+    for rec in dune.fetch(
+        config.dune_query(
+            raw_sql=open_query("./queries/registry_solvers.sql"),
+            name="Solver Registry",
+            parameters=[],
+        )
+    ):
+        registry.add_solver(
+            SolverInfo(
+                Address(rec["address"]), rec["name"], SolverRole.from_name(rec["name"])
+            )
+        )
+    for rec in dune.fetch(
+        config.dune_query(
+            raw_sql=open_query("./queries/registry_tokens.sql"),
+            name="Token Registry",
+            parameters=[
+                QueryParameter.date_type("Since", registry.synced_until or GENESIS),
+                QueryParameter.date_type("Until", until),
+                QueryParameter.text_type(
+                    "SettlementContract", config.bytea(config.settlement_contract)
+                ),
+            ],
+        )
+    ):
+        registry.add_token(
+            TokenInfo(
+                rec["token"],
+                rec["symbol"],
+                int(rec["decimals"]),
+                date.fromisoformat(rec["first_seen"]),
+                date.fromisoformat(rec["last_seen"]),
+            )
+        )
+    registry.synced_until = until
+    registry.save()
+    return registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Solver & Token Registry")
+    parser.add_argument("command", choices=["sync"])
+    parser.add_argument(
+        "--until",
+        type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+        default=None,
+        help="Sync up to (excluding) this day (default: today)",
+    )
+    parser.add_argument(
+        "--network",
+        type=str,
+        choices=[str(config) for config in NETWORKS.values()],
+        default="mainnet",
+    )
+    args = parser.parse_args()
+
+    from src.scheduler import DuneScheduler  # pylint: disable=ungrouped-imports
+
+    selected = next(c.network for c in NETWORKS.values() if str(c) == args.network)
+    synced = sync_registry(DuneScheduler.new_from_environment(), selected, args.until)
+    print(
+        f"{len(synced.solvers)} solvers and {len(synced.tokens)} tokens "
+        f"synced until {synced.synced_until}"
+    )
@@ -0,0 +1,257 @@
+"""
+Execution scheduler in front of `DuneAPI.fetch`.
+
+Scripts, tests and backfills frequently request identical queries at the same time
+(e.g. the same slippage query for the transfer file and an investigation). The
+`DuneScheduler` coalesces such in-flight requests (same query, network, SQL and
+parameters) into a single execution, whose results are handed to every caller.
+Distinct executions are admitted through a priority queue, limited by the number of
+concurrent executions and the executions started per minute of the account, so that
+payout-critical queries are served ahead of exploratory ones.
+Since `DuneAPI.fetch` overwrites the query it executes, executions of the same query id
+are never in flight at the same time.
+Queue, execution (initiation to completion on Dune) and result download time of every
+execution are recorded in the local query telemetry (cf. src/telemetry.py).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Callable, Optional
+
+from duneapi.api import DuneAPI
+from duneapi.types import DuneQuery, DuneRecord
+
+from src.telemetry import Telemetry, query_template
+
+
+class Priority(IntEnum):
+    """Scheduling priority of an execution (lower values are served first)"""
+
+    CRITICAL = 0
+    DEFAULT = 1
+    EXPLORATORY = 2
+
+
+# Priorities by query name. Queries feeding the payout are critical.
+QUERY_PRIORITIES = {
+    "Accounting Period Totals": Priority.CRITICAL,
+    "Day Fingerprints": Priority.CRITICAL,
+    "ETH Reimbursement & COW Rewards": Priority.CRITICAL,
+    "Slippage Accounting": Priority.CRITICAL,
+    "Solver Registry": Priority.CRITICAL,
+    "Token Registry": Priority.CRITICAL,
+    "Slippage Accounting per Transaction": Priority.EXPLORATORY,
+    "Slippage Accounting Imbalances": Priority.EXPLORATORY,
+}
+
+
+def fingerprint(query: DuneQuery) -> str:
+    """Identifies executions with identical results"""
+    key = json.dumps(
+        [
+            query.query_id,
+            query.network.value,
+            query.raw_sql,
+            sorted((json.dumps(p.to_dict(), sort_keys=True) for p in query.parameters)),
+        ]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@dataclass
+class _Ticket:
+    """A (coalesced) execution waiting for admission"""
+
+    query: DuneQuery
+    priority: Priority
+    sequence: int
+    queued_at: float
+    result: Future[list[DuneRecord]] = field(default_factory=Future)
+
+    def sort_key(self) -> tuple[int, int]:
+        """Queue order: by priority, then first come first served"""
+        return self.priority, self.sequence
+
+
+class DuneScheduler(DuneAPI):
+    """DuneAPI whose `fetch` is coalesced, prioritized and rate limited"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        max_concurrent: int = 3,
+        max_per_minute: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+        *,
+        telemetry: Optional[Telemetry] = None,
+    ):
+        # pylint: disable=too-many-arguments
+        super().__init__(username, password)
+        self.telemetry = telemetry
+        self.max_concurrent = max_concurrent
+        self.max_per_minute = max_per_minute
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._in_flight: dict[str, _Ticket] = {}
+        self._waiting: list[_Ticket] = []
+        self._running_queries: set[int] = set()
+        self._started: deque[float] = deque()
+        self._sequence = 0
+        # Time the execution led by the current thread completed on Dune (if it did)
+        self._spans = threading.local()
+        # Number of fetch calls answered by another caller's execution
+        self.coalesced = 0
+
+    @staticmethod
+    def new_from_environment() -> DuneScheduler:
+        """Initialize & authenticate a Dune scheduler from the current environment"""
+        dune = DuneScheduler(
+            username=os.environ["DUNE_USER"],
+            password=os.environ["DUNE_PASSWORD"],
+            max_concurrent=int(os.environ.get("DUNE_MAX_CONCURRENT", 3)),
+            max_per_minute=int(os.environ.get("DUNE_MAX_PER_MINUTE", 10)),
+            telemetry=Telemetry(),
+        )
+        # As DuneAPI.new_from_environment: queries are initiated outside the retries
+        # of DuneAPI.fetch (which re-authenticate), so the first one needs a session.
+        dune.login()
+        dune.fetch_auth_token()
+        return dune
+
+    def fetch(
+        self, query: DuneQuery, priority: Optional[Priority] = None
+    ) -> list[DuneRecord]:
+        """
+        Executes `query` (unless an identical execution is already in flight)
+        and returns its results.
+        Priority defaults to the one of the query name (cf. QUERY_PRIORITIES).
+        """
+        if priority is None:
+            priority = QUERY_PRIORITIES.get(query.name, Priority.DEFAULT)
+        key = fingerprint(query)
+        with self._condition:
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.coalesced += 1
+                # A waiting execution is promoted to the highest priority requesting it
+                in_flight.priority = min(in_flight.priority, priority)
+                self._condition.notify_all()
+            else:
+                ticket = _Ticket(query, priority, self._sequence, self.clock())
+                self._sequence += 1
+                self._in_flight[key] = ticket
+                self._waiting.append(ticket)
+        if in_flight is not None:
+            return list(in_flight.result.result())
+        return list(self._lead(key, ticket))
+
+    def _lead(self, key: str, ticket: _Ticket) -> list[DuneRecord]:
+        """Waits for admission of `ticket`, then executes it for all its callers"""
+        try:
+            self._admit(ticket)
+            admitted_at = self.clock()
+            self._spans.completed_at = None
+            try:
+                records = self._execute(ticket.query)
+            except BaseException as err:
+                self._record(key, ticket, admitted_at, error=err)
+                raise
+            finally:
+                self._release(ticket)
+        except BaseException as err:
+            with self._condition:
+                del self._in_flight[key]
+            ticket.result.set_exception(err)
+            raise
+        self._record(key, ticket, admitted_at, records=records)
+        with self._condition:
+            del self._in_flight[key]
+        ticket.result.set_result(records)
+        return records
+
+    def _record(
+        self,
+        key: str,
+        ticket: _Ticket,
+        admitted_at: float,
+        *,
+        records: Optional[list[DuneRecord]] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """
+        Records queue, execution and result download time of `ticket` (if telemetry
+        is enabled). Executions failing before completion have no download time.
+        """
+        # pylint: disable=too-many-arguments
+        if self.telemetry is not None:
+            finished_at = self.clock()
+            completed_at = self._spans.completed_at
+            self.telemetry.record(
+                ticket.query,
+                fingerprint=key,
+                queue_seconds=admitted_at - ticket.queued_at,
+                execution_seconds=(completed_at or finished_at) - admitted_at,
+                results_seconds=finished_at - completed_at
+                if completed_at is not None
+                else None,
+                records=records,
+                error=error,
+                template=query_template(ticket.query),
+            )
+
+    def _execute(self, query: DuneQuery) -> list[DuneRecord]:
+        return super().fetch(query)
+
+    def query_result_id(self, query: DuneQuery) -> Optional[str]:
+        """As DuneAPI, marking the completion of the execution (cf. `get_results`)"""
+        result_id = super().query_result_id(query)
+        if result_id:
+            self._spans.completed_at = self.clock()
+        return result_id
+
+    def _admit(self, ticket: _Ticket) -> None:
+        with self._condition:
+            while True:
+                delay = self._rate_limit_delay()
+                if ticket is self._next() and delay == 0:
+                    break
+                self._condition.wait(timeout=delay if delay > 0 else None)
+            self._waiting.remove(ticket)
+            self._running_queries.add(ticket.query.query_id)
+            self._started.append(self.clock())
+            # The next ticket in line may be admissible now as well
+            self._condition.notify_all()
+
+    def _release(self, ticket: _Ticket) -> None:
+        with self._condition:
+            self._running_queries.discard(ticket.query.query_id)
+            self._condition.notify_all()
+
+    def _next(self) -> Optional[_Ticket]:
+        """The waiting ticket to be admitted next (None while at capacity)"""
+        if len(self._running_queries) >= self.max_concurrent:
+            return None
+        admissible = [
+            t for t in self._waiting if t.query.query_id not in self._running_queries
+        ]
+        return min(admissible, key=_Ticket.sort_key, default=None)
+
+    def _rate_limit_delay(self) -> float:
+        """Seconds until another execution may be started"""
+        now = self.clock()
+        while self._started and self._started[0] <= now - 60:
+            self._started.popleft()
+        if len(self._started) < self.max_per_minute:
+            return 0
+        return self._started[0] + 60 - now
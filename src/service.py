@@ -0,0 +1,317 @@
+"""
+Long-running HTTP service answering accounting questions from warm in-memory caches,
+e.g. for dashboards and reviewers, instead of a new process (with its imports, token
+list download and Dune execution) per question:
+
+    GET /<network>/<start>/totals
+    GET /<network>/<start>/slippage[?solver=<address>]
+    GET /<network>/<start>/transfers[?solver=<address>]
+    GET /<network>/<start>/transactions[/<tx_hash>][?solver=<address>]
+
+where <start> is the first day (YYYY-MM-DD) of the weekly accounting period.
+Results are computed by the accounting pipeline (so checkpoints of earlier runs are
+reused, unless the period's data has changed since) and kept in a bounded LRU cache
+for at most `--max-age` seconds, concurrent requests for the same result share a
+single computation, and responses carry an ETag for conditional requests.
+
+Usage:
+    python -m src.service --port 8080
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional, TypeVar, TYPE_CHECKING
+from urllib.parse import parse_qs, urlparse
+
+from duneapi.types import Network
+
+from src.models import AccountingPeriod, Address, NETWORKS
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+T = TypeVar("T")
+
+# Fetches the result of a pipeline stage (target) for a network and period
+Fetcher = Callable[[Network, AccountingPeriod, str], Any]
+
+# Resource of the API -> pipeline stage providing it
+TARGETS = {
+    "totals": "totals",
+    "slippage": "slippage",
+    "transfers": "transfers",
+    "transactions": "slippage_per_tx",
+}
+
+
+# Seconds results are served from memory, before the pipeline checks whether the
+# period's data has changed (cf. `run_networks`)
+DEFAULT_MAX_AGE = 3600.0
+
+
+class NotFound(Exception):
+    """Raised for requests of unknown resources"""
+
+
+class BadRequest(Exception):
+    """Raised for requests with invalid path or query arguments"""
+
+
+def _solver(value: str) -> str:
+    """Lower case hex of a solver address argument (not interned, cf. Address)"""
+    if not re.fullmatch(r"(0x)?[0-9a-f]{40}", value, flags=re.IGNORECASE):
+        raise ValueError(f"Invalid Ethereum Address {value}")
+    return "0x" + value.lower()[-40:]
+
+
+def _parse(parse: Callable[[str], T], value: str) -> T:
+    try:
+        return parse(value)
+    except ValueError as err:
+        raise BadRequest(str(err)) from err
+
+
+class LRUCache:
+    """
+    Bounded cache evicting the least recently used entry, and entries older than
+    `max_age` seconds (if given). Concurrent lookups of a missing key wait for a
+    single computation of its value.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_age: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.clock = clock
+        # key -> (value, time computed)
+        self._entries: OrderedDict[Any, tuple[Any, float]] = OrderedDict()
+        self._pending: dict[Any, Future[Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """The value of `key`, computed (only once) if not cached"""
+        with self._lock:
+            if key in self._entries:
+                value, computed = self._entries[key]
+                if self.max_age is None or self.clock() - computed < self.max_age:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                future: Future[Any] = Future()
+                self._pending[key] = future
+        if pending is not None:
+            return pending.result()
+        computed = self.clock()
+        try:
+            value = compute()
+        except BaseException as err:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = (value, computed)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def to_json(obj: Any) -> Any:
+    """JSON compatible representation of accounting results"""
+    if isinstance(obj, (Address, AccountingPeriod, Enum)):
+        return str(obj)
+    if is_dataclass(obj):
+        return {f.name: to_json(getattr(obj, f.name)) for f in fields(obj)}
+    if isinstance(obj, (list, tuple)):
+        return [to_json(item) for item in obj]
+    if isinstance(obj, int) and abs(obj) >= 2**53:
+        # Wei amounts exceed the integers JSON clients (i.e. javascript) can represent
+        return str(obj)
+    return obj
+
+
+def _matches_solver(row: Any, solver: Optional[str]) -> bool:
+    if solver is None:
+        return True
+    address = getattr(row, "solver_address", None) or getattr(row, "receiver", None)
+    return address is not None and address.hex == solver
+
+
+class AccountingService:
+    """Answers API requests from cached pipeline results"""
+
+    def __init__(
+        self,
+        fetch: Fetcher,
+        max_results: int = 32,
+        max_responses: int = 1024,
+        max_age: Optional[float] = DEFAULT_MAX_AGE,
+    ):
+        self.fetch = fetch
+        # Responses are derived from the results, so they expire together
+        self.results = LRUCache(max_results, max_age)
+        self.responses = LRUCache(max_responses, max_age)
+
+    @classmethod
+    def from_dune(cls, dune: DuneAPI, **kwargs: Any) -> AccountingService:
+        """Service computing results with the accounting pipeline"""
+        # pylint: disable=import-outside-toplevel,cyclic-import
+        from src.fetch.accounting import run_networks
+
+        def fetch(network: Network, period: AccountingPeriod, target: str) -> Any:
+            return run_networks(dune, period, [network], target)[network]
+
+        return cls(fetch, **kwargs)
+
+    def result(self, network: Network, start: str, resource: str) -> Any:
+        """Cached result of `resource` for the period starting on `start`"""
+        if resource not in TARGETS:
+            raise NotFound(f"Unknown resource {resource}")
+        period = _parse(AccountingPeriod, start)
+        return self.results.get(
+            (network, str(period), resource),
+            lambda: self.fetch(network, period, TARGETS[resource]),
+        )
+
+    def answer(self, path: str, query: str = "") -> tuple[bytes, str]:
+        """JSON body and ETag of the response to a GET request of `path`"""
+        body, etag = self.responses.get(
+            (path, query), lambda: self._answer(path, query)
+        )
+        return body, etag
+
+    def _answer(self, path: str, query: str) -> tuple[bytes, str]:
+        parts = [part for part in path.split("/") if part]
+        if len(parts) not in (3, 4):
+            raise NotFound(f"Unknown path {path}")
+        networks = {str(config): network for network, config in NETWORKS.items()}
+        if parts[0] not in networks:
+            raise NotFound(f"Unknown network {parts[0]}")
+        network, start, resource = networks[parts[0]], parts[1], parts[2]
+        solvers = parse_qs(query).get("solver")
+        solver = _parse(_solver, solvers[0]) if solvers else None
+
+        result = self.result(network, start, resource)
+        if resource == "slippage":
+            result = [
+                row
+                for row in result.negative + result.positive
+                if _matches_solver(row, solver)
+            ]
+        elif resource in ("transfers", "transactions"):
+            result = [row for row in result if _matches_solver(row, solver)]
+        if len(parts) == 4:
+            if resource != "transactions":
+                raise NotFound(f"Unknown path {path}")
+            result = [row for row in result if row.tx_hash == parts[3].lower()]
+            if not result:
+                raise NotFound(f"Unknown transaction {parts[3]}")
+            result = result[0]
+        body = json.dumps(to_json(result)).encode()
+        return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def make_handler(service: AccountingService) -> type[BaseHTTPRequestHandler]:
+    """Request handler class answering GET requests with `service`"""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Handles a single HTTP request"""
+
+        protocol_version = "HTTP/1.1"
+
+        # pylint: disable=invalid-name
+        def do_GET(self) -> None:
+            """Answers with the (cached) JSON result, or 304 if the ETag matches"""
+            url = urlparse(self.path)
+            try:
+                body, etag = service.answer(url.path, url.query)
+            except NotFound as err:
+                self._send(404, json.dumps({"error": str(err)}).encode())
+                return
+            except BadRequest as err:
+                self._send(400, json.dumps({"error": str(err)}).encode())
+                return
+            except Exception as err:  # pylint: disable=broad-except
+                # Failures of the pipeline (e.g. Dune or the node) are answered rather
+                # than dropping the client's connection.
+                self.log_error("Failed to answer %s: %r", self.path, err)
+                error = f"Internal error ({type(err).__name__})"
+                self._send(500, json.dumps({"error": error}).encode())
+                return
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", etag)
+            else:
+                self._send(200, body, etag)
+
+        def _send(self, status: int, body: bytes, etag: Optional[str] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def serve(service: AccountingService, host: str, port: int) -> ThreadingHTTPServer:
+    """HTTP server answering requests (each on its own thread) with `service`"""
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Accounting Service")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--max-results", type=int, default=32, help="Pipeline results kept in memory"
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE,
+        help="Seconds a result is kept in memory",
+    )
+    args = parser.parse_args()
+
+    from src.scheduler import DuneScheduler  # pylint: disable=ungrouped-imports
+
+    server = serve(
+        AccountingService.from_dune(
+            DuneScheduler.new_from_environment(),
+            max_results=args.max_results,
+            max_age=args.max_age,
+        ),
+        args.host,
+        args.port,
+    )
+    print(f"Serving accounting results on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,140 @@
+"""
+Shadow execution: runs a reference and a candidate implementation of the same
+accounting step on the same inputs, timing both and comparing their results per solver
+in exact wei, so that optimized code paths can be rolled out without risking payouts.
+
+The reference result is the one used, the candidate's only ever gets compared.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Generic, TypeVar
+
+from src.fetch.period_slippage import SplitSlippages
+from src.fetch.transfer_file import Transfer
+from src.models import Address
+from src.utils.units import to_wei
+
+T = TypeVar("T")
+
+# Default divergence (per row) still accepted as agreement. The candidate converts USD
+# values to wei with floats, summed in another order than on Dune, so differences of
+# a few ulp (i.e. far below a gwei on typical amounts) are expected rather than bugs.
+DEFAULT_TOLERANCE_WEI = 10**9
+
+
+class ShadowMismatch(Exception):
+    """Raised when the candidate diverges from the reference beyond tolerance"""
+
+
+@dataclass(frozen=True, slots=True)
+class Divergence:
+    """A row (e.g. solver or transfer) on which reference and candidate disagree"""
+
+    key: str
+    reference_wei: int
+    candidate_wei: int
+
+    @property
+    def delta_wei(self) -> int:
+        """Difference of the candidate to the reference"""
+        return self.candidate_wei - self.reference_wei
+
+
+@dataclass(frozen=True)
+class ShadowResult(Generic[T]):
+    """Results and latencies of both paths with their differences"""
+
+    reference: T
+    candidate: T
+    reference_seconds: float
+    candidate_seconds: float
+    divergences: list[Divergence]
+
+    def max_delta_wei(self) -> int:
+        """Largest absolute difference of any row"""
+        return max((abs(d.delta_wei) for d in self.divergences), default=0)
+
+    def check(self, tolerance_wei: int = DEFAULT_TOLERANCE_WEI) -> T:
+        """Returns the reference result, unless a divergence exceeds `tolerance_wei`"""
+        if self.max_delta_wei() > tolerance_wei:
+            raise ShadowMismatch(
+                f"{len(self.divergences)} rows diverge by up to "
+                f"{self.max_delta_wei()} wei (tolerance {tolerance_wei} wei)"
+            )
+        return self.reference
+
+    def report(self) -> str:
+        """Human readable summary of latencies and divergences"""
+        lines = [
+            f"reference: {self.reference_seconds:.2f}s, "
+            f"candidate: {self.candidate_seconds:.2f}s, "
+            f"{len(self.divergences)} divergences"
+        ]
+        for div in sorted(self.divergences, key=lambda d: -abs(d.delta_wei)):
+            lines.append(
+                f"  {div.key}: {div.reference_wei} != {div.candidate_wei} "
+                f"({div.delta_wei:+} wei)"
+            )
+        return "\n".join(lines)
+
+
+def _diff(reference: dict[str, int], candidate: dict[str, int]) -> list[Divergence]:
+    return [
+        Divergence(key, reference.get(key, 0), candidate.get(key, 0))
+        for key in sorted(reference.keys() | candidate.keys())
+        if reference.get(key, 0) != candidate.get(key, 0)
+    ]
+
+
+def compare_slippage(
+    reference: SplitSlippages, candidate: SplitSlippages
+) -> list[Divergence]:
+    """Per solver differences of slippage in wei"""
+
+    def per_solver(slippages: SplitSlippages) -> dict[str, int]:
+        amounts: dict[str, int] = {}
+        for slippage in slippages.negative + slippages.positive:
+            key = f"{slippage.solver_address}({slippage.solver_name})"
+            amounts[key] = amounts.get(key, 0) + slippage.amount_wei
+        return amounts
+
+    return _diff(per_solver(reference), per_solver(candidate))
+
+
+def compare_transfers(
+    reference: list[Transfer], candidate: list[Transfer]
+) -> list[Divergence]:
+    """Per (receiver, token) differences of transfer amounts in wei"""
+
+    def per_row(transfers: list[Transfer]) -> dict[str, int]:
+        amounts: dict[str, int] = {}
+        for transfer in transfers:
+            token = transfer.token_address or Address.zero()
+            key = f"{transfer.receiver}:{transfer.token_type}:{token}"
+            amounts[key] = amounts.get(key, 0) + to_wei(transfer.amount)
+        return amounts
+
+    return _diff(per_row(reference), per_row(candidate))
+
+
+def run_shadow(
+    reference: Callable[[], T],
+    candidate: Callable[[], T],
+    compare: Callable[[T, T], list[Divergence]],
+) -> ShadowResult[T]:
+    """Runs (and times) both paths one after the other and compares their results"""
+    start = time.perf_counter()
+    reference_result = reference()
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    candidate_result = candidate()
+    candidate_seconds = time.perf_counter() - start
+    return ShadowResult(
+        reference=reference_result,
+        candidate=candidate_result,
+        reference_seconds=reference_seconds,
+        candidate_seconds=candidate_seconds,
+        divergences=compare(reference_result, candidate_result),
+    )
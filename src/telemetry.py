@@ -0,0 +1,258 @@
+"""
+Local history of Dune query executions (sqlite), to see how long each query takes,
+how that splits into waiting in the scheduler's queue, executing on Dune and
+downloading the results, and how it develops over time and across edits of the SQL.
+
+Every execution of the `DuneScheduler` is recorded with its fingerprint, parameters,
+queue, execution and download time, number of rows and payload size. Queries are identified by
+name, and edits of their SQL are distinguished as variants (by hash of the SQL
+template, i.e. the query files, rather than of the rendered SQL with the injected
+token list and registry tables, which change with every sync).
+
+Usage:
+    python -m src.telemetry report --since '2022-03-01' --top 10
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import statistics
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, ContextManager, Optional
+
+from duneapi.types import DuneQuery
+from duneapi.util import open_query
+
+from src.file_io import FILE_OUT_PATH, sqlite_connection
+
+SCHEMA = """
+create table if not exists executions (
+    recorded_at      text    not null,
+    name             text    not null,
+    network          text    not null,
+    fingerprint      text    not null,
+    sql_hash         text    not null,
+    parameters       text    not null,
+    queue_seconds    real    not null,
+    execution_seconds real   not null,
+    num_rows         integer,
+    payload_bytes    integer,
+    error            text,
+    results_seconds  real
+);
+create index if not exists executions_by_name on executions (name, recorded_at);
+"""
+
+# A variant is reported as regression if its median execution time exceeds the
+# median of the previous variant of the same query by this factor.
+REGRESSION_FACTOR = 1.5
+
+# Files (in ./queries) the SQL of each query is rendered from, by query name
+QUERY_FILES = {
+    "Accounting Period Totals": ["period_totals.sql"],
+    "Day Fingerprints": ["day_fingerprints.sql"],
+    "ETH Reimbursement & COW Rewards": ["period_transfers.sql"],
+    "Slippage Accounting": ["period_slippage.sql"],
+    "Slippage Accounting per Transaction": ["period_slippage.sql"],
+    "Slippage Accounting Imbalances": ["period_slippage.sql", "select_imbalances.sql"],
+    "Solver Registry": ["registry_solvers.sql"],
+    "Token Registry": ["registry_tokens.sql"],
+}
+
+
+def query_template(query: DuneQuery) -> str:
+    """The SQL template of `query` (its rendered SQL for queries without files)"""
+    files = QUERY_FILES.get(query.name)
+    if files is None:
+        return query.raw_sql
+    return "\n".join(open_query(f"./queries/{file}") for file in files)
+
+
+def sql_hash(sql: str) -> str:
+    """Identifies a variant (i.e. edit) of a query's SQL"""
+    return hashlib.sha256(sql.encode()).hexdigest()[:12]
+
+
+@dataclass(frozen=True, slots=True)
+class VariantStats:
+    """Execution statistics of a variant of a query"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    name: str
+    sql_hash: str
+    first_seen: str
+    executions: int
+    median_seconds: float
+    max_seconds: float
+    mean_queue_seconds: float
+    mean_results_seconds: float
+    mean_rows: float
+
+
+@dataclass(frozen=True, slots=True)
+class WeekStats:
+    """Execution statistics of a query in a calendar week"""
+
+    name: str
+    week: str
+    executions: int
+    median_seconds: float
+    mean_rows: float
+
+
+class Telemetry:
+    """Records and reports query executions in a local sqlite database"""
+
+    def __init__(self, path: str = os.path.join(FILE_OUT_PATH, "telemetry.sqlite")):
+        self.path = path
+        with sqlite_connection(path, SCHEMA) as conn:
+            columns = [row[1] for row in conn.execute("pragma table_info(executions)")]
+            # Databases recorded before download times were measured separately
+            if "results_seconds" not in columns:
+                conn.execute("alter table executions add column results_seconds real")
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        # One connection per operation, as executions are recorded from many threads
+        return sqlite_connection(self.path)
+
+    # pylint: disable=too-many-arguments
+    def record(
+        self,
+        query: DuneQuery,
+        fingerprint: str,
+        queue_seconds: float,
+        execution_seconds: float,
+        *,
+        records: Optional[list[Any]] = None,
+        error: Optional[BaseException] = None,
+        recorded_at: Optional[datetime] = None,
+        template: Optional[str] = None,
+        results_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        Records an execution of `query` (with its records, unless it failed) as variant
+        of its SQL `template` (default: its rendered SQL). `execution_seconds` spans
+        initiation to completion on Dune, `results_seconds` the download of results.
+        """
+        row = (
+            (recorded_at or datetime.utcnow()).isoformat(timespec="seconds"),
+            query.name,
+            query.network.name.lower(),
+            fingerprint,
+            sql_hash(template if template is not None else query.raw_sql),
+            json.dumps(sorted(json.dumps(p.to_dict()) for p in query.parameters)),
+            queue_seconds,
+            execution_seconds,
+            len(records) if records is not None else None,
+            len(json.dumps(records)) if records is not None else None,
+            repr(error) if error is not None else None,
+            results_seconds,
+        )
+        with self._connect() as conn:
+            conn.execute(
+                "insert into executions values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+
+    def _rows(self, since: Optional[datetime]) -> list[tuple[Any, ...]]:
+        with self._connect() as conn:
+            return conn.execute(
+                "select name, sql_hash, recorded_at, execution_seconds, queue_seconds,"
+                " num_rows, coalesce(results_seconds, 0) from executions"
+                " where error is null and recorded_at >= ?"
+                " order by recorded_at",
+                ((since or datetime.min).isoformat(timespec="seconds"),),
+            ).fetchall()
+
+    def variants(self, since: Optional[datetime] = None) -> list[VariantStats]:
+        """Statistics per variant, slowest (by median execution time) first"""
+        grouped: dict[tuple[str, str], list[tuple[Any, ...]]] = {}
+        for row in self._rows(since):
+            grouped.setdefault((row[0], row[1]), []).append(row)
+        stats = [
+            VariantStats(
+                name=name,
+                sql_hash=variant,
+                first_seen=rows[0][2],
+                executions=len(rows),
+                median_seconds=statistics.median(r[3] for r in rows),
+                max_seconds=max(r[3] for r in rows),
+                mean_queue_seconds=statistics.mean(r[4] for r in rows),
+                mean_results_seconds=statistics.mean(r[6] for r in rows),
+                mean_rows=statistics.mean(r[5] for r in rows),
+            )
+            for (name, variant), rows in grouped.items()
+        ]
+        return sorted(stats, key=lambda s: -s.median_seconds)
+
+    def weekly(self, since: Optional[datetime] = None) -> list[WeekStats]:
+        """Statistics per query and calendar week"""
+        grouped: dict[tuple[str, str], list[tuple[Any, ...]]] = {}
+        for row in self._rows(since):
+            day = datetime.fromisoformat(row[2])
+            week = (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+            grouped.setdefault((row[0], week), []).append(row)
+        return [
+            WeekStats(
+                name=name,
+                week=week,
+                executions=len(rows),
+                median_seconds=statistics.median(r[3] for r in rows),
+                mean_rows=statistics.mean(r[5] for r in rows),
+            )
+            for (name, week), rows in sorted(grouped.items())
+        ]
+
+    def regressions(
+        self, since: Optional[datetime] = None, factor: float = REGRESSION_FACTOR
+    ) -> list[tuple[VariantStats, VariantStats]]:
+        """(previous, new) variants of a query where the new one became slower"""
+        by_name: dict[str, list[VariantStats]] = {}
+        for variant in sorted(self.variants(since), key=lambda v: v.first_seen):
+            by_name.setdefault(variant.name, []).append(variant)
+        return [
+            (previous, new)
+            for variants in by_name.values()
+            for previous, new in zip(variants, variants[1:])
+            if new.median_seconds > factor * previous.median_seconds
+        ]
+
+
+def print_report(telemetry: Telemetry, since: Optional[datetime], top: int) -> None:
+    """Prints the slowest variants, weekly trends and regressions after query edits"""
+    print(f"Slowest query variants (top {top})")
+    for var in telemetry.variants(since)[:top]:
+        print(
+            f"  {var.name} [{var.sql_hash}]: {var.executions} runs, "
+            f"median {var.median_seconds:.1f}s, max {var.max_seconds:.1f}s, "
+            f"queued {var.mean_queue_seconds:.1f}s, "
+            f"downloaded {var.mean_results_seconds:.1f}s, {var.mean_rows:.0f} rows"
+        )
+    print("Weekly trends")
+    for week in telemetry.weekly(since):
+        print(
+            f"  {week.week} {week.name}: {week.executions} runs, "
+            f"median {week.median_seconds:.1f}s, {week.mean_rows:.0f} rows"
+        )
+    print("Regressions after query edits")
+    for previous, new in telemetry.regressions(since):
+        print(
+            f"  {new.name}: [{previous.sql_hash}] {previous.median_seconds:.1f}s -> "
+            f"[{new.sql_hash}] {new.median_seconds:.1f}s (since {new.first_seen})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Query Telemetry")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument(
+        "--since", type=lambda s: datetime.strptime(s, "%Y-%m-%d"), default=None
+    )
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    print_report(Telemetry(), args.since, args.top)
@@ -1,8 +1,6 @@
 """Utility code for fetching the allowed token list"""
 import json
 
-import requests
-
 # pylint: disable=line-too-long
 ALLOWED_TOKEN_LIST_URL = "https://raw.githubusercontent.com/gnosis/cow-dex-solver/main/data/token_list_for_buffer_trading.json"
 
@@ -20,5 +18,7 @@ def parse_token_list(token_list_json: str) -> list[str]:
 
 def fetch_trusted_tokens() -> list[str]:
     """Returns the list of trusted buffer tradable tokens"""
+    import requests  # pylint: disable=import-outside-toplevel
+
     response = requests.get(ALLOWED_TOKEN_LIST_URL)
     return parse_token_list(response.text)
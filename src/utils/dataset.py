@@ -1,6 +1,7 @@
 """Generic tools for manipulating datasets"""
+import sys
 from dataclasses import fields, is_dataclass
-from typing import Any
+from typing import Any, Optional
 
 
 def index_by(data_list: list[Any], field_str: str) -> dict[Any, Any]:
@@ -18,7 +19,8 @@ def index_by(data_list: list[Any], field_str: str) -> dict[Any, Any]:
 
     results = {}
     for entry in data_list:
-        index_key = entry.__dict__.get(field_str)
+        # getattr (rather than __dict__) so that slotted records are supported.
+        index_key = getattr(entry, field_str)
         if index_key not in results:
             results[index_key] = entry
         else:
@@ -26,3 +28,36 @@ def index_by(data_list: list[Any], field_str: str) -> dict[Any, Any]:
                 f'Attempting to index by non-unique index key "{index_key}"'
             )
     return results
+
+
+def deep_sizeof(obj: Any, seen: Optional[set[int]] = None) -> int:
+    """
+    Approximate memory footprint (in bytes) of `obj` including everything it references.
+    Objects shared between several records (e.g. interned strings) are only counted once
+    per `seen` set, so passing the same set across a list gives the true total.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool)):
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), seen)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+def footprint_per_row(data_list: list[Any]) -> float:
+    """Average memory footprint (in bytes) of a record in `data_list`"""
+    if len(data_list) == 0:
+        return 0.0
+    seen: set[int] = set()
+    return sum(deep_sizeof(row, seen) for row in data_list) / len(data_list)
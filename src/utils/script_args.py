@@ -1,21 +1,55 @@
 """Common method for initializing setup for scripts"""
+from __future__ import annotations
+
 import argparse
+from typing import TYPE_CHECKING
+
+from duneapi.types import Network
+
+from src.models import AccountingPeriod, NETWORKS
+
+if TYPE_CHECKING:
+    from duneapi.api import DuneAPI
+
+
+def add_accounting_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the arguments shared by all accounting scripts to `parser`"""
+    parser.add_argument(
+        "--start", type=str, help="Accounting Period Start", required=True
+    )
+    parser.add_argument(
+        "--network",
+        type=str,
+        nargs="+",
+        choices=[str(config) for config in NETWORKS.values()] + ["all"],
+        default=["mainnet"],
+        help="Network(s) to run the accounting for (concurrently)",
+    )
+
 
-from duneapi.api import DuneAPI
+def accounting_init(
+    args: argparse.Namespace,
+) -> tuple[DuneAPI, AccountingPeriod, list[Network]]:
+    """Establishes dune connection and converts parsed accounting arguments"""
+    # Only loaded once arguments are known to be valid (i.e. not for --help).
+    from src.scheduler import DuneScheduler  # pylint: disable=import-outside-toplevel
 
-from src.models import AccountingPeriod
+    networks = [
+        config.network
+        for config in NETWORKS.values()
+        if str(config) in args.network or "all" in args.network
+    ]
+    return DuneScheduler.new_from_environment(), AccountingPeriod(args.start), networks
 
 
-def generic_script_init(description: str) -> tuple[DuneAPI, AccountingPeriod]:
+def generic_script_init(
+    description: str,
+) -> tuple[DuneAPI, AccountingPeriod, list[Network]]:
     """
     1. parses parses command line arguments,
     2. establishes dune connection
     and returns this info
     """
     parser = argparse.ArgumentParser(description)
-    parser.add_argument(
-        "--start", type=str, help="Accounting Period Start", required=True
-    )
-    args = parser.parse_args()
-
-    return DuneAPI.new_from_environment(), AccountingPeriod(args.start)
+    add_accounting_arguments(parser)
+    return accounting_init(parser.parse_args())
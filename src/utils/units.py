@@ -0,0 +1,7 @@
+"""Conversions between token amounts and their atoms"""
+from decimal import Decimal
+
+
+def to_wei(amount: float) -> int:
+    """Converts a (float) token amount as used in the CSV Airdrop into atoms"""
+    return int(Decimal(str(amount)) * 10**18)
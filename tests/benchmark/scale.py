@@ -0,0 +1,69 @@
+"""
+Load test of the offline accounting (period slippage and transfers) on synthetic
+settlement data at multiples of today's volume (~600 batches a day). Run from the
+project root with
+
+    PYTHONPATH=. python tests/benchmark/scale.py [--scales 1 10 100] [--days 7]
+
+and it reports, per scale point, the time to generate the data and the runtime and
+peak (traced) memory of computing the slippage and the transfer file from it.
+"""
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from duneapi.types import Network
+
+from src.models import Address, NETWORKS
+from src.offline.engine import period_slippage, transfers
+from src.offline.synthetic import SyntheticConfig, generate
+
+
+def measure(func: Callable[[], Any]) -> tuple[float, float]:
+    """Runtime (in seconds, untraced) and peak traced memory (in MiB) of `func`"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        func()
+        runtime = time.perf_counter() - start
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return runtime, peak / 2**20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Offline accounting scale test")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--batches-per-day", type=int, default=600)
+    args = parser.parse_args()
+
+    cow_token = NETWORKS[Network.MAINNET].cow_token
+    # Warm up the (lazily imported and cached) address checksum
+    Address(str(cow_token))
+    print(
+        f"{'scale':>6}{'batches':>10}{'generate':>12}"
+        f"{'slippage':>12}{'peak':>10}{'transfers':>12}{'peak':>10}"
+    )
+    for scale in args.scales:
+        start = time.perf_counter()
+        raw = generate(
+            SyntheticConfig(
+                days=args.days,
+                batches_per_day=args.batches_per_day * scale,
+                num_solvers=15 + scale,
+                num_tokens=100 + 10 * scale,
+            )
+        )
+        generation = time.perf_counter() - start
+        slippage_time, slippage_peak = measure(lambda: period_slippage(raw))
+        transfer_time, transfer_peak = measure(lambda: transfers(raw, cow_token))
+        print(
+            f"{scale:>5}x{len(raw.batches):>10}{generation:>11.2f}s"
+            f"{slippage_time:>11.2f}s{slippage_peak:>7.0f}MiB"
+            f"{transfer_time:>11.2f}s{transfer_peak:>7.0f}MiB"
+        )
@@ -0,0 +1,37 @@
+"""
+Measures the startup time of the command line interface against the import time of
+its heavy dependencies. Run from the project root with
+
+    python tests/benchmark/startup_time.py [repetitions]
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = {
+    "python -m src --help": ["-m", "src", "--help"],
+    "python -m src totals (invalid args)": ["-m", "src", "totals"],
+    "import src.fetch.accounting": ["-c", "import src.fetch.accounting"],
+    "import web3": ["-c", "import web3"],
+    "import duneapi.api": ["-c", "import duneapi.api"],
+    "import requests": ["-c", "import requests"],
+}
+
+
+def median_runtime(args: list[str], repetitions: int) -> float:
+    """Median wall time (in seconds) of running the python interpreter with `args`"""
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], capture_output=True, check=False)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = median_runtime(["-c", "pass"], runs)
+    print(f"{'interpreter startup':<40}{baseline * 1000:>8.0f} ms")
+    for name, command in COMMANDS.items():
+        print(f"{name:<40}{median_runtime(command, runs) * 1000:>8.0f} ms")
@@ -5,10 +5,10 @@ from dataclasses import dataclass
 from enum import Enum
 
 from duneapi.api import DuneAPI
-from duneapi.types import DuneQuery, QueryParameter, Network
+from duneapi.types import DuneQuery, Network
 from duneapi.util import open_query
 
-from src.fetch.period_slippage import add_token_list_table_to_query
+from src.fetch.period_slippage import slippage_parameters, slippage_sub_query
 from src.models import AccountingPeriod, Address
 
 
@@ -75,23 +75,16 @@ class TestDuneAnalytics(unittest.TestCase):
         self.period = AccountingPeriod("2022-03-01", length_days=14)
 
     def get_internal_transfers(self, tx_hash: str) -> list[InternalTransfer]:
-        slippage_sub_query = open_query("./queries/period_slippage.sql")
         select_transfers_query = open_query(
             "./tests/queries/select_internal_transfers.sql"
         )
 
-        raw_sql = "\n".join(
-            [add_token_list_table_to_query(slippage_sub_query), select_transfers_query]
-        )
+        raw_sql = "\n".join([slippage_sub_query(), select_transfers_query])
         query = DuneQuery.from_environment(
             raw_sql=raw_sql,
             network=Network.MAINNET,
             name="Internal Token Transfer Accounting",
-            parameters=[
-                QueryParameter.text_type("TxHash", tx_hash),
-                QueryParameter.date_type("StartTime", self.period.start),
-                QueryParameter.date_type("EndTime", self.period.end),
-            ],
+            parameters=slippage_parameters(self.period, tx_hash=tx_hash),
         )
         data_set = self.dune.fetch(query)
         return [InternalTransfer.from_dict(row) for row in data_set]
@@ -1,11 +1,11 @@
 import unittest
-from datetime import datetime
 from pprint import pprint
 
 from duneapi.api import DuneAPI
-from duneapi.types import DuneQuery, QueryParameter, Network
+from duneapi.types import DuneQuery, Network
 
-from src.fetch.period_slippage import QueryType, slippage_query
+from src.fetch.period_slippage import QueryType, slippage_query, slippage_parameters
+from src.models import AccountingPeriod
 
 
 class TestDuneAnalytics(unittest.TestCase):
@@ -15,18 +15,12 @@ class TestDuneAnalytics(unittest.TestCase):
         which tx are having high slippage values in dollar terms
         """
         dune = DuneAPI.new_from_environment()
-        period_start = datetime.strptime("2022-03-10", "%Y-%m-%d")
-        period_end = datetime.strptime("2022-03-11", "%Y-%m-%d")
         slippage_per_tx = dune.fetch(
             DuneQuery.from_environment(
                 raw_sql=slippage_query(QueryType.PER_TX),
                 network=Network.MAINNET,
                 name="Slippage Accounting",
-                parameters=[
-                    QueryParameter.date_type("StartTime", period_start),
-                    QueryParameter.date_type("EndTime", period_end),
-                    QueryParameter.text_type("TxHash", "0x"),
-                ],
+                parameters=slippage_parameters(AccountingPeriod("2022-03-10", 1)),
             )
         )
         slippage_per_tx.sort(key=lambda t: int(t["eth_slippage_wei"]))
@@ -0,0 +1,129 @@
+import unittest
+
+from src.fetch.imbalances import Imbalance, ImbalanceTable
+from src.models import Address
+from src.offline.buffer_trades import (
+    BufferTradeRules,
+    recompute,
+    split_slippages,
+    what_if,
+)
+
+SOLVER = "0x149d0f9282333681ee41d30589824b2798e9fb47"
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+JUNK = "0x0000000000000000000000000000000000000bad"
+
+
+def imbalance(
+    token: str,
+    amount: int,
+    clearing_value=None,
+    usd_value=None,
+    tx_hash="0x01",
+    solver_name="Otex",
+    dex_swaps=0,
+) -> Imbalance:
+    return Imbalance(
+        tx_hash=tx_hash,
+        dex_swaps=dex_swaps,
+        solver_address=SOLVER,
+        solver_name=solver_name,
+        symbol="",
+        token=token,
+        amount=amount,
+        clearing_value=clearing_value,
+        usd_value=usd_value,
+    )
+
+
+def table(imbalances: list[Imbalance], token_list=None) -> ImbalanceTable:
+    return ImbalanceTable(
+        imbalances=imbalances,
+        end_prices={WETH: (2000.0, 18), USDC: (1.0, 6), JUNK: (1.0, 18)},
+        eth_price=2000.0,
+        token_list=token_list if token_list is not None else [WETH, USDC],
+    )
+
+
+# Buffers receive 1 WETH and pay 1990 USDC (0.5% apart in clearing prices)
+WETH_FOR_USDC = [
+    imbalance(WETH, 10**18, clearing_value=2000.0, usd_value=2000.0),
+    imbalance(USDC, -1990 * 10**6, clearing_value=-1990.0, usd_value=-1990.0),
+]
+
+
+class TestBufferTrades(unittest.TestCase):
+    def test_clearing_price_match_is_internal(self):
+        result = recompute(table(WETH_FOR_USDC))
+        self.assertEqual(len(result.internal_trades["0x01"]), 2)
+        # Both imbalances are internal trades, so nothing is left as slippage
+        self.assertEqual(result.per_tx, [])
+
+    def test_disallowed_token_is_slippage(self):
+        result = recompute(table(WETH_FOR_USDC, token_list=[USDC]))
+        # The buffers would receive WETH, which is not on the token list
+        self.assertEqual(result.internal_trades, {})
+        self.assertEqual(len(result.per_tx), 1)
+        self.assertAlmostEqual(result.per_tx[0].amount_wei / 10**18, 0.005)
+
+    def test_threshold(self):
+        strict = BufferTradeRules(matchability_threshold=0.001)
+        result = recompute(table(WETH_FOR_USDC), strict)
+        self.assertEqual(result.internal_trades, {})
+        self.assertEqual(result.per_tx[0].solver_address, Address(SOLVER))
+
+    def test_usd_match_requires_min_value(self):
+        small = [
+            imbalance(WETH, 10**15, usd_value=2.0),
+            imbalance(USDC, -2 * 10**6, usd_value=-2.0),
+        ]
+        self.assertEqual(recompute(table(small)).internal_trades, {})
+        lenient = BufferTradeRules(min_usd_value=1)
+        self.assertEqual(len(recompute(table(small), lenient).internal_trades), 1)
+
+    def test_buffer_trader_solvers(self):
+        with_amm = [
+            imbalance(t.token, t.amount, t.clearing_value, t.usd_value, dex_swaps=1)
+            for t in WETH_FOR_USDC
+        ]
+        self.assertEqual(recompute(table(with_amm)).internal_trades, {})
+        rules = BufferTradeRules(buffer_trader_solvers=frozenset({"Otex"}))
+        self.assertEqual(len(recompute(table(with_amm), rules).internal_trades), 1)
+
+    def test_token_changes(self):
+        rules = BufferTradeRules(removed_tokens=frozenset({WETH}))
+        self.assertEqual(recompute(table(WETH_FOR_USDC), rules).internal_trades, {})
+        rules = BufferTradeRules(added_tokens=frozenset({WETH}))
+        result = recompute(table(WETH_FOR_USDC, token_list=[]), rules)
+        self.assertEqual(len(result.internal_trades), 1)
+
+    def test_unpriced_tokens_are_ignored(self):
+        result = recompute(table([imbalance("0xunpriced", 10**18)]))
+        self.assertEqual(result.per_tx, [])
+
+    def test_duplicate_token_rows_are_summed(self):
+        # e.g. native and wrapped native transfers of the same settlement
+        result = recompute(
+            table([imbalance(WETH, 10**18), imbalance(WETH, -(10**18) // 4)])
+        )
+        self.assertEqual(len(result.per_tx), 1)
+        self.assertAlmostEqual(result.per_tx[0].amount_wei / 10**18, 0.75)
+
+    def test_what_if(self):
+        data = table(
+            WETH_FOR_USDC
+            + [imbalance(JUNK, -(10**18), usd_value=-1.0, tx_hash="0x02")]
+        )
+        baseline = split_slippages(data, recompute(data))
+        self.assertAlmostEqual(baseline.sum_negative() / 10**18, -0.0005)
+
+        diffs = what_if(data, BufferTradeRules(matchability_threshold=0.001))
+        self.assertEqual(len(diffs), 1)
+        self.assertEqual(diffs[0].solver_address, Address(SOLVER))
+        self.assertAlmostEqual(diffs[0].delta_wei / 10**18, 0.005)
+        self.assertEqual(what_if(data, BufferTradeRules()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.offline.clearing_prices import (
+    NATIVE_TOKEN,
+    SETTLE_SELECTOR,
+    ClearingPriceIndex,
+    clearing_prices,
+    decode_settle,
+    index_settlements,
+    load_call_dump,
+    with_clearing_values,
+)
+from src.offline.engine import imbalance_table
+from tests.unit.test_offline_engine import USDC, WETH, single_swap
+
+
+def word(value: int) -> str:
+    return value.to_bytes(32, "big").hex()
+
+
+def settle_calldata(tokens: list[str], prices: list[int]) -> str:
+    """ABI encoded settle(tokens, prices, [], [[], [], []])"""
+    tokens_part = word(len(tokens)) + "".join(word(int(t, 16)) for t in tokens)
+    prices_part = word(len(prices)) + "".join(word(p) for p in prices)
+    trades_part = word(0)
+    interactions_part = word(96) + word(128) + word(160) + word(0) * 3
+    offsets = [128]
+    for part in (tokens_part, prices_part, trades_part):
+        offsets.append(offsets[-1] + len(part) // 2)
+    return (
+        SETTLE_SELECTOR
+        + "".join(word(offset) for offset in offsets)
+        + tokens_part
+        + prices_part
+        + trades_part
+        + interactions_part
+    )
+
+
+class TestClearingPrices(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = ClearingPriceIndex(os.path.join(self.tmp_dir.name, "prices.db"))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_decode_settle(self):
+        calldata = settle_calldata([WETH, USDC], [2000 * 10**18, 10**30])
+        self.assertEqual(
+            decode_settle(calldata), [(WETH, 2000 * 10**18), (USDC, 10**30)]
+        )
+        with self.assertRaises(ValueError):
+            decode_settle("0xa9059cbb" + calldata[10:])
+
+    def test_native_token_and_duplicates(self):
+        calldata = settle_calldata([NATIVE_TOKEN, WETH, USDC], [10, 20, 30])
+        self.assertEqual(clearing_prices(calldata, WETH), {WETH: 15, USDC: 30})
+
+    def test_index(self):
+        calldata = {
+            "0x01": settle_calldata([WETH, USDC], [2000 * 10**18, 10**30]),
+            "0x02": settle_calldata([NATIVE_TOKEN, USDC], [2**255, 1]),
+            "0x03": "0xa9059cbb",
+        }
+        self.assertEqual(index_settlements(self.index, calldata, WETH), ["0x03"])
+        self.assertEqual(self.index.missing(["0x01", "0x03", "0x04"]), ["0x03", "0x04"])
+        reopened = ClearingPriceIndex(self.index.path)
+        self.assertEqual(
+            reopened.prices(["0x01", "0x02", "0x04"]),
+            {
+                "0x01": {WETH: 2000 * 10**18, USDC: 10**30},
+                "0x02": {WETH: 2**255, USDC: 1},
+            },
+        )
+        # Indexed settlements are not decoded again
+        self.assertEqual(index_settlements(reopened, {"0x01": "0x"}, WETH), [])
+
+    def test_clearing_values(self):
+        raw = single_swap(1996 * 10**6)
+        calldata = {"0x01": settle_calldata([WETH, USDC], [2000 * 10**18, 10**30])}
+        index_settlements(self.index, calldata, WETH)
+        expected = imbalance_table(raw)
+        raw.clearing_prices = {}
+        table = with_clearing_values(imbalance_table(raw), self.index)
+        self.assertIsNone(imbalance_table(raw).imbalances[0].clearing_value)
+        self.assertEqual(table, expected)
+
+    def test_load_call_dump(self):
+        filename = os.path.join(self.tmp_dir.name, "calls.jsonl")
+        with open(filename, "w", encoding="utf-8") as file:
+            for tx_hash in ("0xAB", "0xcd"):
+                file.write(json.dumps({"hash": tx_hash, "input": "0x13d79a0b"}) + "\n")
+        self.assertEqual(
+            load_call_dump(filename), {"0xab": "0x13d79a0b", "0xcd": "0x13d79a0b"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+import subprocess
+import sys
+import unittest
+from contextlib import redirect_stderr
+
+from src.__main__ import build_parser
+from src.multisend import DEFAULT_GAS_BUDGET
+
+HEAVY_MODULES = ["web3", "requests", "duneapi.api"]
+
+
+def loaded_modules(*args: str) -> set[str]:
+    """Modules imported by running the CLI with `args` (failing runs included)"""
+    code = (
+        "import sys\n"
+        "from src.__main__ import main\n"
+        "try:\n"
+        f"    main({list(args)})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(','.join(sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return set(result.stdout.strip().split("\n")[-1].split(","))
+
+
+class TestCommandLine(unittest.TestCase):
+    def test_parser(self):
+        args = build_parser().parse_args(
+            ["investigation", "--start", "2022-03-01", "--network", "all", "--top", "3"]
+        )
+        self.assertEqual(args.command, "investigation")
+        self.assertEqual(args.network, ["all"])
+        self.assertEqual(args.top, 3)
+        args = build_parser().parse_args(["transfers", "--start", "2022-03-01"])
+        self.assertEqual(args.gas_budget, DEFAULT_GAS_BUDGET)
+
+    def test_exclusive_modes(self):
+        solver = ["--solver", "0x" + "11" * 20]
+        for args in [
+            ["slippage", "--shadow", *solver],
+            ["slippage", "--preview", "0.1", *solver],
+            ["slippage", "--preview", "0.1", "--shadow"],
+            ["transfers", "--shadow", *solver],
+        ]:
+            with redirect_stderr(io.StringIO()) as stderr, self.assertRaises(
+                SystemExit
+            ):
+                build_parser().parse_args([*args, "--start", "2022-03-01"])
+            self.assertIn("not allowed with argument", stderr.getvalue())
+
+    def test_no_heavy_imports(self):
+        for args in [["--help"], ["totals"], ["transfers", "--help"]]:
+            modules = loaded_modules(*args)
+            for heavy in HEAVY_MODULES:
+                self.assertNotIn(heavy, modules, f"{heavy} imported for {args}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 from dataclasses import dataclass
 
-from src.utils.dataset import index_by
+from src.fetch.period_slippage import SolverSlippage
+from src.models import Address
+from src.utils.dataset import index_by, footprint_per_row
 
 
 @dataclass
@@ -10,6 +12,12 @@ class DummyDataClass:
     y: str
 
 
+@dataclass(slots=True)
+class SlottedDataClass:
+    x: int
+    y: str
+
+
 class MyTestCase(unittest.TestCase):
     def test_index_by(self):
         data_set = [
@@ -34,6 +42,18 @@ class MyTestCase(unittest.TestCase):
             f"<class 'test_data_utils.DummyDataClass'> has no field \"{bad_field}\"",
         )
 
+    def test_index_by_slotted(self):
+        data_set = [SlottedDataClass(1, "a"), SlottedDataClass(2, "b")]
+        self.assertEqual(index_by(data_set, "y"), {"a": data_set[0], "b": data_set[1]})
+
+    def test_footprint_per_row(self):
+        self.assertEqual(footprint_per_row([]), 0.0)
+        solver = Address("0x1111111111111111111111111111111111111111")
+        slotted = [SolverSlippage(solver, "Solver", i) for i in range(100)]
+        plain = [DummyDataClass(i, str(solver)) for i in range(100)]
+        # Shared Address is only counted once, and there is no per-row __dict__
+        self.assertLess(footprint_per_row(slotted), footprint_per_row(plain))
+
 
 if __name__ == "__main__":
     unittest.main()
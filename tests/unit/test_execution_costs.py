@@ -0,0 +1,159 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.fetch.execution_costs import (
+    SETTLEMENT_TOPIC,
+    ReceiptCache,
+    RpcClient,
+    RpcError,
+    block_at,
+    fetch_settlements,
+    reimbursements_from_settlements,
+    settlement_solvers,
+)
+from src.fetch.transfer_file import TokenType
+from src.models import Address
+
+CONTRACT = Address("0x9008D19f58AAbD9eD0D60971565AA8510560ab41")
+COW = Address("0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB")
+SOLVERS = [f"0x{i:040x}" for i in (1, 2)]
+GENESIS = 1_600_000_000
+NUM_BLOCKS = 1000
+
+
+class Chain:
+    """A settlement every 10 blocks (of 12 seconds), alternating between solvers"""
+
+    def __init__(self) -> None:
+        self.batches: list[int] = []
+        self.requests: list[str] = []
+        self.lock = threading.Lock()
+
+    def tx_hash(self, block: int) -> str:
+        return f"0x{block:064x}"
+
+    def answer(self, method: str, params: list) -> object:
+        self.requests.append(method)
+        if method == "eth_blockNumber":
+            return hex(NUM_BLOCKS - 1)
+        if method == "eth_getBlockByNumber":
+            return {"timestamp": hex(GENESIS + 12 * int(params[0], 16))}
+        if method == "eth_getLogs":
+            (log_filter,) = params
+            assert log_filter["topics"] == [SETTLEMENT_TOPIC]
+            return [
+                {
+                    "transactionHash": self.tx_hash(block),
+                    "topics": [
+                        SETTLEMENT_TOPIC,
+                        "0x" + SOLVERS[block // 10 % 2][2:].rjust(64, "0"),
+                    ],
+                }
+                for block in range(
+                    int(log_filter["fromBlock"], 16), int(log_filter["toBlock"], 16) + 1
+                )
+                if block % 10 == 0
+            ]
+        if method == "eth_getTransactionReceipt":
+            block = int(params[0], 16)
+            return {"gasUsed": hex(100_000 + block), "effectiveGasPrice": hex(10**10)}
+        raise ValueError(method)
+
+
+def rpc_server(chain: Chain) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with chain.lock:
+                chain.batches.append(len(body))
+            answers = []
+            for request in body:
+                try:
+                    result = chain.answer(request["method"], request["params"])
+                    answers.append({"id": request["id"], "result": result})
+                except ValueError as err:
+                    answers.append({"id": request["id"], "error": str(err)})
+            payload = json.dumps(answers).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestExecutionCosts(unittest.TestCase):
+    def setUp(self):
+        self.chain = Chain()
+        self.server = rpc_server(self.chain)
+        host, port = self.server.server_address
+        self.client = RpcClient(f"http://{host}:{port}", batch_size=20, max_workers=3)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_batches(self):
+        results = self.client.batch(
+            [("eth_getBlockByNumber", [hex(i), False]) for i in range(50)]
+        )
+        self.assertEqual([int(r["timestamp"], 16) for r in results][-1], GENESIS + 588)
+        self.assertEqual(sorted(self.chain.batches), [10, 20, 20])
+        with self.assertRaises(RpcError):
+            self.client.call("eth_unknown", [])
+
+    def test_block_at(self):
+        self.assertEqual(block_at(self.client, GENESIS + 120), 10)
+        self.assertEqual(block_at(self.client, GENESIS + 121), 11)
+        self.assertEqual(block_at(self.client, GENESIS + 10**6), NUM_BLOCKS)
+
+    def test_settlements_and_cache(self):
+        solvers = settlement_solvers(
+            self.client, CONTRACT, 100, 300, blocks_per_request=30
+        )
+        self.assertEqual(len(solvers), 20)
+        self.assertEqual(solvers[self.chain.tx_hash(110)], SOLVERS[1])
+        with tempfile.TemporaryDirectory() as path:
+            cache_file = os.path.join(path, "receipts.jsonl")
+            settlements = fetch_settlements(
+                self.client, solvers, ReceiptCache(cache_file)
+            )
+            self.assertEqual(settlements[0].cost_wei, 100_100 * 10**10)
+            self.assertEqual(self.chain.requests.count("eth_getTransactionReceipt"), 20)
+
+            # Receipts of a rerun are served from the cache
+            self.assertEqual(
+                fetch_settlements(self.client, solvers, ReceiptCache(cache_file)),
+                settlements,
+            )
+            self.assertEqual(self.chain.requests.count("eth_getTransactionReceipt"), 20)
+
+        transfers = reimbursements_from_settlements(settlements, COW)
+        self.assertEqual(
+            [(t.token_type, t.receiver) for t in transfers],
+            [
+                (TokenType.NATIVE, Address(SOLVERS[0])),
+                (TokenType.ERC20, Address(SOLVERS[0])),
+                (TokenType.NATIVE, Address(SOLVERS[1])),
+                (TokenType.ERC20, Address(SOLVERS[1])),
+            ],
+        )
+        self.assertEqual(transfers[1].amount, 1000.0)
+        self.assertAlmostEqual(
+            sum(t.amount for t in transfers if t.token_type == TokenType.NATIVE),
+            sum(s.cost_wei for s in settlements) / 10**18,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from src.fetch.fingerprints import (
+    DayFingerprint,
+    FingerprintStore,
+    get_day_fingerprints,
+    invalidate_outdated,
+)
+from src.history import SolverDay, SolverHistory, ingest, refresh
+from src.models import AccountingPeriod, Address
+from src.pipeline import Pipeline, Stage
+
+SOLVER = Address("0x1111111111111111111111111111111111111111")
+
+
+def fingerprint_row(day: str, batches: int, **hashes: str) -> dict[str, str]:
+    return {
+        "day": day,
+        "batches": str(batches),
+        "batches_hash": f"hash{batches}",
+        "trades": "2",
+        "trades_hash": "trades",
+        "transfers": "3",
+        "transfers_hash": "transfers",
+        "prices": "4",
+        "prices_hash": "prices",
+        "dex_prices": "24",
+        "dex_prices_hash": "dex_prices",
+        "clearing_prices": "5",
+        "clearing_prices_hash": "clearing_prices",
+    } | hashes
+
+
+class FakeDune:
+    """Answers fingerprint queries with the configured number of batches per day"""
+
+    def __init__(self, batches: dict[str, int]):
+        self.batches = batches
+        self.hashes: dict[str, dict[str, str]] = {}
+
+    def fetch(self, query):
+        params = {p.key: p.value for p in query.parameters}
+        start, end = (str(params[key])[:10] for key in ("StartTime", "EndTime"))
+        return [
+            fingerprint_row(day, num, **self.hashes.get(day, {}))
+            for day, num in sorted(self.batches.items())
+            if start <= day < end
+        ]
+
+
+@mock.patch.dict(os.environ, {"DUNE_QUERY_ID": "1"})
+class TestFingerprints(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_digest(self):
+        row = fingerprint_row("2022-03-01", 1)
+        self.assertEqual(DayFingerprint.from_dict(row).day, date(2022, 3, 1))
+        self.assertEqual(
+            DayFingerprint.from_dict(row).digest(),
+            DayFingerprint.from_dict(row).digest(),
+        )
+        self.assertNotEqual(
+            DayFingerprint.from_dict(row).digest(),
+            DayFingerprint.from_dict(fingerprint_row("2022-03-01", 2)).digest(),
+        )
+
+    def test_store(self):
+        filename = os.path.join(self.tmp_dir.name, "fingerprints.json")
+        store = FingerprintStore(filename)
+        current = {date(2022, 3, 1): "a", date(2022, 3, 2): "b"}
+        self.assertEqual(store.changed(current), sorted(current))
+        store.update(current)
+        reopened = FingerprintStore(filename)
+        self.assertEqual(reopened.changed(current), [])
+        self.assertEqual(reopened.changed({date(2022, 3, 2): "c"}), [date(2022, 3, 2)])
+
+    def test_invalidate_outdated(self):
+        calls = []
+
+        def pipeline() -> Pipeline:
+            def stage(name, deps=()):
+                return Stage(name, lambda **_: calls.append(name), deps)
+
+            return Pipeline(
+                [stage("slippage"), stage("static"), stage("transfers", ("slippage",))],
+                self.tmp_dir.name,
+            )
+
+        period = AccountingPeriod("2022-03-01", length_days=2)
+        dune = FakeDune({"2022-03-01": 1, "2022-03-02": 1})
+        fingerprints = get_day_fingerprints(dune, period)
+        self.assertEqual(
+            invalidate_outdated(pipeline(), ("slippage",), fingerprints), []
+        )
+        pipeline().run()
+
+        calls.clear()
+        self.assertEqual(
+            invalidate_outdated(pipeline(), ("slippage",), fingerprints), []
+        )
+        pipeline().run()
+        self.assertEqual(calls, [])
+
+        dune.batches["2022-03-02"] = 2
+        self.assertEqual(
+            invalidate_outdated(
+                pipeline(), ("slippage",), get_day_fingerprints(dune, period)
+            ),
+            [date(2022, 3, 2)],
+        )
+        pipeline().run()
+        self.assertEqual(sorted(calls), ["slippage", "transfers"])
+
+        # Prices only, e.g. late dex prices of the end of the period
+        for prices in ("dex_prices_hash", "clearing_prices_hash"):
+            calls.clear()
+            dune.hashes["2022-03-02"] = dune.hashes.get("2022-03-02", {}) | {
+                prices: "late"
+            }
+            self.assertEqual(
+                invalidate_outdated(
+                    pipeline(), ("slippage",), get_day_fingerprints(dune, period)
+                ),
+                [date(2022, 3, 2)],
+            )
+            pipeline().run()
+            self.assertEqual(sorted(calls), ["slippage", "transfers"])
+
+    def test_history_refresh(self):
+        history = SolverHistory(self.tmp_dir.name)
+        dune = FakeDune({f"2022-03-0{i}": 1 for i in range(1, 4)})
+        fetched = []
+
+        def fetch_solver_day(_, day):
+            fetched.append(day)
+            return [SolverDay(day, SOLVER, "One", len(fetched), 0, 0)]
+
+        with mock.patch("src.history.fetch_solver_day", fetch_solver_day):
+            ingest(dune, history, date(2022, 3, 1), date(2022, 3, 4))
+            self.assertEqual(len(fetched), 3)
+            self.assertEqual(
+                refresh(dune, history, date(2022, 3, 1), date(2022, 3, 4)), []
+            )
+
+            dune.batches["2022-03-02"] = 5
+            self.assertEqual(
+                refresh(dune, history, date(2022, 3, 1), date(2022, 3, 4)),
+                [date(2022, 3, 2)],
+            )
+        self.assertEqual(fetched[3:], [date(2022, 3, 2)])
+        self.assertEqual(
+            [
+                rec.slippage_wei
+                for rec in history.range(date(2022, 3, 1), date(2022, 3, 4))
+            ],
+            [1, 4, 3],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from datetime import date
+
+from src.history import Rollup, SolverDay, SolverHistory
+from src.models import Address
+
+ONE_ADDRESS = Address("0x1111111111111111111111111111111111111111")
+TWO_ADDRESS = Address("0x2222222222222222222222222222222222222222")
+
+
+def solver_days(day: date) -> list[SolverDay]:
+    return [
+        SolverDay(day, ONE_ADDRESS, "One", -(10**19), 3 * 10**19, 10**21),
+        SolverDay(day, TWO_ADDRESS, "Two", 5, 7, 11),
+    ]
+
+
+class TestSolverHistory(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.history = SolverHistory(self.tmp_dir.name)
+        for day in [date(2022, 3, 1), date(2022, 3, 2), date(2022, 4, 1)]:
+            self.history.append(day, solver_days(day))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_range(self):
+        self.assertEqual(len(self.history), 6)
+        self.assertEqual(self.history.last_day(), date(2022, 4, 1))
+        self.assertEqual(
+            self.history.range(date(2022, 3, 2), date(2022, 4, 1)),
+            solver_days(date(2022, 3, 2)),
+        )
+        self.assertEqual(
+            self.history.range(date(2022, 1, 1), date(2023, 1, 1), TWO_ADDRESS),
+            [solver_days(d)[1] for d in [date(2022, 3, 1), date(2022, 3, 2)]]
+            + [solver_days(date(2022, 4, 1))[1]],
+        )
+        self.assertEqual(self.history.range(date(2022, 3, 3), date(2022, 3, 31)), [])
+
+    def test_rollup(self):
+        monthly = self.history.rollup(
+            date(2022, 3, 1), date(2022, 5, 1), Rollup.MONTH, ONE_ADDRESS
+        )
+        self.assertEqual(
+            monthly,
+            [
+                SolverDay(
+                    date(2022, 3, 1),
+                    ONE_ADDRESS,
+                    "One",
+                    -2 * 10**19,
+                    6 * 10**19,
+                    2 * 10**21,
+                ),
+                solver_days(date(2022, 4, 1))[0],
+            ],
+        )
+
+    def test_reopen_and_append_only(self):
+        reopened = SolverHistory(self.tmp_dir.name)
+        self.assertEqual(reopened.solvers, self.history.solvers)
+        with self.assertRaises(ValueError) as err:
+            reopened.append(date(2022, 4, 1), [])
+        self.assertEqual(
+            str(err.exception),
+            "History is append-only: 2022-04-01 is not after 2022-04-01",
+        )
+
+    def test_replace(self):
+        replaced = [SolverDay(date(2022, 3, 2), TWO_ADDRESS, "Two", 1, 2, 3)]
+        self.history.replace(date(2022, 3, 2), replaced)
+        self.assertEqual(len(self.history), 5)
+        self.assertEqual(
+            self.history.range(date(2022, 3, 2), date(2022, 3, 3)), replaced
+        )
+        self.assertEqual(
+            SolverHistory(self.tmp_dir.name).range(date(2022, 3, 1), date(2022, 5, 1)),
+            solver_days(date(2022, 3, 1)) + replaced + solver_days(date(2022, 4, 1)),
+        )
+
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            empty = SolverHistory(tmp_dir)
+            self.assertIsNone(empty.last_day())
+            self.assertEqual(empty.range(date(2022, 1, 1), date(2023, 1, 1)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
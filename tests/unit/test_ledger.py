@@ -0,0 +1,91 @@
+import unittest
+from dataclasses import replace
+from datetime import datetime
+
+from src.offline.engine import token_imbalances
+from src.offline.ledger import (
+    BufferLedger,
+    Settlement,
+    TokenFlows,
+    apply_period,
+    period_settlements,
+)
+from src.offline.synthetic import SyntheticConfig, generate
+from tests.unit.test_offline_engine import USDC, WETH, single_swap
+
+
+def settlement(tx_hash: str, block: int, flows: dict, tx_index=0) -> Settlement:
+    return Settlement(tx_hash, block, tx_index, datetime(2022, 3, 1), flows)
+
+
+class TestBufferLedger(unittest.TestCase):
+    def test_single_swap(self):
+        ledger = apply_period(BufferLedger(), single_swap(1996 * 10**6))
+        self.assertEqual(
+            ledger.flows("0x01"),
+            {
+                WETH: TokenFlows(user_in=10**18, amm_out=10**18),
+                USDC: TokenFlows(user_out=2000 * 10**6, amm_in=1996 * 10**6),
+            },
+        )
+        self.assertEqual(ledger.imbalance("0x01"), {WETH: 0, USDC: -4 * 10**6})
+        self.assertEqual(ledger.snapshot(), {WETH: 0, USDC: -4 * 10**6})
+
+    def test_snapshots(self):
+        ledger = BufferLedger()
+        ledger.apply(settlement("0x01", 1, {WETH: TokenFlows(user_in=5)}))
+        ledger.apply(settlement("0x02", 2, {USDC: TokenFlows(amm_in=7)}))
+        ledger.apply(settlement("0x03", 3, {WETH: TokenFlows(user_out=2)}))
+        self.assertEqual(ledger.balance(WETH, 0), 0)
+        self.assertEqual(ledger.balance(WETH, 1), 5)
+        self.assertEqual(ledger.balance(WETH, 2), 5)
+        self.assertEqual(ledger.balance(WETH), 3)
+        self.assertEqual(ledger.balance_after(WETH, "0x02"), 5)
+        self.assertEqual(ledger.drift(WETH, 1, 3), -2)
+        self.assertEqual(ledger.snapshot(2), {WETH: 5, USDC: 7})
+        self.assertEqual(ledger.balance("0xunknown"), 0)
+
+        with self.assertRaises(ValueError):
+            ledger.apply(settlement("0x04", 2, {}))
+        with self.assertRaises(ValueError):
+            ledger.apply(settlement("0x03", 4, {}))
+
+    def test_settlements_of_a_block(self):
+        raw = generate(SyntheticConfig(days=1, batches_per_day=8, seed=1))
+        # Three settlements in one block, listed against their order in it
+        raw.batches = [
+            replace(batch, block_number=1, tx_index=2 - i)
+            for i, batch in enumerate(raw.batches[:3])
+        ]
+        ledger = apply_period(BufferLedger(), raw)
+        self.assertEqual(
+            [s.tx_hash for s in ledger.settlements],
+            [batch.tx_hash for batch in reversed(raw.batches)],
+        )
+        first, _, last = ledger.settlements
+        for token, flows in first.flows.items():
+            self.assertEqual(ledger.balance_after(token, first.tx_hash), flows.net)
+        self.assertEqual(set(ledger.snapshot(0).values()), {0})
+        self.assertEqual(ledger.snapshot(1), ledger.snapshot())
+        self.assertEqual(
+            {t: ledger.balance_after(t, last.tx_hash) for t in last.flows},
+            {t: ledger.balance(t) for t in last.flows},
+        )
+        with self.assertRaises(ValueError):
+            ledger.apply(settlement("0x04", 1, {}, tx_index=1))
+
+    def test_synthetic_period(self):
+        raw = generate(SyntheticConfig(days=2, batches_per_day=50, seed=1))
+        ledger = apply_period(BufferLedger(), raw)
+        self.assertEqual(len(ledger), len(raw.batches))
+        for tx_hash, amounts in token_imbalances(raw).items():
+            self.assertEqual(ledger.imbalance(tx_hash), dict(amounts))
+        totals: dict[str, int] = {}
+        for settlement in period_settlements(raw):
+            for token, flows in settlement.flows.items():
+                totals[token] = totals.get(token, 0) + flows.net
+        self.assertEqual(ledger.snapshot(), totals)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+from dataclasses import replace
+
+from src.models import Address
+from src.offline.engine import (
+    TokenTransfer,
+    Trade,
+    TransferType,
+    batch_transfers,
+    period_slippage,
+)
+from src.offline.logs import (
+    TRANSFER_TOPIC,
+    decode_transfers,
+    load_log_dump,
+)
+from src.offline.synthetic import SETTLEMENT_CONTRACT, SyntheticConfig, generate
+
+CONTRACT = Address(SETTLEMENT_CONTRACT)
+TRADER = "0x0000000000000000000000000000000000000001"
+AMM = "0x0000000000000000000000000000000000000002"
+TOKEN = "0x0000000000000000000000000000000000000003"
+
+
+def topic(address: str) -> str:
+    return "0x" + address[2:].rjust(64, "0")
+
+
+def transfer_log(transfer: TokenTransfer) -> dict:
+    return {
+        "address": transfer.token,
+        "topics": [TRANSFER_TOPIC, topic(transfer.sender), topic(transfer.receiver)],
+        "data": hex(transfer.amount),
+        "transactionHash": transfer.tx_hash,
+    }
+
+
+def noise(tx_hash: str) -> list[dict]:
+    unrelated = transfer_log(TokenTransfer(tx_hash, TRADER, AMM, TOKEN, 1))
+    nft = transfer_log(TokenTransfer(tx_hash, SETTLEMENT_CONTRACT, AMM, TOKEN, 1))
+    nft["topics"].append(topic(TOKEN))
+    nft["data"] = "0x"
+    other_event = dict(unrelated, topics=["0x" + "ab" * 32, topic(SETTLEMENT_CONTRACT)])
+    return [unrelated, nft, other_event]
+
+
+class TestLogs(unittest.TestCase):
+    def test_decode_transfers(self):
+        raw = generate(SyntheticConfig(days=1, batches_per_day=50))
+        logs = [transfer_log(t) for t in raw.transfers]
+        mixed = [log for i, log in enumerate(logs) for log in [log] + noise(str(i))]
+        self.assertEqual(decode_transfers(mixed, CONTRACT), raw.transfers)
+
+        # Slippage from decoded node data equals the one from Dune's transfer table
+        decoded = replace(raw, transfers=decode_transfers(logs, CONTRACT))
+        self.assertEqual(period_slippage(decoded), period_slippage(raw))
+
+    def test_empty_data_is_zero(self):
+        log = transfer_log(TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, TOKEN, 0))
+        log["data"] = "0x"
+        self.assertEqual(
+            decode_transfers([log], CONTRACT),
+            [TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, TOKEN, 0)],
+        )
+
+    def test_load_log_dump(self):
+        logs = [transfer_log(TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, TOKEN, 5))]
+        with tempfile.TemporaryDirectory() as path:
+            dump = os.path.join(path, "logs.jsonl")
+            with open(dump, "w", encoding="utf-8") as file:
+                file.write(json.dumps({"transactionHash": "0x01", "logs": logs}) + "\n")
+                file.write(json.dumps(noise("0x02")[0]) + "\n")
+            self.assertEqual(
+                decode_transfers(load_log_dump(dump), CONTRACT),
+                [TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, TOKEN, 5)],
+            )
+
+    def test_batch_transfers(self):
+        trades = [Trade("0x01", TRADER, TRADER, TOKEN, AMM, 10, 20)]
+        transfers = [
+            # The user's sell transfer, already accounted for by the trade
+            TokenTransfer("0x01", TRADER, SETTLEMENT_CONTRACT, TOKEN, 10),
+            TokenTransfer("0x01", SETTLEMENT_CONTRACT, AMM, TOKEN, 10),
+            TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, AMM, 21),
+        ]
+        self.assertEqual(
+            [
+                (t.transfer_type, t.amount)
+                for t in batch_transfers(trades, transfers, SETTLEMENT_CONTRACT)
+            ],
+            [
+                (TransferType.IN_USER, 10),
+                (TransferType.OUT_USER, 20),
+                (TransferType.OUT_AMM, 10),
+                (TransferType.IN_AMM, 21),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,17 @@
+import copy
+import gc
+import os
+import pickle
 import unittest
+from dataclasses import FrozenInstanceError
+from unittest import mock
+
+from duneapi.types import Network
+from web3 import Web3
 
 from src.fetch.period_slippage import SolverSlippage
 from src.fetch.transfer_file import TokenType, Transfer
-from src.models import AccountingPeriod, Address
+from src.models import _ADDRESS_BOOK, AccountingPeriod, Address, NETWORKS
 from tests.e2e.test_internal_trades import TransferType
 
 ONE_ADDRESS = Address("0x1111111111111111111111111111111111111111")
@@ -32,6 +41,51 @@ class TestAddress(unittest.TestCase):
             "0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB",
         )
 
+    def test_from_checksum(self):
+        address = Address(self.lower_case_address)
+        copy = Address.from_checksum(str(address))
+        self.assertEqual(copy, address)
+        self.assertEqual(hash(copy), hash(address))
+        self.assertFalse(hasattr(address, "__dict__"))
+
+        # A wrongly cased string does not change the (shared) checksum
+        wrong_case = "0x" + "1234567890abcdef1234567890abcdef12345678".upper()
+        shared = Address.from_checksum(wrong_case)
+        self.assertEqual(str(shared), Web3.toChecksumAddress(wrong_case))
+        self.assertEqual(str(Address(wrong_case.lower())), str(shared))
+
+    def test_dictionary_encoded(self):
+        address = Address(self.lower_case_address)
+        self.assertIs(Address(self.lower_case_address.upper()[2:]), address)
+        self.assertIs(Address.from_id(address.id), address)
+        self.assertNotEqual(address.id, Address(self.check_sum_address).id)
+        self.assertEqual(hash(address), address.id)
+        self.assertEqual(address.hex, self.lower_case_address)
+        # Pickled by string, as ids are only valid within a process
+        self.assertIn(self.lower_case_address.encode(), pickle.dumps(address))
+        self.assertIs(pickle.loads(pickle.dumps(address)), address)
+        self.assertIs(copy.deepcopy(address), address)
+
+    def test_unreferenced_evicted(self):
+        address = Address("0x" + "5e" * 20)
+        address_id = address.id
+        size = len(_ADDRESS_BOOK)
+        del address
+        gc.collect()
+        self.assertEqual(len(_ADDRESS_BOOK), size - 1)
+        with self.assertRaises(KeyError):
+            Address.from_id(address_id)
+        # Created anew, with an id no other address has had
+        self.assertGreater(Address("0x" + "5e" * 20).id, address_id)
+
+    def test_lazy_checksum(self):
+        address = Address("0x" + "ab" * 20)
+        self.assertIsNone(address._checksummed)
+        self.assertEqual(NETWORKS[Network.MAINNET].bytea(address), "\\x" + "ab" * 20)
+        self.assertIsNone(address._checksummed)
+        self.assertEqual(str(address), "0xABaBaBaBABabABabAbAbABAbABabababaBaBABaB")
+        self.assertEqual(address._checksummed, str(address))
+
 
 class TestTransferType(unittest.TestCase):
     def setUp(self) -> None:
@@ -85,6 +139,14 @@ class TestTransfer(unittest.TestCase):
             f"Invalid adjustment {transfer} by {overdraft_slippage.amount_wei / 10 ** 18}",
         )
 
+    def test_records_are_slotted(self):
+        slippage = SolverSlippage(
+            solver_name="Test Solver", solver_address=ONE_ADDRESS, amount_wei=1
+        )
+        self.assertFalse(hasattr(slippage, "__dict__"))
+        with self.assertRaises(FrozenInstanceError):
+            slippage.amount_wei = 2  # type: ignore
+
     def test_receiver_error(self):
         transfer = Transfer(
             token_type=TokenType.NATIVE,
@@ -164,5 +226,26 @@ class TestAccountingPeriod(unittest.TestCase):
         )
 
 
+class TestNetworkConfig(unittest.TestCase):
+    def test_query_id(self):
+        mainnet, gchain = NETWORKS[Network.MAINNET], NETWORKS[Network.GCHAIN]
+        with mock.patch.dict(os.environ, {"DUNE_QUERY_ID": "1"}):
+            self.assertEqual(mainnet.query_id(), 1)
+            self.assertEqual(gchain.query_id(), 1)
+        with mock.patch.dict(
+            os.environ, {"DUNE_QUERY_ID": "1", "DUNE_QUERY_ID_GCHAIN": "2"}
+        ):
+            self.assertEqual(mainnet.query_id(), 1)
+            self.assertEqual(gchain.dune_query("Test", "", []).query_id, 2)
+
+    def test_bytea(self):
+        mainnet = NETWORKS[Network.MAINNET]
+        self.assertEqual(str(mainnet), "mainnet")
+        self.assertEqual(
+            mainnet.bytea(mainnet.settlement_contract),
+            "\\x9008d19f58aabd9ed0d60971565aa8510560ab41",
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
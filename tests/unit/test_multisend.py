@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.fetch.transfer_file import TokenType, Transfer
+from src.models import AccountingPeriod, Address
+from src.multisend import GasModel, plan_multisend, write_multisend_files
+
+COW = Address("0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB")
+MODEL = GasModel(base=10, native=1, erc20=2)
+
+
+def solver(i: int) -> Address:
+    return Address(f"0x{i:040x}")
+
+
+def payout(i: int) -> list[Transfer]:
+    return [
+        Transfer(TokenType.NATIVE, None, solver(i), 1.0),
+        Transfer(TokenType.ERC20, COW, solver(i), 100.0),
+    ]
+
+
+class TestMultisend(unittest.TestCase):
+    def test_single_chunk(self):
+        transfers = payout(1) + payout(2)
+        (chunk,) = plan_multisend(transfers, gas_budget=100, gas_model=MODEL)
+        self.assertEqual(chunk.estimated_gas, 16)
+        self.assertEqual(chunk.native_total(), 2.0)
+        self.assertEqual(chunk.erc20_totals(), {str(COW): 200.0})
+
+    def test_chunks_respect_budget_and_keep_receivers_together(self):
+        # Interleaved, so that grouping by receiver is exercised
+        transfers = [t for pair in zip(*(payout(i) for i in range(7))) for t in pair]
+        chunks = plan_multisend(transfers, gas_budget=20, gas_model=MODEL)
+        self.assertEqual([len(c.transfers) for c in chunks], [6, 6, 2])
+        for chunk in chunks:
+            self.assertLessEqual(chunk.estimated_gas, 20)
+        receivers = [{t.receiver for t in chunk.transfers} for chunk in chunks]
+        for i, first in enumerate(receivers):
+            for second in receivers[i + 1 :]:
+                self.assertEqual(first & second, set())
+        self.assertEqual(sum(len(c.transfers) for c in chunks), len(transfers))
+        # Deterministic regardless of input order
+        self.assertEqual(
+            plan_multisend(transfers[::-1], gas_budget=20, gas_model=MODEL)[0]
+            .transfers[0]
+            .receiver,
+            solver(0),
+        )
+
+    def test_receiver_exceeding_budget(self):
+        with self.assertRaises(ValueError):
+            plan_multisend(payout(1), gas_budget=12, gas_model=MODEL)
+
+    def test_write_files(self):
+        chunks = plan_multisend(
+            [t for i in range(3) for t in payout(i)], gas_budget=15, gas_model=MODEL
+        )
+        period = AccountingPeriod("2022-03-01")
+        with tempfile.TemporaryDirectory() as path:
+            with open(write_multisend_files(chunks, period, path, 15), "r") as file:
+                manifest = json.load(file)
+            self.assertEqual(manifest["gas_budget"], 15)
+            self.assertEqual(len(manifest["chunks"]), 3)
+            for entry in manifest["chunks"]:
+                self.assertTrue(os.path.exists(os.path.join(path, entry["file"])))
+                self.assertEqual(entry["native_total"], 1.0)
+                self.assertEqual(entry["erc20_totals"], {str(COW): 100.0})
+            self.assertEqual(
+                manifest["chunks"][0]["file"], f"transfers-{period}-1-of-3.csv"
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime
+
+from src.fetch.transfer_file import TokenType
+from src.models import Address
+from src.offline.engine import (
+    Batch,
+    RawPeriod,
+    TokenTransfer,
+    Trade,
+    imbalance_table,
+    period_slippage,
+    reimbursements,
+    token_imbalances,
+    transfers,
+)
+from src.offline.clearing_prices import NATIVE_TOKEN
+from src.offline.synthetic import SETTLEMENT_CONTRACT, SyntheticConfig, generate
+
+SOLVER = "0x149d0f9282333681ee41d30589824b2798e9fb47"
+TRADER = "0x0000000000000000000000000000000000000001"
+AMM = "0x0000000000000000000000000000000000000002"
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+COW = Address("0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB")
+
+
+def single_swap(received_usdc: int) -> RawPeriod:
+    """A user sells 1 WETH for 2000 USDC, which the solver buys on an AMM"""
+    return RawPeriod(
+        settlement_contract=SETTLEMENT_CONTRACT,
+        batches=[
+            Batch("0x01", datetime(2022, 3, 1), SOLVER, "Otex", 1, 1, 10**6, 50.0)
+        ],
+        trades=[Trade("0x01", TRADER, TRADER, WETH, USDC, 10**18, 2000 * 10**6)],
+        transfers=[
+            TokenTransfer("0x01", SETTLEMENT_CONTRACT, AMM, WETH, 10**18),
+            TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, USDC, received_usdc),
+        ],
+        clearing_prices={"0x01": {WETH: 2000 * 10**18, USDC: 10**30}},
+        usd_prices={WETH: 2000.0, USDC: 1.0},
+        decimals={WETH: 18, USDC: 6},
+        end_prices={WETH: 2000.0, USDC: 1.0},
+        eth_price=2000.0,
+        token_list=[WETH, USDC],
+    )
+
+
+class TestOfflineEngine(unittest.TestCase):
+    def test_token_imbalances(self):
+        self.assertEqual(
+            token_imbalances(single_swap(1996 * 10**6)),
+            {"0x01": {WETH: 0, USDC: -4 * 10**6}},
+        )
+        table = imbalance_table(single_swap(1996 * 10**6))
+        self.assertEqual(len(table.imbalances), 1)
+        self.assertEqual(table.imbalances[0].usd_value, -4.0)
+        self.assertEqual(table.imbalances[0].clearing_value, -4.0 * 10**36)
+
+    def test_native_token_is_wrapped(self):
+        # A user buys 1 ETH for 2000 USDC, which the solver sells for WETH on an AMM
+        raw = single_swap(0)
+        raw.trades = [
+            Trade("0x01", TRADER, TRADER, USDC, NATIVE_TOKEN, 2000 * 10**6, 10**18)
+        ]
+        raw.transfers = [
+            TokenTransfer("0x01", SETTLEMENT_CONTRACT, AMM, USDC, 2000 * 10**6),
+            TokenTransfer("0x01", AMM, SETTLEMENT_CONTRACT, WETH, 10**18),
+        ]
+        self.assertEqual(token_imbalances(raw), {"0x01": {USDC: 0, WETH: 0}})
+        self.assertEqual(imbalance_table(raw).imbalances, [])
+
+    def test_excluded_batches(self):
+        raw = single_swap(1996 * 10**6)
+        raw.batches = [
+            Batch("0x01", datetime(2022, 3, 1), SOLVER, "Otex", 0, 2, 10**6, 50.0)
+        ]
+        self.assertEqual(token_imbalances(raw), {})
+
+    def test_slippage_and_transfers(self):
+        raw = single_swap(1996 * 10**6)
+        slippage = period_slippage(raw)
+        self.assertEqual(slippage.positive, [])
+        self.assertEqual(slippage.sum_negative(), -2 * 10**15)
+
+        self.assertEqual(
+            [(t.token_type, t.amount) for t in reimbursements(raw, COW)],
+            [(TokenType.NATIVE, 0.05), (TokenType.ERC20, 100.0)],
+        )
+        adjusted = transfers(raw, COW)
+        self.assertAlmostEqual(adjusted[0].amount, 0.048)
+        self.assertEqual(adjusted[0].receiver, Address(SOLVER))
+
+    def test_synthetic_data_is_consistent(self):
+        raw = generate(SyntheticConfig(days=1, batches_per_day=50, num_tokens=10))
+        self.assertEqual(len(raw.batches), 50)
+        for trade in raw.trades:
+            prices = raw.clearing_prices[trade.tx_hash]
+            # Uniform clearing prices (up to rounding of the bought amount)
+            self.assertLessEqual(
+                trade.atoms_bought * prices[trade.buy_token],
+                trade.atoms_sold * prices[trade.sell_token],
+            )
+        # Deterministic for a given seed
+        self.assertEqual(
+            generate(SyntheticConfig(days=1, batches_per_day=50, num_tokens=10)), raw
+        )
+        batches = {batch.tx_hash for batch in raw.batches}
+        self.assertTrue(all(t.tx_hash in batches for t in raw.transfers))
+        solvers = {batch.solver_address for batch in raw.batches}
+        self.assertEqual(len(reimbursements(raw, COW)), 2 * len(solvers))
+
+
+if __name__ == "__main__":
+    unittest.main()
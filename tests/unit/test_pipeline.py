@@ -0,0 +1,130 @@
+import tempfile
+import threading
+import unittest
+
+from src.pipeline import Pipeline, Stage, run_concurrently
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.calls: list[str] = []
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def stage(self, name, func, deps=(), **kwargs) -> Stage:
+        def recorded(**inputs):
+            self.calls.append(name)
+            return func(**inputs)
+
+        return Stage(name, recorded, deps, **kwargs)
+
+    def pipeline(self, fail_sum: bool = False) -> Pipeline:
+        def add(one, two):
+            if fail_sum:
+                raise RuntimeError("Failed!")
+            return one + two
+
+        return Pipeline(
+            [
+                self.stage("one", lambda: 1),
+                self.stage("two", lambda: 2),
+                self.stage("sum", add, ("one", "two")),
+                self.stage("out", lambda sum: [sum], ("sum",), checkpoint=False),
+            ],
+            self.tmp_dir.name,
+        )
+
+    def test_run_and_resume(self):
+        self.assertEqual(
+            self.pipeline().run(), {"one": 1, "two": 2, "sum": 3, "out": [3]}
+        )
+        self.assertEqual(sorted(self.calls), ["one", "out", "sum", "two"])
+
+        self.calls.clear()
+        self.assertEqual(self.pipeline().run(["out"]), {"out": [3]})
+        # Only the stage without checkpoint reran
+        self.assertEqual(self.calls, ["out"])
+
+    def test_only_required_stages(self):
+        self.assertEqual(self.pipeline().run(["two"]), {"two": 2})
+        self.assertEqual(self.calls, ["two"])
+
+    def test_failure_keeps_checkpoints(self):
+        with self.assertRaises(RuntimeError):
+            self.pipeline(fail_sum=True).run()
+        self.assertEqual(sorted(self.calls), ["one", "sum", "two"])
+
+        self.calls.clear()
+        self.assertEqual(self.pipeline().run(["out"]), {"out": [3]})
+        self.assertEqual(self.calls, ["sum", "out"])
+
+    def test_replace(self):
+        pipeline = self.pipeline()
+        pipeline.run()
+        self.calls.clear()
+        pipeline.replace("two", 20)
+        self.assertEqual(pipeline.run(["out"]), {"out": [21]})
+        self.assertEqual(self.calls, ["sum", "out"])
+        with self.assertRaises(ValueError):
+            pipeline.replace("out", [0])
+
+    def test_invalidate(self):
+        pipeline = self.pipeline()
+        pipeline.run()
+        pipeline.invalidate("two")
+        self.assertTrue(pipeline.is_complete("one"))
+        self.assertFalse(pipeline.is_complete("two"))
+        self.assertFalse(pipeline.is_complete("sum"))
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline(
+            [Stage("a", barrier.wait), Stage("b", barrier.wait)], self.tmp_dir.name
+        )
+        # Would raise BrokenBarrierError if the stages ran sequentially
+        pipeline.run()
+
+    def test_shared_resource_is_exclusive(self):
+        active = []
+
+        def exclusive():
+            active.append(1)
+            self.assertEqual(len(active), 1)
+            threading.Event().wait(0.01)
+            active.pop()
+
+        Pipeline(
+            [Stage(name, exclusive, resource="dune") for name in "abc"],
+            self.tmp_dir.name,
+        ).run()
+
+    def test_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def stage(name: str) -> Stage:
+            # Both pipelines must be running at the same time to pass the barrier
+            return Stage("a", lambda: (barrier.wait(), name)[1])
+
+        with tempfile.TemporaryDirectory() as other_dir:
+            results = run_concurrently(
+                [
+                    (Pipeline([stage("first")], self.tmp_dir.name), ["a"]),
+                    (Pipeline([stage("second")], other_dir), ["a"]),
+                ],
+                max_workers=2,
+            )
+        self.assertEqual(results, [{"a": "first"}, {"a": "second"}])
+
+    def test_invalid_graphs(self):
+        with self.assertRaises(ValueError) as err:
+            Pipeline([Stage("a", int, ("b",)), Stage("b", int, ("a",))], "")
+        self.assertEqual(str(err.exception), "Cyclic dependency involving stage a")
+        with self.assertRaises(ValueError) as err:
+            Pipeline([Stage("a", int, ("c",))], "")
+        self.assertEqual(str(err.exception), "Stage a depends on unknown c")
+
+
+if __name__ == "__main__":
+    unittest.main()
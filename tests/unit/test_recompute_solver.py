@@ -0,0 +1,149 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from duneapi.types import Network
+
+from src.fetch.accounting import recompute_solver, recompute_solvers
+from src.fetch.period_slippage import SolverSlippage, SplitSlippages
+from src.models import AccountingPeriod, Address
+from src.pipeline import Pipeline, Stage
+
+ONE = Address("0x1111111111111111111111111111111111111111")
+TWO = Address("0x2222222222222222222222222222222222222222")
+PERIOD = AccountingPeriod("2022-03-01")
+
+
+def slippages(*amounts: tuple[Address, int]) -> SplitSlippages:
+    result = SplitSlippages()
+    for solver, amount in amounts:
+        result.append(SolverSlippage(solver, "Solver", amount))
+    return result
+
+
+class TestRecomputeSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.calls: list[str] = []
+        self.fetched: list[Address] = []
+        self.token_list = ["0x01"]
+        self.queries: list[str] = []
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def pipeline(self, *_) -> Pipeline:
+        def stage(name, func, deps=()):
+            def recorded(**inputs):
+                self.calls.append(name)
+                return func(**inputs)
+
+            return Stage(name, recorded, deps)
+
+        return Pipeline(
+            [
+                stage("token_list", lambda: list(self.token_list)),
+                stage(
+                    "slippage_query",
+                    lambda token_list: f"select {', '.join(token_list)}",
+                    ("token_list",),
+                ),
+                stage(
+                    "slippage",
+                    lambda slippage_query: slippages((ONE, -5), (TWO, 3)),
+                    ("slippage_query",),
+                ),
+                stage(
+                    "transfers",
+                    lambda slippage: sorted(s.amount_wei for s in slippage.negative),
+                    ("slippage",),
+                ),
+                stage(
+                    "tx_solvers",
+                    lambda: {"0x" + "ab" * 32: TWO},
+                ),
+            ],
+            self.tmp_dir.name,
+        )
+
+    def get_period_slippage(self, dune, period, raw_sql, network, solver):
+        self.queries.append(raw_sql)
+        self.fetched.append(solver)
+        return slippages((solver, -7))
+
+    def patched(self):
+        return mock.patch.multiple(
+            "src.fetch.accounting",
+            accounting_pipeline=self.pipeline,
+            get_period_slippage=self.get_period_slippage,
+            fetch_trusted_tokens=lambda: list(self.token_list),
+            sync_registry=mock.DEFAULT,
+            slippage_query=lambda token_list, registry, network: (
+                f"select {', '.join(token_list)}"
+            ),
+        )
+
+    def test_recompute_solver(self):
+        with self.patched():
+            self.assertEqual(
+                self.pipeline().run(["transfers", "tx_solvers"])["transfers"], [-5]
+            )
+            self.calls.clear()
+            # e.g. the root cause of the solver's slippage is fixed in the token list
+            self.token_list.append("0x02")
+            merged = recompute_solver(None, PERIOD, Network.MAINNET, TWO)
+        self.assertEqual(self.fetched, [TWO])
+        self.assertEqual(self.queries, ["select 0x01, 0x02"])
+        # The query is built aside, no stored result other than the slippage is lost
+        self.assertEqual(self.calls, [])
+        self.assertEqual(
+            [(s.solver_address, s.amount_wei) for s in merged.negative],
+            [(ONE, -5), (TWO, -7)],
+        )
+        self.assertEqual(merged.positive, [])
+        # The stored slippage is patched, and only its dependents are recomputed
+        self.assertEqual(
+            self.pipeline().run(["transfers", "tx_solvers"])["transfers"], [-7, -5]
+        )
+        self.assertEqual(self.calls, ["transfers"])
+
+    def test_recompute_by_transaction(self):
+        fingerprinted: list[list[Network]] = []
+
+        def network_fingerprints(dune, period, networks):
+            fingerprinted.append(networks)
+            return {network: {} for network in networks}
+
+        def run_networks(dune, period, networks, target, fingerprints=None):
+            # Every run of the invocation shares the fingerprints fetched once
+            self.assertEqual(set(fingerprints), set(networks))
+            return {
+                network: self.pipeline().run([target])[target] for network in networks
+            }
+
+        with self.patched(), mock.patch.multiple(
+            "src.fetch.accounting",
+            run_networks=run_networks,
+            network_fingerprints=network_fingerprints,
+        ):
+            results = recompute_solvers(
+                None, PERIOD, [Network.MAINNET], "0x" + "AB" * 32
+            )
+            self.assertEqual(results[Network.MAINNET][0], TWO)
+            self.assertEqual(
+                recompute_solvers(None, PERIOD, [Network.MAINNET], "0x" + "cd" * 32), {}
+            )
+        self.assertEqual(self.fetched, [TWO])
+        self.assertEqual(fingerprinted, [[Network.MAINNET], [Network.MAINNET]])
+
+    def test_merge_solver(self):
+        stored = slippages((ONE, -5), (TWO, 3))
+        merged = stored.merge_solver(ONE, slippages((ONE, 2)))
+        self.assertEqual(merged.negative, [])
+        self.assertEqual([s.amount_wei for s in merged.positive], [3, 2])
+        with self.assertRaises(ValueError):
+            stored.merge_solver(ONE, slippages((TWO, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from datetime import date, datetime
+from unittest import mock
+
+from src.models import AccountingPeriod, Address
+from src.registry import (
+    Registry,
+    SolverInfo,
+    SolverRole,
+    TokenInfo,
+    registry_tables_query,
+    solver_registry_query,
+    sync_registry,
+    token_registry_query,
+)
+
+QUASIMODO = "0x77ec2a722c2393d3fd64617bbaf1499c713e616b"
+WITHDRAW = "0xa03be496e67ec29bc62f01a428683d7f9c204930"
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+COW = "0xdef1ca1fb7fbcdc777520aa7f396b4e015f497ab"
+
+
+class FakeDune:
+    def __init__(self, solvers, tokens):
+        self.results = {"Solver Registry": solvers, "Token Registry": tokens}
+        self.queries = []
+
+    def fetch(self, query):
+        self.queries.append(query)
+        return self.results[query.name]
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_roles(self):
+        self.assertEqual(SolverRole.from_name("QuasiModo"), SolverRole.BUFFER_TRADER)
+        self.assertEqual(SolverRole.from_name("Withdraw"), SolverRole.WITHDRAW)
+        self.assertEqual(SolverRole.from_name("1inch"), SolverRole.SOLVER)
+
+    def test_save_load(self):
+        registry = Registry(self.path)
+        registry.add_solver(
+            SolverInfo(Address(QUASIMODO), "QuasiModo", SolverRole.BUFFER_TRADER)
+        )
+        registry.add_token(
+            TokenInfo(
+                WETH.upper().replace("0X", "0x"),
+                "WETH",
+                18,
+                date(2021, 3, 3),
+                date(2022, 2, 28),
+            )
+        )
+        registry.synced_until = datetime(2022, 3, 1)
+        registry.save()
+
+        loaded = Registry.load(path=self.path)
+        self.assertEqual(loaded, registry)
+        self.assertEqual(loaded.token(WETH).decimals, 18)
+        self.assertEqual(loaded.solver(Address(QUASIMODO)).name, "QuasiModo")
+        self.assertEqual(
+            loaded.solvers_with_role(SolverRole.BUFFER_TRADER),
+            [registry.solver(Address(QUASIMODO))],
+        )
+
+    def test_queries(self):
+        registry = Registry(self.path)
+        # Nothing synced yet: the live Dune tables are used, not silently though
+        with redirect_stderr(io.StringIO()) as stderr:
+            self.assertIn(
+                'gnosis_protocol_v2."view_solvers"', solver_registry_query(registry)
+            )
+            self.assertIn("erc20.tokens", token_registry_query(registry))
+        self.assertEqual(stderr.getvalue().count("WARNING: registry"), 2)
+
+        registry.add_solver(
+            SolverInfo(Address(WITHDRAW), "Withdraw", SolverRole.WITHDRAW)
+        )
+        registry.add_token(
+            TokenInfo(WETH, "Bob's", 18, date(2022, 3, 1), date(2022, 3, 1))
+        )
+        self.assertEqual(
+            solver_registry_query(registry),
+            "solver_registry as (select * from (VALUES "
+            f"(('\\x{WITHDRAW[2:]}' :: bytea), 'Withdraw', 'withdraw')) "
+            "AS t (address, name, role)),",
+        )
+        self.assertEqual(
+            token_registry_query(registry),
+            "token_registry as (select * from (VALUES "
+            f"(('\\x{WETH[2:]}' :: bytea), 'Bob''s')) AS t (contract_address, symbol)),",
+        )
+        self.assertEqual(
+            registry_tables_query(registry).split("\n"),
+            [solver_registry_query(registry), token_registry_query(registry)],
+        )
+
+    def test_for_period(self):
+        registry = Registry(self.path)
+        registry.add_token(
+            TokenInfo(WETH, "WETH", 18, date(2021, 3, 3), date(2022, 1, 31))
+        )
+        registry.add_token(
+            TokenInfo(COW, "COW", 18, date(2022, 2, 14), date(2022, 2, 14))
+        )
+        # Seen again later on
+        registry.add_token(
+            TokenInfo(WETH, "WETH", 18, date(2022, 3, 2), date(2022, 3, 7))
+        )
+        self.assertEqual(registry.token(WETH).first_seen, date(2021, 3, 3))
+        self.assertEqual(registry.token(WETH).last_seen, date(2022, 3, 7))
+
+        def tokens(start: str) -> list[str]:
+            return sorted(registry.for_period(AccountingPeriod(start)).tokens)
+
+        self.assertEqual(tokens("2022-02-08"), [WETH, COW])
+        self.assertEqual(tokens("2022-02-14"), [WETH, COW])
+        self.assertEqual(tokens("2022-02-15"), [WETH])
+        self.assertEqual(tokens("2022-03-08"), [])
+        self.assertEqual(len(registry.tokens), 2)
+
+    def test_legacy_tokens_resynced(self):
+        os.makedirs(self.path, exist_ok=True)
+        for name, content in [
+            ("solvers.csv", f"{QUASIMODO},QuasiModo,buffer_trader\n"),
+            ("tokens.csv", f"{WETH},WETH,18\n"),
+            ("state.json", '{"synced_until": "2022-03-01T00:00:00"}'),
+        ]:
+            with open(os.path.join(self.path, name), "w", encoding="utf-8") as file:
+                file.write(content)
+        registry = Registry.load(path=self.path)
+        self.assertEqual(registry.tokens, {})
+        self.assertIsNone(registry.synced_until)
+        self.assertEqual(len(registry.solvers), 1)
+
+    @mock.patch.dict(os.environ, {"DUNE_QUERY_ID": "1"})
+    def test_incremental_sync(self):
+        dune = FakeDune(
+            solvers=[{"address": QUASIMODO, "name": "QuasiModo"}],
+            tokens=[
+                {
+                    "token": WETH,
+                    "symbol": "WETH",
+                    "decimals": "18",
+                    "first_seen": "2021-03-03",
+                    "last_seen": "2022-02-28",
+                }
+            ],
+        )
+        registry = sync_registry(dune, until=datetime(2022, 3, 1), path=self.path)
+        self.assertEqual(len(dune.queries), 2)
+        self.assertEqual(registry.token(WETH).symbol, "WETH")
+        self.assertEqual(
+            registry.solver(Address(QUASIMODO)).role, SolverRole.BUFFER_TRADER
+        )
+
+        # Already synced
+        sync_registry(dune, until=datetime(2022, 2, 1), path=self.path)
+        self.assertEqual(len(dune.queries), 2)
+
+        # Only the new days are queried for tokens
+        dune.results["Token Registry"] = []
+        registry = sync_registry(dune, until=datetime(2022, 3, 8), path=self.path)
+        since = dune.queries[-1].parameters[0]
+        self.assertEqual(since.key, "Since")
+        self.assertEqual(since.value, datetime(2022, 3, 1))
+        self.assertEqual(registry.token(WETH).symbol, "WETH")
+        self.assertEqual(
+            Registry.load(path=self.path).synced_until, datetime(2022, 3, 8)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from duneapi.types import DuneQuery, Network, QueryParameter
+
+from src.scheduler import DuneScheduler, Priority, fingerprint
+
+
+def query(name="untitled", sql="select 1", query_id=1, value="a") -> DuneQuery:
+    return DuneQuery(
+        name=name,
+        raw_sql=sql,
+        network=Network.MAINNET,
+        parameters=[QueryParameter.text_type("Value", value)],
+        query_id=query_id,
+    )
+
+
+class RecordingScheduler(DuneScheduler):
+    """Scheduler executing queries locally, blocking until `release` is set"""
+
+    def __init__(self, **kwargs):
+        super().__init__("user", "password", **kwargs)
+        self.executed: list[str] = []
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def _execute(self, query):
+        with self.lock:
+            self.executed.append(query.raw_sql)
+        self.release.wait(timeout=5)
+        if query.raw_sql == "fail":
+            raise RuntimeError("execution failed")
+        return [{"sql": query.raw_sql}]
+
+
+def wait_for(condition, timeout=5.0):
+    event = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        event.wait(0.01)
+    raise TimeoutError("condition not met")
+
+
+class TestScheduler(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint(query()), fingerprint(query(name="other")))
+        self.assertNotEqual(fingerprint(query()), fingerprint(query(value="b")))
+        self.assertNotEqual(fingerprint(query()), fingerprint(query(sql="select 2")))
+        self.assertNotEqual(fingerprint(query()), fingerprint(query(query_id=2)))
+
+    def test_authenticated_from_environment(self):
+        calls: list[str] = []
+
+        def recorder(name, result=None):
+            return lambda *_: calls.append(name) or result
+
+        with mock.patch.dict(
+            os.environ, {"DUNE_USER": "user", "DUNE_PASSWORD": "password"}
+        ), mock.patch("src.scheduler.Telemetry"), mock.patch.multiple(
+            DuneScheduler,
+            login=recorder("login"),
+            fetch_auth_token=recorder("fetch_auth_token"),
+            initiate_query=recorder("initiate_query"),
+            execute_and_await_results=recorder("execute", []),
+        ):
+            dune = DuneScheduler.new_from_environment()
+            self.assertEqual(dune.fetch(query()), [])
+        self.assertEqual(
+            calls, ["login", "fetch_auth_token", "initiate_query", "execute"]
+        )
+
+    def test_identical_requests_are_coalesced(self):
+        dune = RecordingScheduler()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(dune.fetch, query()) for _ in range(4)]
+            wait_for(lambda: dune.coalesced == 3)
+            dune.release.set()
+            results = [future.result() for future in futures]
+        self.assertEqual(dune.executed, ["select 1"])
+        self.assertEqual(results, [[{"sql": "select 1"}]] * 4)
+        # Once completed, the same query is executed again
+        dune.fetch(query())
+        self.assertEqual(len(dune.executed), 2)
+
+    def test_errors_reach_all_callers(self):
+        dune = RecordingScheduler()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(dune.fetch, query(sql="fail")) for _ in range(2)]
+            wait_for(lambda: dune.coalesced == 1)
+            dune.release.set()
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result()
+        self.assertEqual(dune._in_flight, {})
+
+    def test_priority_and_query_serialization(self):
+        dune = RecordingScheduler(max_concurrent=2)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(dune.fetch, query(sql="first"))]
+            wait_for(lambda: dune.executed == ["first"])
+            # Same query id as the running execution, so both have to wait
+            futures.append(
+                pool.submit(dune.fetch, query(sql="low"), Priority.EXPLORATORY)
+            )
+            wait_for(lambda: len(dune._waiting) == 1)
+            futures.append(
+                pool.submit(dune.fetch, query(sql="high"), Priority.CRITICAL)
+            )
+            wait_for(lambda: len(dune._waiting) == 2)
+            self.assertEqual(dune.executed, ["first"])
+            dune.release.set()
+            for future in futures:
+                future.result()
+        self.assertEqual(dune.executed, ["first", "high", "low"])
+
+    def test_priority_from_name(self):
+        dune = RecordingScheduler(max_concurrent=1)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(dune.fetch, query(sql="blocker", query_id=0))]
+            wait_for(lambda: dune.executed == ["blocker"])
+            for name in ["Slippage Accounting per Transaction", "untitled"]:
+                futures.append(pool.submit(dune.fetch, query(name=name, sql=name)))
+                wait_for(lambda: len(dune._waiting) == len(futures) - 1)
+            futures.append(
+                pool.submit(dune.fetch, query(name="Slippage Accounting", sql="crit"))
+            )
+            wait_for(lambda: len(dune._waiting) == 3)
+            dune.release.set()
+            for future in futures:
+                future.result()
+        self.assertEqual(
+            dune.executed,
+            ["blocker", "crit", "untitled", "Slippage Accounting per Transaction"],
+        )
+
+    def test_rate_limit(self):
+        now = [0.0]
+        dune = RecordingScheduler(max_per_minute=2, clock=lambda: now[0])
+        dune.release.set()
+        dune.fetch(query(value="1"))
+        now[0] = 30.0
+        dune.fetch(query(value="2"))
+        self.assertEqual(dune._rate_limit_delay(), 30.0)
+        now[0] = 60.0
+        self.assertEqual(dune._rate_limit_delay(), 0)
+        dune.fetch(query(value="3"))
+        self.assertEqual(dune._rate_limit_delay(), 30.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from duneapi.types import Network
+
+from src.fetch.period_slippage import SolverSlippage, SplitSlippages, TxSlippage
+from src.fetch.period_totals import PeriodTotals
+from src.fetch.transfer_file import TokenType, Transfer
+from src.models import AccountingPeriod, Address
+from src.service import AccountingService, LRUCache, serve
+
+SOLVER = Address("0x1111111111111111111111111111111111111111")
+OTHER = Address("0x2222222222222222222222222222222222222222")
+COW = Address("0xDEf1CA1fb7FBcDC777520aa7f396b4E015F497aB")
+
+
+def results(period: AccountingPeriod) -> dict:
+    slippage = SplitSlippages()
+    slippage.append(SolverSlippage(SOLVER, "One", -(10**17)))
+    slippage.append(SolverSlippage(OTHER, "Two", 5))
+    return {
+        "totals": PeriodTotals(period, 10, 200, 1),
+        "slippage": slippage,
+        "transfers": [
+            Transfer(TokenType.NATIVE, None, SOLVER, 1.5),
+            Transfer(TokenType.ERC20, COW, OTHER, 100.0),
+        ],
+        "slippage_per_tx": [
+            TxSlippage("0x01", SOLVER, "One", -(10**17)),
+            TxSlippage("0x02", OTHER, "Two", 5),
+        ],
+    }
+
+
+class TestService(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fetched = []
+        self.lock = threading.Lock()
+
+        def fetch(network, period, target):
+            with self.lock:
+                self.fetched.append((network, str(period), target))
+            return results(period)[target]
+
+        self.service = AccountingService(fetch, max_results=2)
+        self.server = serve(self.service, "127.0.0.1", 0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path: str, etag=None):
+        request = urllib.request.Request(self.url + path)
+        if etag is not None:
+            request.add_header("If-None-Match", etag)
+        try:
+            with urllib.request.urlopen(request) as response:
+                body = response.read()
+                return response.status, json.loads(body or "null"), response.headers
+        except urllib.error.HTTPError as err:
+            return err.code, json.loads(err.read() or "null"), err.headers
+
+    def test_resources(self):
+        status, totals, _ = self.get("/mainnet/2022-03-01/totals")
+        self.assertEqual(status, 200)
+        self.assertEqual(totals["period"], "2022-03-01-to-2022-03-08")
+        _, slippage, _ = self.get(f"/mainnet/2022-03-01/slippage?solver={OTHER}")
+        self.assertEqual(
+            slippage,
+            [{"solver_address": str(OTHER), "solver_name": "Two", "amount_wei": 5}],
+        )
+        _, transfers, _ = self.get(f"/mainnet/2022-03-01/transfers?solver={SOLVER}")
+        self.assertEqual(transfers[0]["token_type"], "native")
+        _, tx, _ = self.get("/mainnet/2022-03-01/transactions/0x01")
+        # Wei amounts beyond javascript's safe integers are strings
+        self.assertEqual(tx["amount_wei"], str(-(10**17)))
+        self.assertEqual(self.get("/mainnet/2022-03-01/transactions/0x03")[0], 404)
+        self.assertEqual(self.get("/unknown/2022-03-01/totals")[0], 404)
+        self.assertEqual(self.get("/mainnet/2022-03-01/other")[0], 404)
+        self.assertEqual(self.get("/mainnet/march/totals")[0], 400)
+        self.assertEqual(self.get("/gchain/2022-03-01/slippage?solver=0x1")[0], 400)
+
+    def test_solver_argument_not_interned(self):
+        unknown = "0x" + "7a" * 20
+        with mock.patch.object(Address, "__new__", side_effect=AssertionError):
+            status, slippage, _ = self.get(
+                f"/mainnet/2022-03-01/slippage?solver={unknown}"
+            )
+            self.assertEqual((status, slippage), (200, []))
+            # Any case, with or without prefix
+            _, slippage, _ = self.get(
+                f"/mainnet/2022-03-01/slippage?solver={SOLVER.hex[2:].upper()}"
+            )
+        self.assertEqual([row["solver_name"] for row in slippage], ["One"])
+
+    def test_pipeline_errors(self):
+        for error in (KeyError("totals"), ValueError("invalid literal")):
+            self.service.fetch = mock.Mock(side_effect=error)
+            with mock.patch("src.service.BaseHTTPRequestHandler.log_error"):
+                status, body, _ = self.get("/mainnet/2022-03-08/totals")
+            self.assertEqual(status, 500)
+            self.assertIn(type(error).__name__, body["error"])
+        # The server still answers
+        self.assertEqual(self.get("/mainnet/march/totals")[0], 400)
+
+    def test_conditional_requests_and_caching(self):
+        status, _, headers = self.get("/mainnet/2022-03-01/totals")
+        self.assertEqual(
+            self.get("/mainnet/2022-03-01/totals", headers["ETag"])[0], 304
+        )
+        self.assertEqual(self.get("/mainnet/2022-03-01/totals", '"other"')[0], 200)
+        self.get("/mainnet/2022-03-01/transactions")
+        self.get("/mainnet/2022-03-01/transactions/0x02")
+        self.assertEqual(
+            self.fetched,
+            [
+                (Network.MAINNET, "2022-03-01-to-2022-03-08", "totals"),
+                (Network.MAINNET, "2022-03-01-to-2022-03-08", "slippage_per_tx"),
+            ],
+        )
+
+    def test_concurrent_clients_share_computation(self):
+        release = threading.Event()
+        original = self.service.fetch
+
+        def slow_fetch(*args):
+            release.wait(timeout=5)
+            return original(*args)
+
+        with mock.patch.object(self.service, "fetch", slow_fetch):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                futures = [
+                    pool.submit(self.get, f"/mainnet/2022-03-01/transfers?solver={s}")
+                    for s in [SOLVER, OTHER] * 4
+                ]
+                release.set()
+                self.assertTrue(all(f.result()[0] == 200 for f in futures))
+        self.assertEqual(len(self.fetched), 1)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(max_entries=2)
+        self.assertEqual(cache.get("a", lambda: 1), 1)
+        cache.get("b", lambda: 2)
+        cache.get("a", lambda: 0)
+        cache.get("c", lambda: 3)
+        self.assertEqual(len(cache), 2)
+        # "b" was least recently used
+        self.assertEqual(cache.get("b", lambda: 4), 4)
+        self.assertEqual(cache.get("c", lambda: 0), 3)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_expiry(self):
+        now = [0.0]
+        cache = LRUCache(max_entries=2, max_age=60, clock=lambda: now[0])
+        self.assertEqual(cache.get("a", lambda: 1), 1)
+        now[0] = 59.0
+        self.assertEqual(cache.get("a", lambda: 2), 1)
+        now[0] = 60.0
+        self.assertEqual(cache.get("a", lambda: 2), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_failures_are_not_cached(self):
+        cache = LRUCache(max_entries=2)
+        with self.assertRaises(RuntimeError):
+            cache.get("a", mock.Mock(side_effect=RuntimeError))
+        self.assertEqual(cache.get("a", lambda: 1), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+from src.fetch.accounting import local_slippage
+from src.fetch.imbalances import Imbalance, ImbalanceTable
+from src.fetch.period_slippage import SolverSlippage, SplitSlippages
+from src.fetch.transfer_file import TokenType, Transfer
+from src.models import Address
+from src.shadow import (
+    DEFAULT_TOLERANCE_WEI,
+    Divergence,
+    ShadowMismatch,
+    compare_slippage,
+    compare_transfers,
+    run_shadow,
+)
+
+SOLVER = Address("0x149d0f9282333681ee41d30589824b2798e9fb47")
+OTHER = Address("0xde786877a10dbb7eba25a4da65aecf47654f08ab")
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+
+def imbalances() -> ImbalanceTable:
+    """
+    Positive slippage of SOLVER, an internal trade and negative slippage of OTHER
+    (in settlements without AMM interactions, so that buffers may be traded against)
+    """
+
+    def imbalance(tx_hash, solver, token, amount, clearing_value):
+        return Imbalance(
+            tx_hash, 0, str(solver), "name", "", token, amount, clearing_value, None
+        )
+
+    return ImbalanceTable(
+        imbalances=[
+            # 10 USDC more than due: 10 USD = 0.005 ETH
+            imbalance("0x01", SOLVER, USDC, 10 * 10**6, None),
+            # 1990 USDC of a trader for 1 WETH of the buffers (matchability 0.0025)
+            imbalance("0x02", OTHER, USDC, 1990 * 10**6, 1990.0),
+            imbalance("0x02", OTHER, WETH, -(10**18), -2000.0),
+            # 0.01 WETH less than due
+            imbalance("0x03", OTHER, WETH, -(10**16), None),
+        ],
+        end_prices={USDC: (1.0, 6), WETH: (2000.0, 18)},
+        eth_price=2000.0,
+        token_list=[USDC],
+    )
+
+
+def slippages(*amounts: tuple[Address, int]) -> SplitSlippages:
+    result = SplitSlippages()
+    for solver, amount in amounts:
+        result.append(SolverSlippage(solver, "name", amount))
+    return result
+
+
+class TestShadow(unittest.TestCase):
+    def test_compare_slippage(self):
+        reference = slippages((SOLVER, -(10**18)), (OTHER, 5))
+        self.assertEqual(compare_slippage(reference, reference), [])
+        self.assertEqual(
+            compare_slippage(reference, slippages((SOLVER, -(10**18) + 1))),
+            [
+                Divergence(f"{SOLVER}(name)", -(10**18), -(10**18) + 1),
+                Divergence(f"{OTHER}(name)", 5, 0),
+            ],
+        )
+
+    def test_compare_transfers(self):
+        reference = [Transfer(TokenType.NATIVE, None, SOLVER, 1.5)]
+        self.assertEqual(compare_transfers(reference, reference), [])
+        (divergence,) = compare_transfers(
+            reference, [Transfer(TokenType.NATIVE, None, SOLVER, 1.500000001)]
+        )
+        self.assertEqual(divergence.delta_wei, 10**9)
+
+    def test_check_tolerance(self):
+        result = run_shadow(
+            reference=lambda: slippages((SOLVER, 100)),
+            candidate=lambda: slippages((SOLVER, 90)),
+            compare=compare_slippage,
+        )
+        self.assertGreaterEqual(result.reference_seconds, 0)
+        self.assertEqual(result.max_delta_wei(), 10)
+        self.assertIs(result.check(tolerance_wei=10), result.reference)
+        with self.assertRaises(ShadowMismatch):
+            result.check(tolerance_wei=9)
+        # Float rounding of the candidate is accepted by default
+        self.assertIs(result.check(), result.reference)
+        self.assertIn("(-10 wei)", result.report())
+
+    def test_local_recomputation(self):
+        table = imbalances()
+        # Slippage of the fixture as computed by hand (i.e. as the query returns it)
+        expected = slippages((SOLVER, 5 * 10**15), (OTHER, -(10**16)))
+        result = run_shadow(
+            lambda: expected, lambda: local_slippage(table), compare_slippage
+        )
+        # Float valuation of the candidate may differ by a few wei only
+        self.assertLessEqual(result.max_delta_wei(), 10**3)
+        self.assertIs(result.check(), expected)
+
+    def test_local_recomputation_diverges(self):
+        # The reference did not classify the internal trade of OTHER, whose
+        # imbalances (worth 1990 USDC for 1 WETH) are then valued as slippage
+        reference = slippages((SOLVER, 5 * 10**15), (OTHER, -15 * 10**15))
+        result = run_shadow(
+            lambda: reference, lambda: local_slippage(imbalances()), compare_slippage
+        )
+        (divergence,) = result.divergences
+        self.assertEqual(divergence.key, f"{OTHER}(name)")
+        self.assertEqual(divergence.reference_wei, -15 * 10**15)
+        self.assertAlmostEqual(divergence.delta_wei, 5 * 10**15, delta=10**3)
+        self.assertGreater(result.max_delta_wei(), DEFAULT_TOLERANCE_WEI)
+        with self.assertRaises(ShadowMismatch):
+            result.check()
+        self.assertIn(f"{OTHER}(name)", result.report())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import hashlib
+import random
+import unittest
+from dataclasses import astuple
+
+from src.fetch.period_slippage import TxSlippage
+from src.fetch.slippage_preview import breach_risks, estimate_slippage, in_sample
+from src.fetch.transfer_file import TokenType, Transfer
+from src.models import Address
+
+ONE = Address("0x1111111111111111111111111111111111111111")
+TWO = Address("0x2222222222222222222222222222222222222222")
+COW = Address("0xdef1ca1fb7fbcdc777520aa7f396b4e015f497ab")
+
+
+def tx_hash(i: int) -> str:
+    return "0x" + hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def population(size: int) -> list[TxSlippage]:
+    rng = random.Random(42)
+    return [
+        TxSlippage(
+            tx_hash=tx_hash(i),
+            solver_address=ONE if i % 2 else TWO,
+            solver_name="One" if i % 2 else "Two",
+            amount_wei=rng.randint(-(10**16), 10**15) if i % 2 else 10**15,
+        )
+        for i in range(size)
+    ]
+
+
+class TestSlippagePreview(unittest.TestCase):
+    def test_in_sample(self):
+        hashes = [tx_hash(i) for i in range(10000)]
+        sampled = [h for h in hashes if in_sample(h, 0.1)]
+        self.assertAlmostEqual(len(sampled) / len(hashes), 0.1, delta=0.01)
+        # Deterministic, and smaller samples are contained in larger ones
+        self.assertEqual(sampled, [h for h in hashes if in_sample(h, 0.1)])
+        self.assertTrue(set(h for h in hashes if in_sample(h, 0.05)) <= set(sampled))
+        self.assertTrue(all(in_sample(h, 1) for h in hashes))
+
+    def test_in_sample_as_postgres(self):
+        # select ('x' || substr(md5(encode(tx_hash, 'hex')), 1, 8)) :: bit(32) :: bigint
+        # is 283817472 (md5 10eab6008d5642cf42abd2aa41f847cb) for the zero hash
+        zero_hash = "0x" + "00" * 32
+        self.assertTrue(in_sample(zero_hash, 283817473 / 2**32))
+        self.assertFalse(in_sample(zero_hash, 283817472 / 2**32))
+        upper = "0x" + "AB" * 32
+        self.assertEqual(in_sample(upper, 0.16), in_sample(upper.lower(), 0.16))
+        self.assertTrue(in_sample(upper, 0.16))
+        self.assertFalse(in_sample(upper, 0.15))
+
+    def test_full_sample_is_exact(self):
+        txs = population(100)
+        for est in estimate_slippage(txs, 1.0):
+            total = sum(
+                tx.amount_wei for tx in txs if tx.solver_address == est.solver_address
+            )
+            self.assertEqual(
+                (est.lower_wei, est.amount_wei, est.upper_wei), (total, total, total)
+            )
+            self.assertEqual(est.sampled_txs, 50)
+
+    def test_interval_coverage(self):
+        txs = population(1000)
+        totals = {
+            solver: sum(tx.amount_wei for tx in txs if tx.solver_address == solver)
+            for solver in (ONE, TWO)
+        }
+        covered, samples = 0, 100
+        for salt in range(samples):
+            # Different samples (of the same size) by salting the hashes
+            salted = [
+                TxSlippage(tx_hash(i + salt * 10**6), *astuple(tx)[1:])
+                for i, tx in enumerate(txs)
+            ]
+            sample = [tx for tx in salted if in_sample(tx.tx_hash, 0.2)]
+            est = estimate_slippage(sample, 0.2)[0]
+            self.assertEqual(est.solver_address, ONE)
+            self.assertLess(est.upper_wei - est.lower_wei, abs(totals[ONE]))
+            covered += est.lower_wei <= totals[ONE] <= est.upper_wei
+        # 95% confidence intervals
+        self.assertGreaterEqual(covered / samples, 0.9)
+        with self.assertRaises(ValueError):
+            estimate_slippage(txs, 0)
+
+    def test_breach_risks(self):
+        estimates = estimate_slippage(
+            [
+                TxSlippage(tx_hash(1), ONE, "One", -(10**18)),
+                TxSlippage(tx_hash(2), TWO, "Two", -(10**17)),
+            ],
+            0.5,
+        )
+        reimbursements = [
+            Transfer(TokenType.NATIVE, None, ONE, 1.5),
+            Transfer(TokenType.ERC20, COW, ONE, 100.0),
+            Transfer(TokenType.NATIVE, None, TWO, 1.0),
+        ]
+        # One: -2 ETH (point estimate) against 1.5 ETH, Two: interval above -1 ETH
+        risks = breach_risks(estimates, reimbursements)
+        self.assertEqual([risk.estimate.solver_address for risk in risks], [ONE])
+        self.assertTrue(risks[0].likely)
+        self.assertEqual(risks[0].reimbursement_wei, 15 * 10**17)
+
+        # Within the interval, but not the point estimate
+        risks = breach_risks(estimates, [Transfer(TokenType.NATIVE, None, ONE, 2.5)])
+        self.assertFalse(risks[0].likely)
+        # Solvers without reimbursement
+        self.assertEqual(len(breach_risks(estimates, [])), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
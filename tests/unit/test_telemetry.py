@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from duneapi.api import DuneAPI
+from duneapi.types import DuneQuery, Network, QueryParameter
+from duneapi.util import open_query
+
+from src.scheduler import DuneScheduler
+from src.telemetry import Telemetry, print_report, sql_hash
+
+
+def query(name="Slippage Accounting", sql="select 1", value="a") -> DuneQuery:
+    return DuneQuery(
+        name=name,
+        raw_sql=sql,
+        network=Network.MAINNET,
+        parameters=[QueryParameter.text_type("Value", value)],
+        query_id=1,
+    )
+
+
+class LocalScheduler(DuneScheduler):
+    def _execute(self, query):
+        if query.raw_sql == "fail":
+            raise RuntimeError("execution failed")
+        return [{"sql": query.raw_sql}] * 3
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.telemetry = Telemetry(os.path.join(self.tmp_dir.name, "t.sqlite"))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def record(self, sql: str, seconds: float, day: int, name="Slippage Accounting"):
+        self.telemetry.record(
+            query(name, sql),
+            fingerprint=sql,
+            queue_seconds=1.0,
+            execution_seconds=seconds,
+            records=[{}] * 10,
+            recorded_at=datetime(2022, 3, day),
+        )
+
+    def test_variants_and_regressions(self):
+        for day, seconds in [(1, 10.0), (2, 12.0), (8, 11.0)]:
+            self.record("select 1", seconds, day)
+        for day, seconds in [(9, 30.0), (10, 40.0)]:
+            self.record("select 2", seconds, day)
+        self.record("select 3", 1.0, 10, name="Accounting Period Totals")
+
+        slowest, previous, totals = self.telemetry.variants()
+        self.assertEqual((slowest.executions, slowest.median_seconds), (2, 35.0))
+        self.assertEqual((previous.executions, previous.median_seconds), (3, 11.0))
+        self.assertEqual(previous.mean_queue_seconds, 1.0)
+        self.assertEqual(totals.name, "Accounting Period Totals")
+
+        self.assertEqual(self.telemetry.regressions(), [(previous, slowest)])
+        self.assertEqual(self.telemetry.regressions(factor=4), [])
+
+        weeks = [(w.name, w.week, w.executions) for w in self.telemetry.weekly()]
+        self.assertEqual(
+            weeks,
+            [
+                ("Accounting Period Totals", "2022-03-07", 1),
+                ("Slippage Accounting", "2022-02-28", 2),
+                ("Slippage Accounting", "2022-03-07", 3),
+            ],
+        )
+        self.assertEqual(len(self.telemetry.variants(since=datetime(2022, 3, 9))), 2)
+        print_report(self.telemetry, since=None, top=2)
+
+    def test_scheduler_records_executions(self):
+        dune = LocalScheduler("user", "password", telemetry=self.telemetry)
+        dune.fetch(query())
+        with self.assertRaises(RuntimeError):
+            dune.fetch(query(sql="fail"))
+        (variant,) = self.telemetry.variants()
+        self.assertEqual((variant.executions, variant.mean_rows), (1, 3))
+        self.assertGreaterEqual(variant.mean_queue_seconds, 0)
+        with self.telemetry._connect() as conn:
+            ((error, payload),) = conn.execute(
+                "select error, payload_bytes from executions where error is not null"
+            ).fetchall()
+        self.assertIn("execution failed", error)
+        self.assertIsNone(payload)
+
+    def test_execution_and_download_spans(self):
+        now = [0.0]
+
+        def advance(seconds, result=None):
+            def step(*_):
+                now[0] += seconds
+                return result
+
+            return step
+
+        def get_results(dune, query):
+            # Polls until completion, then downloads the results
+            while not dune.query_result_id(query):
+                pass
+            now[0] += 3.0
+            return [{"a": 1}]
+
+        dune = DuneScheduler(
+            "user", "password", clock=lambda: now[0], telemetry=self.telemetry
+        )
+        polls = iter([None, None, "result"])
+        with mock.patch.multiple(
+            DuneAPI,
+            initiate_query=advance(1.0),
+            execute_query=advance(1.0),
+            query_result_id=lambda *_: advance(5.0, next(polls))(),
+            get_results=get_results,
+        ):
+            self.assertEqual(dune.fetch(query()), [{"a": 1}])
+        with self.telemetry._connect() as conn:
+            spans = conn.execute(
+                "select queue_seconds, execution_seconds, results_seconds"
+                " from executions"
+            ).fetchall()
+        self.assertEqual(spans, [(0.0, 17.0, 3.0)])
+        (variant,) = self.telemetry.variants()
+        self.assertEqual(variant.mean_results_seconds, 3.0)
+
+    def test_migrates_previous_schema(self):
+        path = os.path.join(self.tmp_dir.name, "previous.sqlite")
+        with sqlite3.connect(path) as conn:
+            conn.executescript(
+                "create table executions (recorded_at text not null, name text not null,"
+                " network text not null, fingerprint text not null, sql_hash text not"
+                " null, parameters text not null, queue_seconds real not null,"
+                " execution_seconds real not null, num_rows integer, payload_bytes"
+                " integer, error text);"
+                "insert into executions values"
+                " ('2022-03-01T00:00:00', 'Old', 'mainnet', 'f', 'h', '[]', 1, 2, 3, 4,"
+                " null);"
+            )
+        conn.close()
+        telemetry = Telemetry(path)
+        telemetry.record(query(), "f", 1.0, 2.0, records=[], results_seconds=1.0)
+        self.assertEqual(
+            sorted((v.name, v.mean_results_seconds) for v in telemetry.variants()),
+            [("Old", 0.0), ("Slippage Accounting", 1.0)],
+        )
+
+    def test_variants_of_templates(self):
+        dune = LocalScheduler("user", "password", telemetry=self.telemetry)
+        # Renderings with different token lists (or registries) are the same variant
+        dune.fetch(query(sql="with allowed_tokens as (1) select 1"))
+        dune.fetch(query(sql="with allowed_tokens as (1, 2) select 1"))
+        # Queries without template files are identified by their SQL
+        dune.fetch(query(name="Ad hoc", sql="select 1"))
+        dune.fetch(query(name="Ad hoc", sql="select 2"))
+        variants = self.telemetry.variants()
+        self.assertEqual(
+            sorted((v.name, v.executions) for v in variants),
+            [("Ad hoc", 1), ("Ad hoc", 1), ("Slippage Accounting", 2)],
+        )
+        (slippage,) = [v for v in variants if v.name == "Slippage Accounting"]
+        self.assertEqual(
+            slippage.sql_hash, sql_hash(open_query("./queries/period_slippage.sql"))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,16 @@
+import re
 import unittest
 
-from src.fetch.period_slippage import allowed_token_list_query, prepend_to_sub_query
+from duneapi.types import Network
+
+from src.fetch.period_slippage import (
+    allowed_token_list_query,
+    prepend_to_sub_query,
+    slippage_query,
+)
+from src.registry import Registry
+
+TOKENS = ["0xde1c59bc25d806ad9ddcbe246c4b5e5505645718"]
 
 
 class TestQueryBuilding(unittest.TestCase):
@@ -27,6 +37,52 @@ class TestQueryBuilding(unittest.TestCase):
             result_query,
         )
 
+    def test_native_token_price_per_network(self):
+        layer1_eth_price = """native_token_price as (
+    select price
+    from prices."layer1_usd_eth"
+    where minute = '{{EndTime}}'
+)"""
+        wrapped_native_price = """native_token_price as (
+    select price
+    from end_prices
+    where contract_address = '{{WrappedNativeToken}}'
+)"""
+        registry = Registry("unused")
+        mainnet = slippage_query(token_list=TOKENS, registry=registry)
+        # Mainnet slippage is converted with the layer 1 ETH price at the period end
+        self.assertIn(layer1_eth_price, mainnet)
+        self.assertNotIn(wrapped_native_price, mainnet)
+        self.assertTrue(
+            mainnet.endswith(
+                layer1_eth_price
+                + "\nselect *, \n        usd_value / (select price from "
+                "native_token_price) * 10 ^ 18 as eth_slippage_wei \n    from results"
+            )
+        )
+        gchain = slippage_query(
+            token_list=TOKENS, registry=registry, network=Network.GCHAIN
+        )
+        self.assertIn(wrapped_native_price, gchain)
+        self.assertNotIn("layer1_usd_eth", gchain)
+
+    def test_sample_rate_filters_settlements_only(self):
+        def ctes(sample_rate: float) -> dict[str, str]:
+            query = slippage_query(token_list=TOKENS, registry=Registry("unused"))
+            rendered = query.replace("{{SampleRate}}", str(sample_rate))
+            parts = re.split(r"^(\w+) as \(", rendered, flags=re.M)
+            return dict(zip(parts[1::2], parts[2::2]))
+
+        full, sampled = ctes(1.0), ctes(0.1)
+        self.assertEqual(full.keys(), sampled.keys())
+        self.assertIn("filtered_trades", full)
+        # The traders of all settlements are excluded from other_transfers, so the
+        # settlements are sampled when selecting their transfers, not their trades.
+        self.assertEqual(
+            {name for name in full if full[name] != sampled[name]},
+            {"user_in", "user_out", "other_transfers"},
+        )
+
 
 if __name__ == "__main__":
     unittest.main()